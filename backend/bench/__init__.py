@@ -0,0 +1 @@
+# Offline load-testing harness: the real app against stubbed Gemini and Maps upstreams
@@ -0,0 +1,153 @@
+"""
+Benchmark response compression: CPU cost against bytes saved.
+
+Compresses real response bodies (a 30-day itinerary, 50 hotels, the
+/destinations/ catalog) with every available coding at a range of levels,
+using the same encoders as CompressionMiddleware. For each, it reports the
+compressed size, the CPU time per response, and the transfer time saved on
+a slow mobile link after paying that CPU. brotli and zstd are included when
+their packages are installed.
+
+    python -m bench.compression
+    python -m bench.compression --link-mbps 1.5 --chunk-size 1024 --output compression.json
+
+--chunk-size simulates a streamed response (Server-Sent Events), flushing
+after every chunk as the middleware does, to show what streaming costs in
+ratio.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bench import payloads
+from middleware.compression import BrotliEncoder, Encoder, GzipEncoder, ZstdEncoder, brotli, zstandard
+
+LEVELS = {
+    "gzip": (1, 4, 6, 9),
+    "br": (1, 4, 6, 9, 11),
+    "zstd": (1, 3, 6, 12, 19)
+}
+
+
+def encoder_factories() -> Dict[str, Callable[[int], Encoder]]:
+    factories: Dict[str, Callable[[int], Encoder]] = {"gzip": GzipEncoder}
+    if brotli is not None:
+        factories["br"] = BrotliEncoder
+    if zstandard is not None:
+        factories["zstd"] = ZstdEncoder
+    return factories
+
+
+def response_bodies() -> Dict[str, bytes]:
+    """The bodies the API actually sends, rendered the way the routes render them"""
+    from models import DestinationList, GeneratedItineraryResponse
+    from responses import ModelResponse, dumps
+    from services.catalog import load_catalog
+    from routers.hotels import Hotel, to_frontend_hotel
+
+    destination = "Lisbon, Portugal"
+    itinerary = GeneratedItineraryResponse.model_validate(payloads.itinerary_response(30, destination))
+    hotels = [to_frontend_hotel(Hotel(**hotel), destination) for hotel in payloads.hotel_dicts(50, destination)]
+    destinations = load_catalog().all()
+    catalog = DestinationList(destinations=destinations, total=len(destinations), limit=50)
+    return {
+        "itinerary_30_days": ModelResponse(itinerary).body,
+        "hotels_50": dumps({"success": True, "data": hotels, "destination": destination, "total_hotels": len(hotels)}),
+        "destinations_catalog": ModelResponse(catalog).body
+    }
+
+
+def compress(factory: Callable[[int], Encoder], level: int, body: bytes, chunk_size: Optional[int]) -> bytes:
+    encoder = factory(level)
+    if not chunk_size:
+        return encoder.compress(body) + encoder.finish()
+    parts = []
+    for start in range(0, len(body), chunk_size):
+        parts.append(encoder.compress(body[start:start + chunk_size]) + encoder.flush())
+    parts.append(encoder.finish())
+    return b"".join(parts)
+
+
+def time_compression(fn: Callable[[], bytes], min_time: float) -> Tuple[float, bytes]:
+    """Best seconds per call over three timed runs of at least min_time each, and the output"""
+    output = fn()
+    number, best = 1, float("inf")
+    for _ in range(3):
+        while True:
+            start = time.process_time()
+            for _ in range(number):
+                fn()
+            elapsed = time.process_time() - start
+            if elapsed >= min_time:
+                break
+            number *= 2
+        best = min(best, elapsed / number)
+    return best, output
+
+
+def run(bodies: Dict[str, bytes], link_mbps: float, chunk_size: Optional[int], min_time: float) -> List[Dict[str, Any]]:
+    results = []
+    link_bytes_per_second = link_mbps * 1e6 / 8
+    for name, body in bodies.items():
+        for coding, factory in encoder_factories().items():
+            for level in LEVELS[coding]:
+                seconds, output = time_compression(lambda: compress(factory, level, body, chunk_size), min_time)
+                transfer_saved = (len(body) - len(output)) / link_bytes_per_second
+                results.append({
+                    "body": name,
+                    "coding": coding,
+                    "level": level,
+                    "original_bytes": len(body),
+                    "compressed_bytes": len(output),
+                    "ratio": round(len(body) / len(output), 2),
+                    "cpu_ms": round(seconds * 1000, 3),
+                    "mb_per_cpu_second": round(len(body) / seconds / 1e6, 1),
+                    # What a user on the link gains: transfer time saved minus the time spent compressing
+                    "net_saving_ms": round((transfer_saved - seconds) * 1000, 1)
+                })
+    return results
+
+
+def format_report(results: List[Dict[str, Any]], link_mbps: float) -> str:
+    lines = [
+        f"{'body':<22}{'coding':<7}{'level':>6}{'bytes':>10}{'ratio':>8}{'cpu ms':>9}{'MB/s':>8}"
+        f"{'saved ms @' + format(link_mbps, 'g') + ' Mbps':>22}"
+    ]
+    previous = None
+    for result in results:
+        if previous is not None and result["body"] != previous:
+            lines.append("")
+        previous = result["body"]
+        lines.append(
+            f"{result['body']:<22}{result['coding']:<7}{result['level']:>6}{result['compressed_bytes']:>10}"
+            f"{result['ratio']:>8.2f}{result['cpu_ms']:>9.3f}{result['mb_per_cpu_second']:>8.1f}{result['net_saving_ms']:>22.1f}"
+        )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark compression CPU against bytes saved on API responses")
+    parser.add_argument("--link-mbps", type=float, default=1.5, help="client link speed for the net saving column")
+    parser.add_argument("--chunk-size", type=int, default=0, help="flush every this many bytes, like a streamed response")
+    parser.add_argument("--min-time", type=float, default=0.1, help="CPU seconds each timed run lasts at least")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    bodies = response_bodies()
+    results = run(bodies, args.link_mbps, args.chunk_size or None, args.min_time)
+    print(format_report(results, args.link_mbps))
+    missing = [coding for coding in LEVELS if coding not in encoder_factories()]
+    if missing:
+        print(f"\nNot measured ({', '.join(missing)}): install brotli / zstandard to include them")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"link_mbps": args.link_mbps, "chunk_size": args.chunk_size or None, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
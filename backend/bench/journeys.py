@@ -0,0 +1,155 @@
+"""
+Scripted user journeys for the load test.
+
+Each journey is a function taking a BenchClient and a random.Random and
+walking through the requests one visitor would make. Every request is
+recorded under a route-template label, so results group by endpoint rather
+than by session or place id.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import requests
+
+DESTINATIONS = [
+    "Paris, France", "Tokyo, Japan", "Santorini, Greece", "Bali, Indonesia",
+    "New York, USA", "Lisbon, Portugal", "Kyoto, Japan", "Reykjavik, Iceland",
+    "Cape Town, South Africa", "Barcelona, Spain", "Hanoi, Vietnam", "Rome, Italy"
+]
+CATALOG_IDS = ["paris-france", "tokyo-japan", "santorini-greece", "bali-indonesia", "new-york-usa"]
+INTERESTS = ["sightseeing", "food", "culture", "adventure", "nature", "nightlife", "shopping", "history"]
+
+
+class Sample(NamedTuple):
+    label: str
+    status: int
+    seconds: float
+    # Process CPU time during the request; only meaningful when requests run one at a time
+    cpu_seconds: float = 0.0
+
+
+class Recorder:
+    """Thread-safe collection of request samples"""
+
+    def __init__(self):
+        self._samples: List[Sample] = []
+        self._lock = threading.Lock()
+
+    def add(self, sample: Sample) -> None:
+        with self._lock:
+            self._samples.append(sample)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return list(self._samples)
+
+
+class BenchClient:
+    """A requests session against the app that records every call it makes"""
+
+    def __init__(
+        self,
+        base_url: str,
+        recorder: Recorder,
+        think_seconds: float = 0.0,
+        timeout: float = 120,
+        measure_cpu: bool = False
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.think_seconds = think_seconds
+        self.timeout = timeout
+        self.measure_cpu = measure_cpu
+        self.session = requests.Session()
+
+    def call(self, label: str, method: str, path: str, **kwargs: Any) -> Optional[requests.Response]:
+        """Make one request; status 0 is recorded when it fails without a response"""
+        cpu_start = time.process_time() if self.measure_cpu else 0.0
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start if self.measure_cpu else 0.0
+        self.recorder.add(Sample(label, status, elapsed, cpu))
+        return response
+
+    def think(self, rng: random.Random) -> None:
+        """Pause like a user reading the page, averaging think_seconds"""
+        if self.think_seconds > 0:
+            time.sleep(rng.uniform(0, 2 * self.think_seconds))
+
+
+def random_trip(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "source": rng.choice(DESTINATIONS),
+        "destination": rng.choice(DESTINATIONS),
+        "budget": rng.choice(["budget", "mid-range", "luxury"]),
+        "duration_days": rng.randint(2, 7),
+        "interests": rng.sample(INTERESTS, 3),
+        "travel_style": rng.choice(["relaxed", "moderate", "packed"]),
+        "travelers": rng.choice(["solo", "couple", "family", "group"])
+    }
+
+
+def planning_journey(client: BenchClient, rng: random.Random) -> None:
+    """The six-step planning wizard, ending in itinerary generation"""
+    trip = random_trip(rng)
+    response = client.call("POST /planning/session/start", "POST", "/planning/session/start")
+    if response is None or response.status_code != 200:
+        return
+    session_id = response.json()["session_id"]
+    steps = {
+        1: {"source": trip["source"], "duration": trip["duration_days"], "travelers": trip["travelers"]},
+        2: {"name": trip["destination"]},
+        3: {"budget": trip["budget"], "style": trip["travel_style"]},
+        4: {"type": "hotel"},
+        5: {"interests": trip["interests"]},
+        6: {}
+    }
+    for step, data in steps.items():
+        client.think(rng)
+        client.call(
+            "PUT /planning/session/{id}/step/{step}", "PUT",
+            f"/planning/session/{session_id}/step/{step}", json=data
+        )
+    client.call("POST /planning/session/{id}/generate", "POST", f"/planning/session/{session_id}/generate")
+
+
+def itinerary_journey(client: BenchClient, rng: random.Random) -> None:
+    """A one-shot itinerary from the quick planner"""
+    client.call("POST /itinerary/generate", "POST", "/itinerary/generate", json=random_trip(rng))
+
+
+def hotels_journey(client: BenchClient, rng: random.Random) -> None:
+    """Hotel recommendations for a trip"""
+    trip = random_trip(rng)
+    client.call("GET /hotels/recommendations", "GET", "/hotels/recommendations", params={
+        "destination": trip["destination"],
+        "budget": rng.choice(["budget", "medium", "luxury"]),
+        "guests": rng.randint(1, 4),
+        "duration": trip["duration_days"]
+    })
+
+
+def destinations_journey(client: BenchClient, rng: random.Random) -> None:
+    """Browsing the catalog, opening one destination and its nearby attractions"""
+    client.call("GET /destinations/", "GET", "/destinations/")
+    client.call("GET /destinations/popular", "GET", "/destinations/popular")
+    client.think(rng)
+    client.call("GET /destinations/{id}", "GET", f"/destinations/{rng.choice(CATALOG_IDS)}")
+    client.think(rng)
+    client.call("GET /destinations/search/nearby", "GET", "/destinations/search/nearby", params={
+        "location": rng.choice(DESTINATIONS)
+    })
+
+
+JOURNEYS: Dict[str, Callable[[BenchClient, random.Random], None]] = {
+    "planning": planning_journey,
+    "itinerary": itinerary_journey,
+    "hotels": hotels_journey,
+    "destinations": destinations_journey
+}
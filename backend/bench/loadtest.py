@@ -0,0 +1,258 @@
+"""
+Load-test the real app against stubbed Gemini and Maps upstreams.
+
+Boots main.app with uvicorn on a local port, pointed at the stubs from
+bench.upstreams, and starts user journeys from bench.journeys at a target
+rate for a fixed duration. Arrivals are open-loop (Poisson): when the app
+slows down new journeys keep arriving, as real users would, and journeys
+that would exceed --concurrency are counted as dropped instead of silently
+lowering the offered load.
+
+Reports p50/p95/p99 latency, error counts and throughput per endpoint, and
+the calls each upstream endpoint received. Run from the backend directory:
+
+    python -m bench.loadtest --rps 4 --duration 60 \\
+        --mix planning=1,itinerary=2,hotels=1,destinations=3 \\
+        --gemini-latency lognormal:2.5,0.5 --gemini-throttle-rate 0.05 \\
+        --gemini-truncate-rate 0.02 --output results.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from bench.journeys import JOURNEYS, BenchClient, Recorder, Sample
+from bench.upstreams import DEFAULT_GEMINI_LATENCY, DEFAULT_MAPS_LATENCY, StubUpstreams, UpstreamProfile
+
+logger = logging.getLogger(__name__)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """"planning=1,itinerary=2" -> journey weights"""
+    mix = {}
+    for item in filter(None, spec.split(",")):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise ValueError(f"Unknown journey '{name}', expected one of {sorted(JOURNEYS)}")
+        mix[name] = float(weight or 1)
+    if not mix:
+        raise ValueError("The journey mix is empty")
+    return mix
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """main.app served by uvicorn on a background thread"""
+
+    def __init__(self, port: int):
+        import uvicorn
+        import main
+        self.url = f"http://127.0.0.1:{port}"
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="bench-app", daemon=True)
+
+    def __enter__(self) -> "AppServer":
+        self.thread.start()
+        deadline = time.monotonic() + 60
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The app did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+class LoadResult:
+    def __init__(self, samples: List[Sample], elapsed: float, started: int, dropped: int, failed: int):
+        self.samples = samples
+        self.elapsed = elapsed
+        self.journeys_started = started
+        self.journeys_dropped = dropped
+        self.journeys_failed = failed
+
+    def endpoints(self) -> Dict[str, Dict[str, Any]]:
+        grouped: Dict[str, List[Sample]] = defaultdict(list)
+        for sample in self.samples:
+            grouped[sample.label].append(sample)
+        summary = {}
+        for label, samples in sorted(grouped.items()):
+            latencies = sorted(sample.seconds * 1000 for sample in samples)
+            statuses: Dict[str, int] = defaultdict(int)
+            for sample in samples:
+                statuses[str(sample.status)] += 1
+            summary[label] = {
+                "count": len(samples),
+                "errors": sum(1 for sample in samples if not 200 <= sample.status < 300),
+                "statuses": dict(statuses),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "max_ms": round(latencies[-1], 1),
+                "throughput_rps": round(len(samples) / self.elapsed, 2) if self.elapsed else 0.0
+            }
+        return summary
+
+
+def run_load(
+    base_url: str,
+    mix: Dict[str, float],
+    rps: float,
+    duration: float,
+    concurrency: int,
+    think_seconds: float,
+    seed: Optional[int] = None
+) -> LoadResult:
+    """Start journeys at rps for duration seconds, then wait for them to finish"""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    recorder = Recorder()
+    slots = threading.BoundedSemaphore(concurrency)
+    local = threading.local()
+    counters = {"started": 0, "dropped": 0, "failed": 0}
+    counters_lock = threading.Lock()
+
+    def run_journey(name: str, journey_seed: int) -> None:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = BenchClient(base_url, recorder, think_seconds)
+        try:
+            JOURNEYS[name](client, random.Random(journey_seed))
+        except Exception as e:
+            logger.warning(f"{name} journey failed: {e}")
+            with counters_lock:
+                counters["failed"] += 1
+        finally:
+            slots.release()
+
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-user") as executor:
+        while True:
+            next_arrival += rng.expovariate(rps)
+            if next_arrival - start >= duration:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            name = rng.choices(names, weights)[0]
+            if not slots.acquire(blocking=False):
+                counters["dropped"] += 1
+                continue
+            counters["started"] += 1
+            executor.submit(run_journey, name, rng.getrandbits(32))
+    elapsed = time.perf_counter() - start
+    return LoadResult(recorder.samples(), elapsed, counters["started"], counters["dropped"], counters["failed"])
+
+
+def format_report(result: LoadResult, upstream_counts: Dict[str, Dict[str, Dict[str, int]]]) -> str:
+    lines = [
+        f"{result.journeys_started} journeys in {result.elapsed:.1f}s "
+        f"({result.journeys_dropped} dropped at the concurrency limit, {result.journeys_failed} failed)",
+        "",
+        f"{'endpoint':<42}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>8}"
+    ]
+    for label, stats in result.endpoints().items():
+        lines.append(
+            f"{label:<42}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['throughput_rps']:>8.2f}"
+        )
+    lines += ["", f"{'upstream call':<42}{'total':>7}{'ok':>8}{'error':>8}{'429':>8}{'trunc':>8}"]
+    for upstream, endpoints in upstream_counts.items():
+        for endpoint, outcomes in sorted(endpoints.items()):
+            lines.append(
+                f"{upstream + '.' + endpoint:<42}{sum(outcomes.values()):>7}{outcomes.get('ok', 0):>8}"
+                f"{outcomes.get('error', 0):>8}{outcomes.get('throttled', 0):>8}{outcomes.get('truncated', 0):>8}"
+            )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load-test the app against stubbed Gemini and Maps upstreams")
+    parser.add_argument("--rps", type=float, default=2.0, help="journeys started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting journeys")
+    parser.add_argument("--mix", default="planning=1,itinerary=1,hotels=1,destinations=2", help="journey weights")
+    parser.add_argument("--concurrency", type=int, default=200, help="most journeys in flight at once")
+    parser.add_argument("--think-seconds", type=float, default=0.5, help="mean pause between steps of a journey")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--keep-rate-limit", action="store_true", help="leave per-caller rate limits on (all load comes from one IP)")
+    parser.add_argument("--verbose", action="store_true", help="show the app's info logs")
+    for upstream, latency in (("gemini", DEFAULT_GEMINI_LATENCY), ("maps", DEFAULT_MAPS_LATENCY)):
+        parser.add_argument(f"--{upstream}-latency", default=latency, help="constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+        parser.add_argument(f"--{upstream}-error-rate", type=float, default=0.0, help="share of calls answered with a 5xx")
+        parser.add_argument(f"--{upstream}-throttle-rate", type=float, default=0.0, help="share of calls throttled")
+    parser.add_argument("--gemini-truncate-rate", type=float, default=0.0, help="share of responses cut off mid-JSON")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    mix = parse_mix(args.mix)
+    gemini = UpstreamProfile(args.gemini_latency, args.gemini_error_rate, args.gemini_throttle_rate, args.gemini_truncate_rate)
+    maps = UpstreamProfile(args.maps_latency, args.maps_error_rate, args.maps_throttle_rate)
+
+    with StubUpstreams(gemini, maps, seed=args.seed) as stubs:
+        # Must be in place before main is imported and its lifespan builds the services
+        os.environ.update(stubs.env())
+        if not args.keep_rate_limit:
+            os.environ["RATE_LIMIT"] = "false"
+        with AppServer(free_port()) as app:
+            # The lifespan's warm-up and health checks are not part of the load
+            stubs.reset()
+            result = run_load(app.url, mix, args.rps, args.duration, args.concurrency, args.think_seconds, args.seed)
+            upstream_counts = stubs.counts()
+
+    print(format_report(result, upstream_counts))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": {
+                    "rps": args.rps,
+                    "duration": args.duration,
+                    "mix": mix,
+                    "concurrency": args.concurrency,
+                    "think_seconds": args.think_seconds,
+                    "seed": args.seed,
+                    "gemini": gemini.describe(),
+                    "maps": maps.describe()
+                },
+                "elapsed_seconds": round(result.elapsed, 3),
+                "journeys": {
+                    "started": result.journeys_started,
+                    "dropped": result.journeys_dropped,
+                    "failed": result.journeys_failed
+                },
+                "endpoints": result.endpoints(),
+                "upstream_calls": upstream_counts
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
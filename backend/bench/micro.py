@@ -0,0 +1,287 @@
+"""
+Micro-benchmarks for the CPU work the backend does on every request.
+
+Each case runs one hot path on a payload from bench.payloads, in-process
+and without any upstream calls, and reports operations per second (best
+of several timed repeats) and the memory one operation allocates at its
+peak, measured separately under tracemalloc so tracing does not skew the
+timings. Sizes span a short trip to the largest the app accepts, so
+per-item costs show up as the payload grows. Destination catalog cases
+search and score 1k-100k generated destinations; they are built on first
+use, so filtering them out skips the build.
+
+    python -m bench.micro
+    python -m bench.micro --filter hotel --min-time 0.5 --history micro_history.jsonl
+
+Run from the backend directory. --history appends one JSON line per run,
+tagged with the commit, to track the numbers over time.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from bench import payloads
+from bench.runner import current_commit
+
+ITINERARY_DAYS = (1, 7, 30)
+HOTEL_COUNTS = (8, 20, 50)
+REVIEW_COUNTS = (5, 50, 500)
+ROUTE_STEP_COUNTS = (10, 100)
+CATALOG_SIZES = (1_000, 10_000, 100_000)
+
+
+class Case(NamedTuple):
+    name: str
+    # The payload size, e.g. "days=7"
+    size: str
+    fn: Callable[[], Any]
+
+
+def _copy_items(itinerary: Dict[str, Any]) -> Dict[str, Any]:
+    return {"days": [{**day, "items": [dict(item) for item in day["items"]]} for day in itinerary["days"]]}
+
+
+@lru_cache(maxsize=None)
+def _catalog(count: int):
+    from services.catalog import DestinationCatalog
+    return DestinationCatalog(payloads.destination_records(count))
+
+
+def _catalog_queries(count: int) -> Dict[str, Dict[str, Any]]:
+    """Searches from narrow to broad: one place name, a one-letter prefix, a tag, a misspelling, two tag filters"""
+    records = payloads.destination_records(min(count, 100))
+    name = records[0]["name"].split(",")[0].lower()
+    return {
+        "name": {"query": name},
+        "prefix": {"query": name[0]},
+        "tag": {"query": "beach"},
+        "fuzzy": {"query": name[:-2] + name[-1]},
+        "filters": {"tags": ["Beach", "Food"], "country": records[0]["country"]},
+        "two_tags": {"tags": ["Beach", "Food"]}
+    }
+
+
+@lru_cache(maxsize=None)
+def _suggestion_engine(count: int):
+    from services.suggestions import SuggestionEngine
+    return SuggestionEngine(_catalog(count))
+
+
+@lru_cache(maxsize=None)
+def _similar_trips():
+    """A full partition of trips to one destination, one interest apart from the query"""
+    from models import TripRequest
+    from services.similarity import MAX_TRIPS_PER_PARTITION, SimilarTripIndex
+    index = SimilarTripIndex()
+    trip = payloads.trip_request()
+    for number in range(MAX_TRIPS_PER_PARTITION):
+        cached = TripRequest(**{**trip, "interests": trip["interests"] + [f"interest {number}"]})
+        index.add(cached, "catalog:lisbon-portugal", f"trip-{number}")
+    return index, TripRequest(**trip)
+
+
+def _cold_search(count: int, search: Dict[str, Any]) -> Any:
+    catalog = _catalog(count)
+    # Without the result cache, every call runs the index lookups and facet counts
+    catalog._results.clear()
+    return catalog.search(**search)
+
+
+def _run_coroutine(coroutine) -> Any:
+    """Drive a coroutine that never actually suspends, without an event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("The coroutine suspended")
+
+
+def build_cases() -> List[Case]:
+    # Imported here so --help does not pay for FastAPI, pydantic and the SDKs
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from models import GeneratedItineraryResponse, ItineraryDay, ReviewSummary, TripRequest
+    from responses import FastJSONResponse, ModelResponse
+    from routers.hotels import Hotel, to_frontend_hotel
+    from services.gemini_service import extract_json_block, fix_item_locations
+    from services.maps_service import MapsService
+
+    dict_field = create_response_field(name="Response_generate_itinerary", type_=dict)
+    maps_service = MapsService()
+    # get_photo_url returns "" without a key, which would skip the string building
+    maps_service.api_key = "bench"
+    destination = "Lisbon, Portugal"
+    cases = []
+
+    legacy = payloads.legacy_trip_request()
+    current = payloads.trip_request()
+    cases.append(Case("trip_request.legacy_fields", "1", lambda: TripRequest(**dict(legacy))))
+    cases.append(Case("trip_request.current_fields", "1", lambda: TripRequest(**dict(current))))
+
+    for days in ITINERARY_DAYS:
+        text = payloads.itinerary_text(days, destination)
+        cases.append(Case("gemini.extract_json", f"days={days}", lambda text=text: json.loads(extract_json_block(text))))
+
+        itinerary = payloads.itinerary(days, destination)
+        # The fix mutates in place, so each run gets fresh items; copy_only is the cost to subtract
+        cases.append(Case("gemini.fix_item_locations", f"days={days}", lambda itinerary=itinerary: fix_item_locations(_copy_items(itinerary), destination)))
+        cases.append(Case("gemini.fix_item_locations.copy_only", f"days={days}", lambda itinerary=itinerary: _copy_items(itinerary)))
+
+        cases.append(Case("validate.itinerary_days", f"days={days}", lambda itinerary=itinerary: [ItineraryDay(**day) for day in itinerary["days"]]))
+
+        # Response body bytes for /itinerary/generate: FastAPI's response_model=dict path, then the typed one
+        content = payloads.itinerary_response(days, destination)
+        cases.append(Case("serialize.itinerary.fastapi_dict", f"days={days}", lambda content=content: JSONResponse(
+            _run_coroutine(serialize_response(field=dict_field, response_content=content, is_coroutine=True))
+        ).body))
+        cases.append(Case("serialize.itinerary.typed_model", f"days={days}", lambda content=content: ModelResponse(
+            GeneratedItineraryResponse.model_validate(content)
+        ).body))
+
+    for count in HOTEL_COUNTS:
+        raw_hotels = payloads.hotel_dicts(count, destination)
+        hotels = [Hotel(**hotel) for hotel in raw_hotels]
+        cases.append(Case("validate.hotels", f"hotels={count}", lambda raw_hotels=raw_hotels: [Hotel(**hotel) for hotel in raw_hotels]))
+        cases.append(Case("hotels.to_frontend_hotel", f"hotels={count}", lambda hotels=hotels: [to_frontend_hotel(hotel, destination) for hotel in hotels]))
+
+        body = {"success": True, "data": [to_frontend_hotel(hotel, destination) for hotel in hotels], "destination": destination}
+        cases.append(Case("serialize.hotels.jsonable_encoder", f"hotels={count}", lambda body=body: JSONResponse(jsonable_encoder(body)).body))
+        cases.append(Case("serialize.hotels.fast_json", f"hotels={count}", lambda body=body: FastJSONResponse(body).body))
+
+    for count in REVIEW_COUNTS:
+        reviews = payloads.place_reviews(count)
+        photos = payloads.place_photos(count)
+        cases.append(Case("maps.format_reviews", f"reviews={count}", lambda reviews=reviews: maps_service._format_reviews(reviews)))
+        cases.append(Case("maps.format_photos", f"photos={count}", lambda photos=photos: maps_service._format_photos(photos)))
+
+    for count in ROUTE_STEP_COUNTS:
+        steps = payloads.route_steps(count)
+        cases.append(Case("maps.format_route_steps", f"steps={count}", lambda steps=steps: maps_service._format_route_steps(steps)))
+
+    summary = {
+        "pros": ["Central location", "Friendly staff", "Great breakfast"],
+        "cons": ["Small rooms", "Street noise"],
+        "overall_sentiment": "positive",
+        "rating_breakdown": {"location": 4.8, "service": 4.5, "value": 4.1, "cleanliness": 4.4}
+    }
+    cases.append(Case("validate.review_summary", "1", lambda: ReviewSummary(**summary)))
+
+    cases.append(Case("similarity.find", "trips=32", lambda: _similar_trips()[0].find(_similar_trips()[1], "catalog:lisbon-portugal")))
+
+    for count in CATALOG_SIZES:
+        size = f"n={count}"
+        for kind, search in _catalog_queries(count).items():
+            cases.append(Case(f"catalog.search.{kind}", size, lambda count=count, search=search: _cold_search(count, search)))
+        cases.append(Case("catalog.search.cached", size, lambda count=count: _catalog(count).search("beach", offset=20)))
+        cases.append(Case("catalog.popular", size, lambda count=count: _catalog(count).popular(20)))
+        cases.append(Case(
+            "suggestions.suggest", size,
+            lambda count=count: _suggestion_engine(count).suggest(["food", "history", "nightlife"], "mid-range", 5, month=5)
+        ))
+    return cases
+
+
+def time_case(fn: Callable[[], Any], min_time: float, repeats: int) -> float:
+    """Best ops/sec over repeats, each timing enough calls to last at least min_time"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        # Aim a little past min_time rather than doubling blindly on fast cases
+        number = max(number * 2, int(number * min_time * 1.2 / max(elapsed, 1e-9)))
+    best = elapsed
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+
+def measure_allocations(fn: Callable[[], Any]) -> Dict[str, float]:
+    """Peak memory allocated during one call, and what it still holds on return"""
+    fn()  # Caches and lazily built validators should not count
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"peak_kib": round((peak - baseline) / 1024, 2), "retained_kib": round((current - baseline) / 1024, 2)}
+
+
+def run_cases(cases: List[Case], min_time: float, repeats: int) -> List[Dict[str, Any]]:
+    results = []
+    for case in cases:
+        case.fn()  # Lazily built fixtures should not count
+        ops_per_sec = time_case(case.fn, min_time, repeats)
+        results.append({
+            "name": case.name,
+            "size": case.size,
+            "ops_per_sec": round(ops_per_sec, 1),
+            "us_per_op": round(1e6 / ops_per_sec, 2),
+            **measure_allocations(case.fn)
+        })
+    return results
+
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    lines = [f"{'case':<40}{'size':<14}{'ops/sec':>12}{'us/op':>11}{'peak KiB':>11}{'kept KiB':>11}"]
+    for result in results:
+        lines.append(
+            f"{result['name']:<40}{result['size']:<14}{result['ops_per_sec']:>12,.0f}{result['us_per_op']:>11.2f}"
+            f"{result['peak_kib']:>11.2f}{result['retained_kib']:>11.2f}"
+        )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Micro-benchmark the backend's CPU hot paths")
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds each timed repeat runs for")
+    parser.add_argument("--repeats", type=int, default=5, help="timed repeats per case; the best is reported")
+    parser.add_argument("--history", help="append the result to this JSONL file")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    cases = [case for case in build_cases() if args.filter in case.name]
+    if not cases:
+        print(f"No case matches '{args.filter}'")
+        return 1
+
+    result = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "cases": run_cases(cases, args.min_time, args.repeats)
+    }
+    print(format_report(result["cases"]))
+
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Realistic payloads for the micro-benchmarks.
+
+Shapes follow what Gemini and the Maps APIs actually return to the
+backend, at sizes from a short trip to the largest the app accepts: 1-30
+day itineraries, 8-50 hotels and 5-500 reviews. Destination catalogs go up
+to 100k entries, with made-up but pronounceable place names.
+"""
+import json
+import random
+from typing import Any, Dict, List
+
+ACTIVITIES = [
+    ("activity", "map-pin", "Walking tour of the old town"),
+    ("food", "utensils", "Breakfast at a neighbourhood cafe"),
+    ("activity", "camera", "Guided museum visit"),
+    ("transport", "car", "Transfer by metro"),
+    ("food", "utensils", "Dinner at a family-run restaurant"),
+    ("activity", "sun", "Sunset viewpoint")
+]
+
+
+def itinerary(days: int, destination: str = "Lisbon, Portugal", seed: int = 0) -> Dict[str, Any]:
+    """A parsed Gemini itinerary; about one location in five is cut off with a trailing space"""
+    rng = random.Random(seed)
+    result_days = []
+    for day in range(1, days + 1):
+        items = []
+        for index in range(rng.randint(4, 6)):
+            item_type, icon, title = ACTIVITIES[(day + index) % len(ACTIVITIES)]
+            location = f"{title.split(' of ')[-1].title()} in {destination}"
+            if rng.random() < 0.2:
+                location = "Downtown "
+            items.append({
+                "time": f"{8 + 2 * index}:00 {'AM' if 8 + 2 * index < 12 else 'PM'}",
+                "title": title,
+                "description": f"{title} in {destination}, picked for the traveller's interests. " * 3,
+                "type": item_type,
+                "icon": icon,
+                "duration": f"{rng.randint(1, 3)} hours",
+                "location": location,
+                "estimated_cost": f"${rng.randint(10, 40)}-{rng.randint(41, 90)}",
+                "booking_required": rng.random() < 0.3
+            })
+        result_days.append({"day": day, "date": f"Day {day}", "title": f"Day {day} in {destination}", "items": items})
+    return {
+        "days": result_days,
+        "travel_tips": [f"Tip {index} for {destination}" for index in range(5)],
+        "total_estimated_cost": f"${120 * days}-{220 * days}",
+        "description": f"AI-generated itinerary for {destination}"
+    }
+
+
+def itinerary_response(days: int, destination: str = "Lisbon, Portugal") -> Dict[str, Any]:
+    """The body /itinerary/generate answers with, as built by build_itinerary_response"""
+    result = itinerary(days, destination)
+    return {
+        "itinerary": result["days"],
+        "place_details": {"place_id": "ChIJO_PkYRozGQ0R0DaQ5L3rAAQ", "rating": 4.6, "address": destination},
+        "travel_tips": result["travel_tips"],
+        "total_estimated_cost": result["total_estimated_cost"],
+        "description": result["description"],
+        "success": True,
+        "message": "Itinerary generated successfully"
+    }
+
+
+def itinerary_text(days: int, destination: str = "Lisbon, Portugal") -> str:
+    """Gemini's raw reply: the itinerary JSON wrapped in a code fence and a sentence of prose"""
+    body = json.dumps(itinerary(days, destination), indent=2)
+    return f"Here is your personalised itinerary for {destination}:\n```json\n{body}\n```\nEnjoy your trip!"
+
+
+def hotel_dicts(count: int, destination: str = "Lisbon, Portugal") -> List[Dict[str, Any]]:
+    """Hotels as parsed from Gemini's JSON, before validation"""
+    return [
+        {
+            "id": f"hotel_{index}",
+            "name": f"Hotel {index} {destination}",
+            "description": f"A comfortable hotel in central {destination} close to the main sights, "
+                           f"with a rooftop bar and rooms overlooking the river. " * 2,
+            "location": {
+                "address": f"{index} Rua Augusta, {destination}",
+                "city": destination,
+                "latitude": 38.71 + index / 1000,
+                "longitude": -9.14 - index / 1000
+            },
+            "rating": 3.5 + (index % 15) / 10,
+            "reviewCount": 200 + 37 * index,
+            "pricePerNight": {"amount": 80 + 15 * (index % 20), "currency": "USD"},
+            "images": [f"https://images.example.com/hotel-{index}-{photo}.jpg" for photo in range(3)],
+            "amenities": [
+                {"name": name, "available": (index + position) % 3 != 0}
+                for position, name in enumerate(["Free WiFi", "Pool", "Gym", "Restaurant", "Spa", "Parking", "Bar"])
+            ],
+            "category": ["budget", "mid-range", "luxury"][index % 3]
+        }
+        for index in range(count)
+    ]
+
+
+def place_reviews(count: int) -> List[Dict[str, Any]]:
+    """Reviews as they come back from Place Details"""
+    return [
+        {
+            "author_name": f"Reviewer {index}",
+            "rating": 1 + index % 5,
+            "text": "Great location and friendly staff, the breakfast could be better. " * (1 + index % 4),
+            "time": 1700000000 + 3600 * index,
+            "relative_time_description": f"{1 + index % 11} months ago",
+            "language": "en"
+        }
+        for index in range(count)
+    ]
+
+
+def place_photos(count: int) -> List[Dict[str, Any]]:
+    return [
+        {"photo_reference": f"AWU5eFhOgx{index:06d}" + "x" * 180, "height": 3024, "width": 4032, "html_attributions": []}
+        for index in range(count)
+    ]
+
+
+def route_steps(count: int) -> List[Dict[str, Any]]:
+    """Steps of one leg from the Directions API"""
+    return [
+        {
+            "html_instructions": f"Turn <b>left</b> onto <b>Rua {index}</b>",
+            "distance": {"text": f"{0.1 * (1 + index % 9):.1f} km", "value": 100 * (1 + index % 9)},
+            "duration": {"text": f"{1 + index % 5} mins", "value": 60 * (1 + index % 5)},
+            "maneuver": "turn-left" if index % 2 else None,
+            "start_location": {"lat": 38.71 + index / 10000, "lng": -9.14},
+            "end_location": {"lat": 38.71 + (index + 1) / 10000, "lng": -9.14},
+            "polyline": {"points": "a~l~Fjk~uOwHJy@P"},
+            "travel_mode": "DRIVING"
+        }
+        for index in range(count)
+    ]
+
+
+SYLLABLES = ["ba", "ca", "da", "fa", "la", "ma", "na", "pa", "ra", "sa", "ta", "vi", "lo", "mi", "no", "ri", "su", "ke", "do", "zan", "tor", "mel", "bur", "gal"]
+TAGS = [
+    "Culture", "Romance", "Beach", "Adventure", "Food", "History", "Nightlife", "Wellness", "Island", "Mountains",
+    "Art", "Architecture", "Shopping", "Nature", "Wildlife", "Museums", "Hiking", "Wine", "Family", "Skiing",
+    "Diving", "Festivals", "Temples", "Markets", "Lakes", "Desert", "Rainforest", "Urban", "Photography", "Cycling"
+]
+
+
+def _place_name(rng: random.Random, syllables: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables)).title()
+
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+COSTS = [("$", "500-1000"), ("$$", "1000-2000"), ("$$$", "2500-5000")]
+
+
+def destination_records(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Catalog entries shaped like data/destinations.json, spread over about 200 countries"""
+    rng = random.Random(seed)
+    # Seasons, costs and trip lengths come from their own generator, so names and tags stay as they were
+    extra = random.Random(seed + 1)
+    countries = [_place_name(rng, 3) + "ia" for _ in range(200)]
+    records = []
+    for index in range(count):
+        country = countries[min(int(rng.paretovariate(1.2)) - 1, len(countries) - 1)]
+        name = _place_name(rng, rng.randint(2, 4))
+        image = f"https://images.example.com/{index}.jpg"
+        records.append({
+            "id": f"destination-{index}",
+            "name": f"{name}, {country}",
+            "country": country,
+            "description": f"{name} is known for its {rng.choice(TAGS).lower()} and {rng.choice(TAGS).lower()}.",
+            "images": {"hero": image, "slideshow": [image], "thumbnail": image},
+            "videos": {"hero": f"https://videos.example.com/{index}.mp4", "thumbnail": image},
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "tags": rng.sample(TAGS, rng.randint(2, 5)),
+            "highlights": [f"{_place_name(rng, 2)} {kind}" for kind in ("Old Town", "Market", "Viewpoint")],
+            **_season_and_cost(extra)
+        })
+    return records
+
+
+def _season_and_cost(rng: random.Random) -> Dict[str, Any]:
+    start = rng.randrange(12)
+    budget, cost_range = rng.choice(COSTS)
+    low = rng.randint(2, 7)
+    return {
+        "best_time_to_visit": f"{MONTH_NAMES[start]} to {MONTH_NAMES[(start + rng.randint(2, 6)) % 12]}",
+        "estimated_cost": {"budget": budget, "range": cost_range},
+        "ideal_days": [low, low + rng.randint(2, 7)]
+    }
+
+
+def legacy_trip_request() -> Dict[str, Any]:
+    """A planning-wizard payload using the legacy camelCase fields TripRequest remaps"""
+    return {
+        "destination": "Lisbon, Portugal",
+        "sourceLocation": "London, UK",
+        "numberOfDays": 5,
+        "numberOfPeople": 2,
+        "travelStyle": "moderate",
+        "budget": 1200,
+        "interests": ["food", "history", "nightlife"],
+        "foodPreference": "vegetarian",
+        "selectedHotel": "Boutique hotel",
+        "travelMode": "public transport",
+        "selectedEssentials": ["camera", "walking shoes"]
+    }
+
+
+def trip_request() -> Dict[str, Any]:
+    return {
+        "source": "London, UK",
+        "destination": "Lisbon, Portugal",
+        "budget": "mid-range",
+        "duration_days": 5,
+        "interests": ["food", "history", "nightlife"],
+        "travel_style": "moderate",
+        "travelers": "couple"
+    }
@@ -0,0 +1,199 @@
+"""
+Benchmark endpoint latency and CPU per request on identical, recorded inputs.
+
+The runner plays a fixed, seeded set of journeys one request at a time
+through the real app, with upstream calls answered from an
+UPSTREAM_FIXTURES store. With --latency-scale 0 (the default) no time is
+spent waiting on upstreams, so the numbers are the app's own cost and stay
+comparable from commit to commit. Requests whose upstream calls
+were never recorded fall back to the app's error paths; the run reports
+them so the fixtures can be re-recorded.
+
+    # Record once, against the real APIs (or the local stubs with --stubs)
+    python -m bench.runner --record --fixtures bench_fixtures.db
+
+    # Then on every commit, fully offline
+    python -m bench.runner --fixtures bench_fixtures.db --history bench_history.jsonl --compare-last
+
+Run from the backend directory. Each run appends one JSON line (commit,
+config and per-endpoint results) to the history file.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+import requests
+from bench.journeys import JOURNEYS, BenchClient, Recorder, Sample
+from bench.loadtest import AppServer, free_port, parse_mix, percentile
+from bench.upstreams import DEFAULT_GEMINI_LATENCY, DEFAULT_MAPS_LATENCY, StubUpstreams, UpstreamProfile
+
+logger = logging.getLogger(__name__)
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Dict[str, Any]]:
+    grouped: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        grouped.setdefault(sample.label, []).append(sample)
+    summary = {}
+    for label, group in sorted(grouped.items()):
+        latencies = sorted(sample.seconds * 1000 for sample in group)
+        summary[label] = {
+            "count": len(group),
+            "errors": sum(1 for sample in group if not 200 <= sample.status < 300),
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "cpu_ms": round(statistics.fmean(sample.cpu_seconds * 1000 for sample in group), 2)
+        }
+    return summary
+
+
+def run_journeys(base_url: str, mix: Dict[str, float], iterations: int) -> List[Sample]:
+    """Every journey in the mix, iterations times each, strictly one request at a time"""
+    recorder = Recorder()
+    client = BenchClient(base_url, recorder, measure_cpu=True)
+    for name in mix:
+        for iteration in range(iterations):
+            JOURNEYS[name](client, random.Random(f"{name}-{iteration}"))
+    return recorder.samples()
+
+
+def _wait_until_ready(base_url: str, timeout: float = 60) -> None:
+    """The first requests should not pay for the SDK imports of the warm-up"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/ready", timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    logger.warning("The app did not report ready, measuring anyway")
+
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_comparison(result: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    lines = [
+        f"compared with {baseline.get('commit') or 'baseline'}:",
+        f"{'endpoint':<42}{'p50 ms':>10}{'change':>9}{'cpu ms':>10}{'change':>9}"
+    ]
+    for label, stats in result["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if before is None:
+            continue
+        changes = [
+            f"{(stats[key] - before[key]) / before[key] * 100:+8.1f}%" if before[key] else f"{'n/a':>9}"
+            for key in ("p50_ms", "cpu_ms")
+        ]
+        lines.append(f"{label:<42}{stats['p50_ms']:>10.2f}{changes[0]}{stats['cpu_ms']:>10.2f}{changes[1]}")
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark endpoints on recorded upstream responses")
+    parser.add_argument("--fixtures", default="bench_fixtures.db", help="fixture store to record into or replay from")
+    parser.add_argument("--record", action="store_true", help="call the upstreams and record their responses")
+    parser.add_argument("--stubs", action="store_true", help="with --record, record from the local stubs instead of the real APIs")
+    parser.add_argument("--mix", default=",".join(JOURNEYS), help="journeys to run")
+    parser.add_argument("--iterations", type=int, default=5, help="runs of each journey")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="replay upstream latency times this (0 = none)")
+    parser.add_argument("--history", help="append the result to this JSONL file")
+    parser.add_argument("--compare-last", action="store_true", help="compare with the previous entry in --history")
+    parser.add_argument("--baseline", help="compare with a result saved by --output")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    mix = parse_mix(args.mix)
+
+    os.environ.update({
+        "UPSTREAM_FIXTURES": "record" if args.record else "replay",
+        "UPSTREAM_FIXTURES_PATH": args.fixtures,
+        "UPSTREAM_FIXTURES_LATENCY_SCALE": str(args.latency_scale),
+        # Everything that makes the request path depend on timing or on earlier requests is off
+        "RATE_LIMIT": "false",
+        "ADMISSION_CONTROL": "false",
+        "SPECULATIVE_GENERATION": "false"
+    })
+    with ExitStack() as stack:
+        if args.record and args.stubs:
+            stubs = stack.enter_context(StubUpstreams(
+                UpstreamProfile(DEFAULT_GEMINI_LATENCY),
+                UpstreamProfile(DEFAULT_MAPS_LATENCY),
+                seed=0
+            ))
+            os.environ.update(stubs.env())
+        app = stack.enter_context(AppServer(free_port()))
+        _wait_until_ready(app.url)
+        samples = run_journeys(app.url, mix, args.iterations)
+        fixtures = requests.get(f"{app.url}/health", timeout=10).json().get("fixtures")
+
+    result = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "mode": "record" if args.record else "replay",
+            "mix": list(mix),
+            "iterations": args.iterations,
+            "latency_scale": args.latency_scale
+        },
+        "fixtures": fixtures,
+        "endpoints": summarize(samples)
+    }
+
+    print(f"{'endpoint':<42}{'count':>7}{'errors':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'cpu ms':>10}")
+    for label, stats in result["endpoints"].items():
+        print(
+            f"{label:<42}{stats['count']:>7}{stats['errors']:>8}{stats['mean_ms']:>10.2f}"
+            f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['cpu_ms']:>10.2f}"
+        )
+    if fixtures and fixtures.get("misses"):
+        print(f"\n{fixtures['misses']} upstream calls had no fixture and took the error path; re-record with --record")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif args.compare_last and args.history:
+        history = [entry for entry in load_history(args.history) if entry.get("config") == result["config"]]
+        baseline = history[-1] if history else None
+    if baseline is not None:
+        print("\n" + format_comparison(result, baseline))
+
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""
+Local stand-ins for the Generative Language API and the Maps web services.
+
+The real app is pointed at these through GEMINI_API_BASE_URL and
+GOOGLE_MAPS_BASE_URL, so the load test exercises the actual routers,
+services, pools and caches without any network. Each stub answers with
+canned but well-formed payloads after a sampled delay, and can be told to
+fail a fraction of calls with a 5xx, throttle them (429 for Gemini,
+OVER_QUERY_LIMIT for Maps) or, for Gemini, cut the generated JSON short.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# Roughly what the real APIs look like from a nearby region
+DEFAULT_GEMINI_LATENCY = "lognormal:1.5,0.5"
+DEFAULT_MAPS_LATENCY = "lognormal:0.12,0.4"
+
+OK = "ok"
+ERROR = "error"
+THROTTLED = "throttled"
+TRUNCATED = "truncated"
+
+
+class LatencyModel:
+    """
+    Upstream latency in seconds, sampled from a distribution spec.
+
+    "constant:0.5", "uniform:0.2,1.5" or "lognormal:1.2,0.5" (median and
+    sigma, which gives the long tail real model calls have).
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        try:
+            self.params = [float(value) for value in params.split(",") if value.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+        expected = {"constant": 1, "uniform": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid latency spec '{spec}', expected constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+class UpstreamProfile:
+    """How one stub behaves: latency plus the share of calls that fail in each way"""
+
+    def __init__(
+        self,
+        latency: str = "constant:0",
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        truncate_rate: float = 0.0
+    ):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.truncate_rate = truncate_rate
+
+    def outcome(self, rng: random.Random) -> str:
+        roll = rng.random()
+        if roll < self.error_rate:
+            return ERROR
+        if roll < self.error_rate + self.throttle_rate:
+            return THROTTLED
+        if rng.random() < self.truncate_rate:
+            return TRUNCATED
+        return OK
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.spec,
+            "error_rate": self.error_rate,
+            "throttle_rate": self.throttle_rate,
+            "truncate_rate": self.truncate_rate
+        }
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _coordinates(value: str) -> Dict[str, float]:
+    digest = _digest(value)
+    return {
+        "lat": round(int(digest[:8], 16) / 0xFFFFFFFF * 120 - 60, 6),
+        "lng": round(int(digest[8:16], 16) / 0xFFFFFFFF * 340 - 170, 6)
+    }
+
+
+class StubUpstream:
+    """
+    One stub API on an ephemeral localhost port.
+
+    Routes map a path (or a path pattern) to a handler that returns
+    (status, payload) for the request; the stub applies the profile's delay
+    and failure injection around it and counts every call per route and outcome.
+    """
+
+    def __init__(self, name: str, profile: UpstreamProfile, seed: Optional[int] = None):
+        self.name = name
+        self.profile = profile
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._counts_lock = threading.Lock()
+        self._routes: List[Tuple[re.Pattern, str, Callable[[Dict[str, Any]], Tuple[int, Any]]]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def route(self, pattern: str, endpoint: str, handler: Callable[[Dict[str, Any]], Tuple[int, Any]]) -> None:
+        self._routes.append((re.compile(pattern), endpoint, handler))
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubUpstream":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the app's pooled sessions behave as they do in production
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Calls per route, broken down by outcome"""
+        with self._counts_lock:
+            return {endpoint: dict(outcomes) for endpoint, outcomes in self._counts.items()}
+
+    def reset(self) -> None:
+        with self._counts_lock:
+            self._counts.clear()
+
+    def _sample(self) -> Tuple[str, float]:
+        with self._rng_lock:
+            return self.profile.outcome(self._rng), self.profile.latency.sample(self._rng)
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        parsed = urlparse(request.path)
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        for pattern, endpoint, handler in self._routes:
+            if pattern.fullmatch(parsed.path):
+                break
+        else:
+            self._respond(request, 404, {"error": {"code": 404, "message": f"No stub for {parsed.path}"}})
+            return
+
+        outcome, delay = self._sample()
+        with self._counts_lock:
+            self._counts[endpoint][outcome] += 1
+        time.sleep(delay)
+
+        call = {
+            "path": parsed.path,
+            "query": {key: values[0] for key, values in parse_qs(parsed.query).items()},
+            "json": json.loads(body) if body else None,
+            "outcome": outcome
+        }
+        status, payload = handler(call)
+        self._respond(request, status, payload)
+
+    def _respond(self, request: BaseHTTPRequestHandler, status: int, payload: Any) -> None:
+        data = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=UTF-8")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+
+# ---- Generative Language API ----
+
+def _google_error(code: int, status: str, message: str) -> Dict[str, Any]:
+    return {"error": {"code": code, "message": message, "status": status}}
+
+
+def _prompt_field(prompt: str, label: str, default: str) -> str:
+    match = re.search(rf"- {re.escape(label)}: (.+)", prompt)
+    return match.group(1).strip() if match else default
+
+
+def _itinerary_text(prompt: str) -> Dict[str, Any]:
+    destination = _prompt_field(prompt, "Destination", "the destination")
+    try:
+        days = int(_prompt_field(prompt, "Duration", "3").split()[0])
+    except ValueError:
+        days = 3
+    slots = [
+        ("9:00 AM", "activity", "map-pin", "Old town walking tour"),
+        ("12:30 PM", "food", "utensils", "Lunch at a local market"),
+        ("3:00 PM", "activity", "camera", "Museum visit"),
+        ("7:30 PM", "food", "utensils", "Dinner in the harbour district")
+    ]
+    return {
+        "days": [
+            {
+                "day": day,
+                "date": f"Day {day}",
+                "title": f"Day {day} - Exploring {destination}",
+                "items": [
+                    {
+                        "time": time_of_day,
+                        "title": f"{title} in {destination}",
+                        "description": f"{title} in {destination}, chosen to match the trip preferences.",
+                        "type": item_type,
+                        "icon": icon,
+                        "duration": "2 hours",
+                        "location": f"{title}, {destination}",
+                        "estimated_cost": "$20-40",
+                        "booking_required": False
+                    }
+                    for time_of_day, item_type, icon, title in slots
+                ]
+            }
+            for day in range(1, days + 1)
+        ],
+        "travel_tips": [f"Buy a transit pass for {destination}", "Book popular museums ahead", "Carry some cash"],
+        "total_estimated_cost": f"${150 * days}-{250 * days}",
+        "description": f"Itinerary for {destination}"
+    }
+
+
+def _hotels_text(prompt: str) -> Dict[str, Any]:
+    destination = _prompt_field(prompt, "Destination", "the destination")
+    return {
+        "hotels": [
+            {
+                "id": f"hotel_{index}",
+                "name": f"{name} {destination}",
+                "description": f"Well located {name.lower()} in central {destination}.",
+                "location": {
+                    "address": f"{index} Main Street, {destination}",
+                    "city": destination,
+                    "latitude": 48.85 + index / 100,
+                    "longitude": 2.35 + index / 100
+                },
+                "rating": 4.0 + index / 10,
+                "reviewCount": 500 + 100 * index,
+                "pricePerNight": {"amount": 90 + 40 * index, "currency": "USD"},
+                "images": [],
+                "amenities": [
+                    {"name": "Free WiFi", "available": True},
+                    {"name": "Pool", "available": index % 2 == 0},
+                    {"name": "Restaurant", "available": True}
+                ],
+                "category": "mid-range"
+            }
+            for index, name in enumerate(["Grand Hotel", "Harbour Inn", "Boutique Rooms", "City Suites", "Garden Lodge", "Station Hotel"], start=1)
+        ]
+    }
+
+
+def _gemini_text(prompt: str) -> Dict[str, Any]:
+    if "day-by-day itinerary" in prompt:
+        return _itinerary_text(prompt)
+    if '"hotels"' in prompt:
+        return _hotels_text(prompt)
+    if "Analyze the following reviews" in prompt:
+        return {
+            "pros": ["Friendly staff", "Great location"],
+            "cons": ["Busy at weekends"],
+            "overall_sentiment": "positive",
+            "rating_breakdown": {"service": 4.3, "value": 3.9, "location": 4.6}
+        }
+    if "travel destination" in prompt:
+        return {
+            "best_time_to_visit": "April to June and September to October",
+            "highlights": ["Historic centre", "Waterfront", "Food markets"],
+            "local_cuisine": ["Street food", "Seafood"],
+            "cultural_tips": ["Greet shopkeepers", "Tipping is modest"],
+            "budget_estimates": {"budget": "$50-80/day", "mid-range": "$100-150/day", "luxury": "$200+/day"},
+            "transportation": ["Metro", "Walking"],
+            "safety_tips": ["Watch for pickpockets in crowds"]
+        }
+    return {"text": "ok"}
+
+
+def generate_content(call: Dict[str, Any]) -> Tuple[int, Any]:
+    if call["outcome"] == ERROR:
+        return 500, _google_error(500, "INTERNAL", "An internal error has occurred.")
+    if call["outcome"] == THROTTLED:
+        return 429, _google_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+
+    request = call["json"] or {}
+    parts = [part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])]
+    prompt = "\n".join(parts)
+    text = json.dumps(_gemini_text(prompt), indent=2)
+    if call["outcome"] == TRUNCATED:
+        # What a response cut off at max_output_tokens looks like
+        text = text[:max(1, int(len(text) * 0.6))]
+    return 200, {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "MAX_TOKENS" if call["outcome"] == TRUNCATED else "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {
+            "promptTokenCount": len(prompt) // 4,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": (len(prompt) + len(text)) // 4
+        }
+    }
+
+
+def create_gemini_stub(profile: UpstreamProfile, seed: Optional[int] = None) -> StubUpstream:
+    stub = StubUpstream("gemini", profile, seed)
+    stub.route(r"/v1beta/models/[^/:]+:generateContent", "generateContent", generate_content)
+    return stub
+
+
+# ---- Maps web services ----
+
+def _place(query: str) -> Dict[str, Any]:
+    name = query.split(",")[0].strip() or "Place"
+    return {
+        "place_id": f"stub_{_digest(query.lower())[:16]}",
+        "name": name,
+        "formatted_address": f"{name}, {query}",
+        "geometry": {"location": _coordinates(query.lower())},
+        "rating": 4.5,
+        "user_ratings_total": 1200,
+        "types": ["tourist_attraction", "point_of_interest"],
+        "photos": [{"photo_reference": f"photo_{_digest(query)[:12]}_{index}", "height": 800, "width": 1200} for index in range(3)]
+    }
+
+
+def _maps(results_key: str, build: Callable[[Dict[str, str]], Any]) -> Callable[[Dict[str, Any]], Tuple[int, Any]]:
+    def handler(call: Dict[str, Any]) -> Tuple[int, Any]:
+        if call["outcome"] == ERROR:
+            return 500, {"status": "UNKNOWN_ERROR", "error_message": "Stubbed server error"}
+        if call["outcome"] == THROTTLED:
+            return 200, {"status": "OVER_QUERY_LIMIT", "error_message": "You have exceeded your rate-limit.", results_key: []}
+        return 200, {"status": "OK", results_key: build(call["query"])}
+    return handler
+
+
+def _place_details(query: Dict[str, str]) -> Dict[str, Any]:
+    place = _place(query.get("place_id", "place"))
+    place["place_id"] = query.get("place_id")
+    place.update({
+        "reviews": [
+            {"author_name": f"Traveller {index}", "rating": 5 - index % 2, "text": "Lovely place, would visit again.", "time": 1700000000 + index, "relative_time_description": "a month ago"}
+            for index in range(5)
+        ],
+        "website": "https://example.com",
+        "formatted_phone_number": "+1 555 0100",
+        "opening_hours": {"open_now": True},
+        "price_level": 2
+    })
+    return place
+
+
+def _directions(query: Dict[str, str]) -> List[Dict[str, Any]]:
+    start = _coordinates(query.get("origin", ""))
+    end = _coordinates(query.get("destination", ""))
+    return [{
+        "summary": "Main road",
+        "legs": [{
+            "duration": {"text": "25 mins", "value": 1500},
+            "distance": {"text": "12 km", "value": 12000},
+            "steps": [{
+                "html_instructions": "Head towards the destination",
+                "distance": {"text": "12 km", "value": 12000},
+                "duration": {"text": "25 mins", "value": 1500},
+                "start_location": start,
+                "end_location": end
+            }]
+        }],
+        "overview_polyline": {"points": "_p~iF~ps|U_ulLnnqC_mqNvxq`@"}
+    }]
+
+
+def create_maps_stub(profile: UpstreamProfile, seed: Optional[int] = None) -> StubUpstream:
+    stub = StubUpstream("maps", profile, seed)
+    stub.route(r"/maps/api/place/textsearch/json", "textsearch", _maps("results", lambda q: [_place(q.get("query", ""))]))
+    stub.route(r"/maps/api/place/findplacefromtext/json", "findplacefromtext", _maps("candidates", lambda q: [_place(q.get("input", ""))]))
+    stub.route(r"/maps/api/place/details/json", "details", _maps("result", _place_details))
+    stub.route(r"/maps/api/place/nearbysearch/json", "nearbysearch", _maps(
+        "results",
+        lambda q: [_place(f"Attraction {index} near {q.get('location', '')}") for index in range(10)]
+    ))
+    stub.route(r"/maps/api/geocode/json", "geocode", _maps("results", lambda q: [_place(q.get("address", ""))]))
+    stub.route(r"/maps/api/directions/json", "directions", _maps("routes", _directions))
+    return stub
+
+
+class StubUpstreams:
+    """Both stubs, started together; env() gives the settings that point the app at them"""
+
+    def __init__(self, gemini: UpstreamProfile, maps: UpstreamProfile, seed: Optional[int] = None):
+        self.gemini = create_gemini_stub(gemini, seed)
+        self.maps = create_maps_stub(maps, None if seed is None else seed + 1)
+
+    def __enter__(self) -> "StubUpstreams":
+        self.gemini.start()
+        self.maps.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.gemini.close()
+        self.maps.close()
+
+    def env(self) -> Dict[str, str]:
+        return {
+            "GOOGLE_AI_API_KEY": "bench-gemini-key",
+            # googlemaps rejects keys that do not look like real ones
+            "GOOGLE_MAPS_API_KEY": "AIzaBenchStubKey000000000000000000000",
+            "GEMINI_API_BASE_URL": self.gemini.url,
+            "GOOGLE_MAPS_BASE_URL": self.maps.url
+        }
+
+    def counts(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        return {"gemini": self.gemini.counts(), "maps": self.maps.counts()}
+
+    def reset(self) -> None:
+        self.gemini.reset()
+        self.maps.reset()
@@ -0,0 +1,161 @@
+"""
+Build the destination knowledge packs served by /destinations/{id} and used
+to ground the itinerary and hotel prompts (see services/knowledge.py).
+
+    python build_knowledge_packs.py
+    python build_knowledge_packs.py --only paris-france,tokyo-japan --output /tmp/packs.bin
+
+Run from the backend directory with the API keys in .env. Every catalog
+destination costs one insights generation, three Maps searches, one place
+details lookup per destination and reviewed hotel, and one review summary per
+reviewed hotel. UPSTREAM_FIXTURES=record / replay work as they do for the
+server. Rebuilding replaces the file atomically; running servers pick the new
+packs up on restart.
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from models import Destination
+from services.catalog import load_catalog
+from services.fixtures import create_upstream_fixtures
+from services.gemini_service import GeminiService
+from services.knowledge import DEFAULT_KNOWLEDGE_FILE, load_knowledge_packs, write_packs
+from services.maps_service import MapsService
+from settings import load_environment
+
+logger = logging.getLogger("build_knowledge_packs")
+
+
+def photo_references(urls: List[str]) -> List[str]:
+    """The photo references inside Maps photo URLs, which are stored without the API key"""
+    references = []
+    for url in urls:
+        reference = parse_qs(urlparse(url).query).get("photoreference")
+        if reference:
+            references.append(reference[0])
+    return references
+
+
+def place_entry(place: Dict[str, Any]) -> Dict[str, Any]:
+    location = (place.get("geometry") or {}).get("location") or {}
+    return {
+        "place_id": place.get("place_id"),
+        "name": place.get("name"),
+        "address": place.get("address"),
+        "lat": location.get("lat"),
+        "lng": location.get("lng"),
+        "rating": place.get("rating"),
+        "user_ratings_total": place.get("user_ratings_total"),
+        "types": place.get("types", []),
+        "photo_references": photo_references(place.get("photos") or [])
+    }
+
+
+def lodging_entry(hotel: Dict[str, Any], gemini: GeminiService, maps: MapsService) -> Dict[str, Any]:
+    entry = place_entry(hotel)
+    details = maps.get_place_details(hotel["place_id"])
+    if "error" in details:
+        return entry
+    entry["price_level"] = details.get("price_level")
+    entry["photo_references"] = photo_references(details.get("photos") or []) or entry["photo_references"]
+    reviews = [review["text"] for review in details.get("reviews") or [] if review.get("text")]
+    if reviews:
+        summary = gemini.summarize_reviews(reviews)
+        # The template fallback has no rating breakdown; it says nothing about this hotel
+        if summary.rating_breakdown is not None:
+            entry["review_summary"] = summary.model_dump()
+    return entry
+
+
+def build_pack(
+    destination: Destination,
+    gemini: GeminiService,
+    maps: MapsService,
+    attractions: int,
+    hotels: int,
+    reviewed_hotels: int
+) -> Dict[str, Any]:
+    """Everything the app would otherwise ask the upstreams about one destination"""
+    pack: Dict[str, Any] = {"id": destination.id, "name": destination.name, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    insights = gemini.get_destination_insights(destination.name)
+    if "error" not in insights:
+        pack["insights"] = insights
+
+    search = maps.search_places(destination.name)
+    if search.get("results"):
+        place = maps.get_place_details(search["results"][0]["place_id"])
+        if "error" not in place:
+            pack["place"] = {**place, "photos": photo_references(place.get("photos") or [])}
+
+    found = maps.search_places(f"top tourist attractions in {destination.name}").get("results", [])
+    pack["attractions"] = [place_entry(place) for place in found[:attractions] if place.get("place_id")]
+
+    found = [hotel for hotel in maps.search_places(f"hotels in {destination.name}").get("results", []) if hotel.get("place_id")]
+    pack["lodging"] = [
+        lodging_entry(hotel, gemini, maps) if rank < reviewed_hotels else place_entry(hotel)
+        for rank, hotel in enumerate(found[:hotels])
+    ]
+    return pack
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Build the destination knowledge packs from Gemini and Google Maps")
+    parser.add_argument("--output", default=DEFAULT_KNOWLEDGE_FILE, help="pack file to write")
+    parser.add_argument("--only", help="comma-separated destination ids to rebuild; other packs are kept from --output")
+    parser.add_argument("--attractions", type=int, default=15, help="top attractions per destination")
+    parser.add_argument("--hotels", type=int, default=10, help="hotels per destination")
+    parser.add_argument("--reviewed-hotels", type=int, default=5, help="hotels per destination that get details and a review summary")
+    parser.add_argument("--workers", type=int, default=4, help="destinations built at the same time")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    load_environment()
+    fixtures = create_upstream_fixtures()
+    gemini = GeminiService(fixtures=fixtures)
+    maps = MapsService(fixtures=fixtures)
+    if not gemini.is_healthy() or not maps.is_healthy():
+        logger.error("Building packs needs GOOGLE_AI_API_KEY and GOOGLE_MAPS_API_KEY (or UPSTREAM_FIXTURES=replay)")
+        return 1
+
+    catalog = load_catalog()
+    destinations = catalog.all()
+    packs: Dict[str, Dict[str, Any]] = {}
+    if args.only:
+        wanted = set(args.only.split(","))
+        unknown = wanted.difference(destination.id for destination in destinations)
+        if unknown:
+            logger.error(f"Not in the catalog: {', '.join(sorted(unknown))}")
+            return 1
+        existing = load_knowledge_packs(args.output)
+        packs = {destination_id: existing.get(destination_id) for destination_id in existing.ids() if catalog.get(destination_id)}
+        existing.close()
+        destinations = [destination for destination in destinations if destination.id in wanted]
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        built = executor.map(
+            lambda destination: build_pack(destination, gemini, maps, args.attractions, args.hotels, args.reviewed_hotels),
+            destinations
+        )
+        for destination, pack in zip(destinations, built):
+            packs[destination.id] = pack
+            missing = [section for section in ("insights", "place", "attractions", "lodging") if not pack.get(section)]
+            logger.info(f"Built {destination.id}" + (f" without {', '.join(missing)}" if missing else ""))
+
+    version = write_packs(args.output, packs)
+    logger.info(f"Wrote {len(packs)} packs to {args.output} (version {version}) in {time.time() - start:.1f}s")
+    maps.close()
+    if fixtures is not None:
+        fixtures.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
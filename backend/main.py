@@ -1,20 +1,70 @@
-from fastapi import FastAPI
+import sys
+import startup_profiler
+
+# Must run before the framework and routers are imported so their cost is measured
+if "--profile-startup" in sys.argv:
+    startup_profiler.enable()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers import destinations, itinerary, config, auth, planning
-from routers import hotels
-from services.gemini_service import GeminiService
-from services.maps_service import MapsService
+from fastapi.responses import JSONResponse, PlainTextResponse
+from settings import load_environment, env_flag
+from responses import FastJSONResponse
+import logging
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load environment variables once for the whole process
+load_environment()
+
+from routers import destinations, itinerary, config, auth, planning
+from routers import hotels, jobs, profiling
+from services.container import ServiceContainer
+from services.bulkhead import BulkheadFull, configure_local_pool
+from services.admission import Overloaded
+from middleware.cancellation import CancelOnDisconnectMiddleware
+from middleware.compression import CompressionMiddleware, compression_settings
+from middleware.metrics import MetricsMiddleware
+from middleware.profiling import ProfilingMiddleware
+from middleware.tracing import TracingMiddleware
+from services.tracing import configure_tracing, shutdown_tracing
+from services.profiling import configure_profiling
+from services.metrics import REGISTRY
+
+startup_profiler.mark("app_imported")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared set of upstream clients, caches and pools for every router
+    configure_tracing()
+    configure_profiling()
+    services = ServiceContainer()
+    app.state.services = services
+    configure_local_pool(int(os.getenv("LOCAL_POOL_WORKERS", "40")))
+    if env_flag("WARM_UP_ON_START", default=True):
+        services.start_warm_up()
+        # In production mode a worker only starts accepting requests once it is warm
+        if env_flag("READY_AFTER_WARM_UP"):
+            timeout = float(os.getenv("WARM_UP_TIMEOUT_SECONDS", "30"))
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, services.warmed_up.wait, timeout)
+    else:
+        services.warmed_up.set()
+    startup_profiler.mark("serving")
+    try:
+        yield
+    finally:
+        app.state.services.close()
+        shutdown_tracing()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="TripMigo AI API",
     description="AI-powered travel planning API with Gemini and Google Maps integration",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -27,9 +77,27 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# Initialize services
-gemini_service = GeminiService()
-maps_service = MapsService()
+# Itineraries, hotel lists and the catalog are large, repetitive JSON; most users are on mobile links
+compression = compression_settings()
+if compression is not None:
+    app.add_middleware(CompressionMiddleware, **compression)
+
+# Stop Gemini/Maps work for requests whose client has gone away
+app.add_middleware(CancelOnDisconnectMiddleware)
+# Inside tracing, so a profile takes its request's trace id
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
+# Outermost, so it also times cancelled and rejected requests
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(BulkheadFull)
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Include routers
 app.include_router(config.router, prefix="/config", tags=["config"])
@@ -38,6 +106,8 @@ app.include_router(itinerary.router, prefix="/itinerary", tags=["itinerary"])
 app.include_router(planning.router, prefix="/planning", tags=["planning"])
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(hotels.router, prefix="/hotels", tags=["hotels"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(profiling.router, prefix="/debug/profiles", tags=["profiling"], include_in_schema=False)
 
 @app.get("/")
 def root():
@@ -49,14 +119,17 @@ def root():
     }
 
 @app.get("/health")
-def health_check():
-    import os
+def health_check(request: Request):
+    services = request.app.state.services
     return {
         "status": "healthy",
         "services": {
-            "gemini": gemini_service.is_healthy(),
-            "maps": maps_service.is_healthy()
+            "gemini": services.gemini.is_healthy(),
+            "maps": services.maps.is_healthy()
         },
+        "pools": services.pool_stats(),
+        "admission": services.admission.stats(),
+        "fixtures": services.fixtures.stats() if services.fixtures is not None else None,
         "environment": {
             "gemini_api_configured": bool(os.getenv("GOOGLE_AI_API_KEY")),
             "maps_api_configured": bool(os.getenv("GOOGLE_MAPS_API_KEY")),
@@ -64,7 +137,51 @@ def health_check():
         }
     }
 
+@app.get("/ready")
+def readiness_check(request: Request, response: Response):
+    """Readiness probe: 503 until the upstream clients have been warmed up"""
+    ready = request.app.state.services.warmed_up.is_set()
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "pid": os.getpid()}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics for this worker process"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def default_worker_count() -> int:
+    """Worker processes to run: WEB_CONCURRENCY if set, otherwise one per usable CPU"""
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    
+    parser = argparse.ArgumentParser(description="Run the TripMigo API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", default="1",
+                        help="Number of worker processes, or 'auto' to size from WEB_CONCURRENCY / CPU count")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print an import-time breakdown and time-to-ready once the app is warm")
+    args = parser.parse_args()
+    
+    workers = default_worker_count() if args.workers == "auto" else max(1, int(args.workers))
+    
+    if workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port)
+    else:
+        # Workers are separate processes: state must live in a shared store, and
+        # each worker should only take traffic once warm. Children inherit these.
+        os.environ.setdefault("STATE_STORE", "sqlite")
+        os.environ.setdefault("READY_AFTER_WARM_UP", "true")
+        if os.environ["STATE_STORE"] == "memory":
+            logging.getLogger(__name__).warning("STATE_STORE=memory with multiple workers; sessions will not be shared")
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=workers)
@@ -0,0 +1 @@
+# Middleware package for ASGI middleware
\ No newline at end of file
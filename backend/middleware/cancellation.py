@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from services.cancellation import CancellationToken, RequestCancelled, bind_token, reset_token
+from services.metrics import CANCELLED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# nginx's "client closed request"; never seen by the client, only by logs and proxies
+CLIENT_CLOSED_REQUEST = 499
+# Larger bodies are streamed to the app as they arrive and their requests are not watched;
+# the trip and review payloads of the AI routes are a few KB
+MAX_BUFFERED_BODY_BYTES = 1024 * 1024
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    Cancel a request's upstream work as soon as its client disconnects.
+
+    The request body is read up front and replayed to the app, which frees the
+    real receive channel for a watcher task that waits for http.disconnect and
+    trips the request's CancellationToken. Services check the token before each
+    Gemini or Maps call and raise RequestCancelled, which unwinds the request
+    here. Bodies over MAX_BUFFERED_BODY_BYTES are not held in memory; those
+    requests go to the app untouched and are not cancelled on disconnect.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if _content_length(scope) > MAX_BUFFERED_BODY_BYTES:
+            await self.app(scope, receive, send)
+            return
+
+        body_messages = []
+        buffered = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body_messages.append(message)
+            if not message.get("more_body", False):
+                break
+            buffered += len(message.get("body", b""))
+            if buffered > MAX_BUFFERED_BODY_BYTES:
+                # Chunked and too large to hold: hand over what was read and let the app stream the rest
+                await self.app(scope, _prepend(body_messages, receive), send)
+                return
+
+        token = CancellationToken()
+        disconnected = asyncio.Event()
+
+        async def replay_receive():
+            if body_messages:
+                return body_messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            token.cancel()
+            disconnected.set()
+
+        response_started = False
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_disconnect())
+        reset = bind_token(token)
+        try:
+            await self.app(scope, replay_receive, tracking_send)
+        except RequestCancelled:
+            # The route template, not the path, so ids in URLs do not each get a series
+            CANCELLED_REQUESTS.inc(route=getattr(scope.get("route"), "path", None) or "unmatched")
+            logger.info(f"Client disconnected, abandoned {scope['method']} {scope['path']}")
+            if not response_started:
+                await send({"type": "http.response.start", "status": CLIENT_CLOSED_REQUEST, "headers": []})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            reset_token(reset)
+            watcher.cancel()
+
+
+def _content_length(scope) -> int:
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+def _prepend(messages, receive):
+    async def prepended_receive():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+    return prepended_receive
@@ -0,0 +1,257 @@
+import os
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from settings import env_flag
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional; gzip is always available
+    zstandard = None
+
+# Media types worth compressing; images and video are already compressed
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+EVENT_STREAM = "text/event-stream"
+
+
+class Encoder(ABC):
+    """Incremental compressor: compress() each chunk, flush() to push out what is buffered, finish() at the end"""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        ...
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        ...
+
+
+class GzipEncoder(Encoder):
+    def __init__(self, level: int):
+        # wbits=31 writes the gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(Encoder):
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders(gzip_level: int = 6, brotli_quality: int = 4, zstd_level: int = 3) -> Dict[str, Callable[[], Encoder]]:
+    """Content-coding -> encoder factory, in the server's order of preference"""
+    encoders: Dict[str, Callable[[], Encoder]] = {}
+    if zstandard is not None:
+        encoders["zstd"] = lambda: ZstdEncoder(zstd_level)
+    if brotli is not None:
+        encoders["br"] = lambda: BrotliEncoder(brotli_quality)
+    encoders["gzip"] = lambda: GzipEncoder(gzip_level)
+    return encoders
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0}"""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: str, supported: List[str]) -> Optional[str]:
+    """
+    The coding to use for an Accept-Encoding header: highest client q-value
+    wins, ties go to the server's preference order, and "*" stands for any
+    coding not listed explicitly.
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best: Optional[Tuple[float, int]] = None
+    choice = None
+    for preference, coding in enumerate(supported):
+        q = accepted.get(coding, wildcard)
+        if q <= 0:
+            continue
+        rank = (q, -preference)
+        if best is None or rank > best:
+            best, choice = rank, coding
+    return choice
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best coding the client accepts.
+
+    zstd and brotli are offered when their packages are installed, gzip
+    always. Bodies sent in one piece are compressed only above minimum_size,
+    since a few hundred bytes gain nothing on the wire. Streamed bodies,
+    Server-Sent Events in particular, are compressed chunk by chunk and
+    flushed after each one so every event reaches the client as soon as it
+    is sent. Responses that already carry a Content-Encoding, or whose type
+    is not text-like, pass through untouched. A strong ETag on a response
+    that gets compressed is marked weak, since the bytes sent are no longer
+    the ones it names.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders(gzip_level, brotli_quality, zstd_level)
+        self.supported = list(self.encoders)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        coding = negotiate(accept_encoding, self.supported) if accept_encoding else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingSend(send, coding, self.encoders[coding], self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressingSend:
+    """The send channel for one response, deciding on compression when the first body chunk arrives"""
+
+    def __init__(self, send, coding: str, encoder_factory: Callable[[], Encoder], minimum_size: int):
+        self.send = send
+        self.coding = coding
+        self.encoder_factory = encoder_factory
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder: Optional[Encoder] = None
+        self.passthrough = False
+
+    def _start_compressing(self) -> None:
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.coding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        if "content-length" in headers:
+            del headers["content-length"]
+        self.encoder = self.encoder_factory()
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            self.start_message = message
+            if "content-encoding" in headers or not media_type.startswith(COMPRESSIBLE_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            elif media_type == EVENT_STREAM:
+                # Events must not wait for a first body chunk, or for each other
+                self._start_compressing()
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self._start_compressing()
+            if not more_body:
+                # The whole body at once: compress it in one go and keep an exact Content-Length
+                body = self.encoder.compress(body) + self.encoder.finish()
+                headers = MutableHeaders(raw=self.start_message["headers"])
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+            await self.send(self.start_message)
+
+        if more_body:
+            compressed = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            compressed = self.encoder.compress(body) + self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+
+def compression_settings() -> Optional[Dict[str, int]]:
+    """
+    CompressionMiddleware options from COMPRESSION, COMPRESSION_MIN_SIZE,
+    COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY and COMPRESSION_ZSTD_LEVEL;
+    None when compression is turned off.
+    """
+    if not env_flag("COMPRESSION", default=True):
+        return None
+    return {
+        "minimum_size": int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+        "gzip_level": int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        "brotli_quality": int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+        "zstd_level": int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    }
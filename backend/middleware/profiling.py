@@ -0,0 +1,58 @@
+from services.profiling import get_profiler
+from services.tracing import current_span
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when it carries the admin token, or when it is sampled.
+
+    The profile id is the request's trace id, returned in X-Profile-Id so the
+    profile can be fetched from /debug/profiles/{id} once the response is
+    complete. Requests are passed through untouched while profiling is off.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = get_profiler()
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        token = dict(scope.get("headers") or []).get(PROFILE_TOKEN_HEADER)
+        span = current_span()
+        profiler.request_started()
+        profile = profiler.start(
+            f"{scope['method']} {scope['path']}",
+            token=token.decode("latin-1") if token else None,
+            profile_id=span.trace_id if span is not None else None
+        )
+        if profile is None:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.request_finished()
+            return
+
+        status_code = 500
+
+        async def profiled_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER, profile.id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            profiler.request_finished()
+            route = getattr(scope.get("route"), "path", None)
+            profiler.finish(profile, name=f"{scope['method']} {route}" if route else None, status_code=status_code)
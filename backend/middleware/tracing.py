@@ -0,0 +1,52 @@
+from services.tracing import STATUS_ERROR, STATUS_OK, bind_span, reset_span, start_root_span
+
+TRACE_ID_HEADER = b"x-trace-id"
+
+
+class TracingMiddleware:
+    """
+    Open a root span per request and return its trace id in X-Trace-Id.
+
+    An incoming W3C traceparent header continues the caller's trace. The span
+    is renamed to the matched route template once routing has happened.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent")
+        span = start_root_span(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent.decode("latin-1") if traceparent else None,
+            **{"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        status_code = 500
+
+        async def traced_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (TRACE_ID_HEADER, span.trace_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        reset = bind_span(span)
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            reset_span(reset)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                span.name = f"{scope['method']} {route}"
+                span.set_attribute("http.route", route)
+            span.set_attribute("http.status_code", status_code)
+            span.set_status(STATUS_ERROR if status_code >= 500 else STATUS_OK)
+            span.end()
@@ -46,6 +46,30 @@ class Destination(BaseModel):
     highlights: List[str]
     best_time_to_visit: str
     estimated_cost: Dict[str, Any]  # {"budget": "$$", "range": "1000-2000"}
+    ideal_days: Optional[List[int]] = None  # [shortest, longest] worthwhile stay, e.g. [3, 5]
+
+
+class DestinationList(BaseModel):
+    destinations: List[Destination]
+    total: int  # All matches, not just this page
+    search: Optional[str] = None
+    limit: int
+    offset: int = 0
+    facets: Dict[str, Dict[str, int]] = {}  # {"country": {"France": 12}, "tags": {"Culture": 30}}
+
+
+class PopularDestinations(BaseModel):
+    success: bool = True
+    data: List[Destination]
+    total: int
+    limit: int
+
+
+class DestinationDetails(BaseModel):
+    destination: Destination
+    ai_insights: Dict[str, Any]
+    place_details: Dict[str, Any]
+    missing: List[str] = []  # Sections that failed or did not finish in time, e.g. ["ai_insights"]
 
 
 # Trip and Itinerary Models
@@ -140,6 +164,17 @@ class ItineraryResponse(BaseModel):
     travel_tips: Optional[List[str]] = None
 
 
+class GeneratedItineraryResponse(ResponseBase):
+    itinerary: List[ItineraryDay]
+    place_details: PlaceDetails
+    travel_tips: List[str] = []
+    total_estimated_cost: Optional[str] = None
+    description: str
+    # Set when admission control answered without calling Gemini
+    degraded: bool = False
+    source: Optional[str] = None
+
+
 # Trip Storage Models
 class SavedTrip(BaseModel):
     id: str
@@ -180,6 +215,10 @@ class ReviewSummary(BaseModel):
     rating_breakdown: Optional[Dict[str, float]] = None
 
 
+class ReviewSummaryResponse(BaseModel):
+    summary: ReviewSummary
+
+
 # Configuration Models
 class MapsConfig(BaseModel):
     mapsApiKey: str
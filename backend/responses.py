@@ -0,0 +1,137 @@
+"""
+JSON response classes for the API.
+
+FastJSONResponse is the app's default response class: it renders with
+orjson when that is installed, and with the stdlib json module (with the same
+output as Starlette's JSONResponse) otherwise. ModelResponse writes a
+Pydantic model straight to JSON with model_dump_json, so a route that
+returns one skips FastAPI's jsonable_encoder pass and any dict round trip.
+
+Routes serving catalog data that only changes with a deploy keep their
+serialized bodies in a BodyCache and answer through cached_response, which
+adds a strong ETag and Cache-Control and turns a matching If-None-Match
+into a bodiless 304.
+"""
+import hashlib
+import json
+from typing import Any, Callable, Hashable, Mapping, NamedTuple, Optional, Union
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from services.cache import TTLCache
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; everything still works on the stdlib encoder
+    orjson = None
+
+
+def _encode_default(value: Any) -> Any:
+    """Types neither encoder handles natively: nested Pydantic models, sets and tuples"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_encode_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=_encode_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ModelResponse(Response):
+    """A Pydantic model serialized by Pydantic itself"""
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: BaseModel,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None
+    ):
+        super().__init__(content, status_code, headers, self.media_type, background)
+
+    def render(self, content: BaseModel) -> bytes:
+        return content.model_dump_json().encode("utf-8")
+
+
+def content_version(content: Any) -> str:
+    """A fingerprint of JSON-serializable data, for telling when a cached body is out of date"""
+    return hashlib.blake2b(dumps(content), digest_size=16).hexdigest()
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def render_body(content: Union[BaseModel, Any]) -> CachedBody:
+    body = content.model_dump_json().encode("utf-8") if isinstance(content, BaseModel) else dumps(content)
+    return CachedBody(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+class BodyCache:
+    """
+    Serialized response bodies keyed by route and parameters.
+
+    Each body is stored with the version of the data it was rendered from;
+    get() renders it again only when the caller passes a different version.
+    Keys include free-form query parameters, so the cache is bounded LRU.
+    """
+
+    def __init__(self, max_entries: int = 512, name: Optional[str] = "response_body"):
+        self._bodies = TTLCache(max_entries=max_entries, ttl_seconds=float("inf"), name=name)
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Union[BaseModel, Any]]) -> CachedBody:
+        entry = self._bodies.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        cached = render_body(build())
+        self._bodies.set(key, (version, cached))
+        return cached
+
+    def clear(self) -> None:
+        self._bodies.clear()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match comparison, which is weak by definition: W/"x" matches "x",
+    so copies the compression middleware marked weak still revalidate.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def cached_response(request: Request, cached: CachedBody, cache_control: str) -> Response:
+    """The cached body with its validators, or 304 Not Modified when the client already has it"""
+    headers = {"ETag": cached.etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
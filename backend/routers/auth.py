@@ -1,30 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from typing import Optional
 import uuid
 from datetime import datetime, timedelta
 import jwt
 from models import User, UserProfile
+from services.container import get_state_store, get_rate_limiter
+from services.state_store import StateStore
+from services.rate_limit import RateLimiter, RateLimitResult
+from settings import env_flag
 
 router = APIRouter()
 
-# Mock user storage (in production, use a proper database)
-users_db = {}
-sessions_db = {}
+# User and session state lives in the shared state store so every worker sees it
+USERS = "users"
+USER_EMAILS = "user_emails"
+AUTH_SESSIONS = "auth_sessions"
 
 # JWT settings (in production, use proper secrets)
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Only behind a proxy that sets X-Forwarded-For (e.g. Railway) should the header be trusted
+TRUST_FORWARDED_FOR = env_flag("RATE_LIMIT_TRUST_FORWARDED")
+
 @router.post("/register")
-def register_user(name: str, email: str, location: Optional[str] = None):
+def register_user(
+    name: str,
+    email: str,
+    location: Optional[str] = None,
+    store: StateStore = Depends(get_state_store)
+):
     """Register a new user"""
     user_id = str(uuid.uuid4())
     
     # Check if user already exists (by email)
-    for uid, user_data in users_db.items():
-        if user_data.get("email") == email:
-            raise HTTPException(status_code=400, detail="User already exists")
+    if store.get(USER_EMAILS, email) is not None:
+        raise HTTPException(status_code=400, detail="User already exists")
     
     # Create user profile
     initials = "".join([word[0].upper() for word in name.split()[:2]])
@@ -37,13 +49,14 @@ def register_user(name: str, email: str, location: Optional[str] = None):
     user = User(id=user_id, profile=profile)
     
     # Store user data
-    users_db[user_id] = {
+    store.set(USERS, user_id, {
         "id": user_id,
         "email": email,
         "profile": profile.dict(),
-        "created_at": datetime.now(),
+        "created_at": datetime.now().isoformat(),
         "last_login": None
-    }
+    })
+    store.set(USER_EMAILS, email, user_id)
     
     return {
         "user": user,
@@ -51,23 +64,18 @@ def register_user(name: str, email: str, location: Optional[str] = None):
     }
 
 @router.post("/login")
-def login_user(email: str):
+def login_user(email: str, store: StateStore = Depends(get_state_store)):
     """Simple login by email (in production, add proper authentication)"""
     # Find user by email
-    user_data = None
-    user_id = None
-    
-    for uid, data in users_db.items():
-        if data.get("email") == email:
-            user_data = data
-            user_id = uid
-            break
+    user_id = store.get(USER_EMAILS, email)
+    user_data = store.get(USERS, user_id) if user_id else None
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Update last login
-    user_data["last_login"] = datetime.now()
+    user_data["last_login"] = datetime.now().isoformat()
+    store.set(USERS, user_id, user_data)
     
     # Create access token
     access_token_expires = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -79,11 +87,11 @@ def login_user(email: str):
     
     # Store session
     session_id = str(uuid.uuid4())
-    sessions_db[session_id] = {
+    store.set(AUTH_SESSIONS, session_id, {
         "user_id": user_id,
         "access_token": access_token,
-        "expires_at": access_token_expires
-    }
+        "expires_at": access_token_expires.isoformat()
+    }, ttl_seconds=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
     
     # Create user object
     profile = UserProfile(**user_data["profile"])
@@ -97,12 +105,12 @@ def login_user(email: str):
     }
 
 @router.get("/profile/{user_id}")
-def get_user_profile(user_id: str):
+def get_user_profile(user_id: str, store: StateStore = Depends(get_state_store)):
     """Get user profile information"""
-    if user_id not in users_db:
+    user_data = store.get(USERS, user_id)
+    if user_data is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_data = users_db[user_id]
     profile = UserProfile(**user_data["profile"])
     user = User(id=user_id, profile=profile)
     
@@ -113,12 +121,17 @@ def get_user_profile(user_id: str):
     }
 
 @router.put("/profile/{user_id}")
-def update_user_profile(user_id: str, name: Optional[str] = None, location: Optional[str] = None):
+def update_user_profile(
+    user_id: str,
+    name: Optional[str] = None,
+    location: Optional[str] = None,
+    store: StateStore = Depends(get_state_store)
+):
     """Update user profile"""
-    if user_id not in users_db:
+    user_data = store.get(USERS, user_id)
+    if user_data is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_data = users_db[user_id]
     profile_data = user_data["profile"]
     
     # Update fields if provided
@@ -130,7 +143,8 @@ def update_user_profile(user_id: str, name: Optional[str] = None, location: Opti
         profile_data["location"] = location
     
     # Save updated data
-    users_db[user_id]["profile"] = profile_data
+    user_data["profile"] = profile_data
+    store.set(USERS, user_id, user_data)
     
     # Return updated user
     profile = UserProfile(**profile_data)
@@ -142,22 +156,21 @@ def update_user_profile(user_id: str, name: Optional[str] = None, location: Opti
     }
 
 @router.post("/logout")
-def logout_user(session_id: str):
+def logout_user(session_id: str, store: StateStore = Depends(get_state_store)):
     """Logout user and invalidate session"""
-    if session_id in sessions_db:
-        del sessions_db[session_id]
+    store.delete(AUTH_SESSIONS, session_id)
     
     return {"message": "Logged out successfully"}
 
 @router.get("/verify-token")
-def verify_token(token: str):
+def verify_token(token: str, store: StateStore = Depends(get_state_store)):
     """Verify if an access token is valid"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
+        user_data = store.get(USERS, user_id) if user_id else None
         
-        if user_id and user_id in users_db:
-            user_data = users_db[user_id]
+        if user_data:
             profile = UserProfile(**user_data["profile"])
             user = User(id=user_id, profile=profile)
             
@@ -170,18 +183,18 @@ def verify_token(token: str):
             
     except jwt.ExpiredSignatureError:
         return {"valid": False, "error": "Token expired"}
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         return {"valid": False, "error": "Invalid token"}
 
 # Dependency for authenticated routes
-def get_current_user(token: str):
+def get_current_user(token: str, store: StateStore = Depends(get_state_store)):
     """Get current user from token (for use as dependency)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
+        user_data = store.get(USERS, user_id) if user_id else None
         
-        if user_id and user_id in users_db:
-            user_data = users_db[user_id]
+        if user_data:
             profile = UserProfile(**user_data["profile"])
             return User(id=user_id, profile=profile)
         else:
@@ -189,5 +202,47 @@ def get_current_user(token: str):
             
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+def _client_address(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def _caller_identity(request: Request, store: StateStore) -> str:
+    """Rate limit key: the signed-in user's id, or else the client address"""
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else request.query_params.get("token")
+    if token:
+        try:
+            return f"user:{get_current_user(token, store).id}"
+        except HTTPException:
+            pass
+    return f"ip:{_client_address(request)}"
+
+def charge_caller(endpoint: str, request: Request, store: StateStore, limiter: RateLimiter) -> RateLimitResult:
+    """Take the endpoint's cost from the caller's token bucket"""
+    return limiter.take(endpoint, _caller_identity(request, store))
+
+def rate_limit(endpoint: str):
+    """Dependency charging the endpoint's cost to the caller's token bucket (429 once it is empty)"""
+    def dependency(
+        request: Request,
+        response: Response,
+        store: StateStore = Depends(get_state_store),
+        limiter: RateLimiter = Depends(get_rate_limiter)
+    ):
+        result = charge_caller(endpoint, request, store, limiter)
+        headers = {
+            "RateLimit-Limit": str(result.limit),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(result.reset_seconds)
+        }
+        if not result.allowed:
+            headers["Retry-After"] = str(result.retry_after)
+            raise HTTPException(status_code=429, detail="Rate limit exceeded, please slow down", headers=headers)
+        response.headers.update(headers)
+    return dependency
@@ -1,15 +1,16 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from services.maps_service import MapsService
 from services.gemini_service import GeminiService
+from services.container import get_gemini_service, get_maps_service
 from models import MapsConfig, AppConfig
+from responses import BodyCache, cached_response
 
 router = APIRouter()
 
-def get_maps_service() -> MapsService:
-    return MapsService()
-
-def get_gemini_service() -> GeminiService:
-    return GeminiService()
+# Features follow service health, so keep CDN copies short-lived
+APP_CONFIG_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+APP_VERSION = "2.0.0"
+_bodies = BodyCache()
 
 @router.get("/maps-key", response_model=MapsConfig)
 def get_maps_key(maps_service: MapsService = Depends(get_maps_service)):
@@ -18,6 +19,7 @@ def get_maps_key(maps_service: MapsService = Depends(get_maps_service)):
 
 @router.get("/app", response_model=AppConfig)
 def get_app_config(
+    request: Request,
     maps_service: MapsService = Depends(get_maps_service),
     gemini_service: GeminiService = Depends(get_gemini_service)
 ):
@@ -27,9 +29,12 @@ def get_app_config(
         features.append("Google Maps Integration")
     if gemini_service.is_healthy():
         features.append("AI-Powered Planning")
+    api_key = maps_service.get_api_key()
     
-    return AppConfig(
-        maps=MapsConfig(mapsApiKey=maps_service.get_api_key()),
+    # Rendered again only when the key or the set of healthy services changes
+    cached = _bodies.get("app", (api_key, tuple(features)), lambda: AppConfig(
+        maps=MapsConfig(mapsApiKey=api_key),
         features=features,
-        version="2.0.0"
-    )
\ No newline at end of file
+        version=APP_VERSION
+    ))
+    return cached_response(request, cached, APP_CONFIG_CACHE_CONTROL)
@@ -1,140 +1,23 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from typing import Any, Callable, Dict, List, Optional
 from services.maps_service import MapsService
 from services.gemini_service import GeminiService
-from models import Destination, SavedTrip, User, UserProfile
+from services.container import get_catalog, get_gemini_service, get_knowledge, get_maps_service, get_gemini_pool, get_maps_pool
+from services.catalog import DestinationCatalog
+from services.knowledge import KnowledgePacks
+from services.bulkhead import Bulkhead, BulkheadFull
+from models import Destination, DestinationDetails, DestinationList, PopularDestinations, SavedTrip, User, UserProfile
+from responses import BodyCache, ModelResponse, cached_response, content_version
+import asyncio
+import logging
+import os
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-def get_maps_service() -> MapsService:
-    return MapsService()
-
-def get_gemini_service() -> GeminiService:
-    return GeminiService()
-
-# Sample destination data with UHD images for the frontend
-DESTINATIONS_DATA = [
-    {
-        "id": "paris-france",
-        "name": "Paris, France",
-        "country": "France",
-        "description": "The City of Light, known for its art, fashion, gastronomy, and culture.",
-        "images": {
-            "hero": "https://images.unsplash.com/photo-1502602898536-47ad22581b52?w=3840&h=2160&fit=crop&auto=format&q=95",
-            "slideshow": [
-                "https://images.unsplash.com/photo-1502602898536-47ad22581b52?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1511739001486-6bfe10ce785f?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1539650116574-75c0c6d41b12?w=3840&h=2160&fit=crop&auto=format&q=95"
-            ],
-            "thumbnail": "https://images.unsplash.com/photo-1502602898536-47ad22581b52?w=800&h=600&fit=crop&auto=format&q=95"
-        },
-        "videos": {
-            "hero": "https://sample-videos.com/zip/10/mp4/720/mp4/SampleVideo_720x480_1mb.mp4",
-            "thumbnail": "https://images.unsplash.com/photo-1502602898536-47ad22581b52?w=400&h=300&fit=crop&auto=format&q=95"
-        },
-        "rating": 4.8,
-        "tags": ["Culture", "Art", "Romance", "History"],
-        "highlights": ["Eiffel Tower", "Louvre Museum", "Notre-Dame", "Seine River"],
-        "best_time_to_visit": "April to June, September to October",
-        "estimated_cost": {"budget": "$$", "range": "1500-2500"}
-    },
-    {
-        "id": "tokyo-japan",
-        "name": "Tokyo, Japan",
-        "country": "Japan",
-        "description": "A vibrant metropolis blending traditional culture with cutting-edge technology.",
-        "images": {
-            "hero": "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=3840&h=2160&fit=crop&auto=format&q=95",
-            "slideshow": [
-                "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1513407030348-c983a97b98d8?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1503899036084-c55cdd92da26?w=3840&h=2160&fit=crop&auto=format&q=95"
-            ],
-            "thumbnail": "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=800&h=600&fit=crop&auto=format&q=95"
-        },
-        "videos": {
-            "hero": "https://sample-videos.com/zip/10/mp4/720/mp4/SampleVideo_720x480_1mb.mp4",
-            "thumbnail": "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=400&h=300&fit=crop&auto=format&q=95"
-        },
-        "rating": 4.7,
-        "tags": ["Technology", "Culture", "Food", "Modern"],
-        "highlights": ["Shibuya Crossing", "Tokyo Tower", "Sensoji Temple", "Tsukiji Market"],
-        "best_time_to_visit": "March to May, September to November",
-        "estimated_cost": {"budget": "$$$", "range": "2000-3500"}
-    },
-    {
-        "id": "santorini-greece",
-        "name": "Santorini, Greece",
-        "country": "Greece",
-        "description": "A stunning island known for its white-washed buildings and breathtaking sunsets.",
-        "images": {
-            "hero": "https://images.unsplash.com/photo-1570077188670-e3a8d69ac5ff?w=3840&h=2160&fit=crop&auto=format&q=95",
-            "slideshow": [
-                "https://images.unsplash.com/photo-1570077188670-e3a8d69ac5ff?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1613395877344-13d4a8e0d49e?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=3840&h=2160&fit=crop&auto=format&q=95"
-            ],
-            "thumbnail": "https://images.unsplash.com/photo-1570077188670-e3a8d69ac5ff?w=800&h=600&fit=crop&auto=format&q=95"
-        },
-        "videos": {
-            "hero": "https://sample-videos.com/zip/10/mp4/720/mp4/SampleVideo_720x480_1mb.mp4",
-            "thumbnail": "https://images.unsplash.com/photo-1570077188670-e3a8d69ac5ff?w=400&h=300&fit=crop&auto=format&q=95"
-        },
-        "rating": 4.9,
-        "tags": ["Romance", "Sunset", "Architecture", "Island"],
-        "highlights": ["Oia Village", "Red Beach", "Blue Dome Churches", "Wine Tasting"],
-        "best_time_to_visit": "April to early November",
-        "estimated_cost": {"budget": "$$", "range": "1800-3000"}
-    },
-    {
-        "id": "bali-indonesia",
-        "name": "Bali, Indonesia",
-        "country": "Indonesia",
-        "description": "A tropical paradise known for its rice terraces, temples, and vibrant culture.",
-        "images": {
-            "hero": "https://images.unsplash.com/photo-1537953773345-d172ccf13cf1?w=3840&h=2160&fit=crop&auto=format&q=95",
-            "slideshow": [
-                "https://images.unsplash.com/photo-1537953773345-d172ccf13cf1?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1518548419970-58e3b4079ab2?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1558007385-37f5ac7c7fca?w=3840&h=2160&fit=crop&auto=format&q=95"
-            ],
-            "thumbnail": "https://images.unsplash.com/photo-1537953773345-d172ccf13cf1?w=800&h=600&fit=crop&auto=format&q=95"
-        },
-        "videos": {
-            "hero": "https://sample-videos.com/zip/10/mp4/720/mp4/SampleVideo_720x480_1mb.mp4",
-            "thumbnail": "https://images.unsplash.com/photo-1537953773345-d172ccf13cf1?w=400&h=300&fit=crop&auto=format&q=95"
-        },
-        "rating": 4.6,
-        "tags": ["Tropical", "Culture", "Wellness", "Adventure"],
-        "highlights": ["Tegallalang Rice Terraces", "Uluwatu Temple", "Mount Batur", "Ubud"],
-        "best_time_to_visit": "April to October",
-        "estimated_cost": {"budget": "$", "range": "800-1500"}
-    },
-    {
-        "id": "new-york-usa",
-        "name": "New York City, USA",
-        "country": "United States",
-        "description": "The city that never sleeps, filled with iconic landmarks and endless possibilities.",
-        "images": {
-            "hero": "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=3840&h=2160&fit=crop&auto=format&q=95",
-            "slideshow": [
-                "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1485871981521-5b1fd3805eee?w=3840&h=2160&fit=crop&auto=format&q=95",
-                "https://images.unsplash.com/photo-1514565131-fce0801e5785?w=3840&h=2160&fit=crop&auto=format&q=95"
-            ],
-            "thumbnail": "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=800&h=600&fit=crop&auto=format&q=95"
-        },
-        "videos": {
-            "hero": "https://sample-videos.com/zip/10/mp4/720/mp4/SampleVideo_720x480_1mb.mp4",
-            "thumbnail": "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=400&h=300&fit=crop&auto=format&q=95"
-        },
-        "rating": 4.5,
-        "tags": ["Urban", "Entertainment", "Shopping", "Museums"],
-        "highlights": ["Statue of Liberty", "Central Park", "Times Square", "Brooklyn Bridge"],
-        "best_time_to_visit": "April to June, September to November",
-        "estimated_cost": {"budget": "$$$", "range": "2500-4000"}
-    }
-]
+# Each section of /destinations/{id} gets its own budget; whatever is late is left out and listed in `missing`
+INSIGHTS_TIMEOUT = float(os.getenv("DESTINATION_INSIGHTS_TIMEOUT_SECONDS", "10"))
+PLACE_DETAILS_TIMEOUT = float(os.getenv("DESTINATION_PLACE_TIMEOUT_SECONDS", "5"))
 
 # Sample popular trips data
 POPULAR_TRIPS_DATA = [
@@ -172,112 +55,178 @@ POPULAR_TRIPS_DATA = [
     }
 ]
 
-@router.get("/", response_model=dict)
+# Catalog responses are rendered once per data version and revalidated by ETag;
+# stale-while-revalidate lets a CDN keep serving while it refetches
+CATALOG_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=86400"
+TRIPS_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=3600"
+TRIPS_VERSION = content_version(POPULAR_TRIPS_DATA)
+_bodies = BodyCache()
+
+@router.get("/", response_model=DestinationList)
 def get_destinations(
+    request: Request,
     limit: int = Query(default=10, ge=1, le=50),
     search: Optional[str] = Query(default=None),
-    maps_service: MapsService = Depends(get_maps_service)
+    country: Optional[str] = Query(default=None),
+    tag: List[str] = Query(default=[]),
+    offset: int = Query(default=0, ge=0),
+    catalog: DestinationCatalog = Depends(get_catalog)
 ):
-    """Get popular destinations with optional search and limit"""
-    destinations = DESTINATIONS_DATA.copy()
-    
-    # Apply search filter if provided
-    if search:
-        search_lower = search.lower()
-        destinations = [
-            dest for dest in destinations 
-            if search_lower in dest["name"].lower() or 
-               search_lower in dest["country"].lower() or
-               any(search_lower in tag.lower() for tag in dest["tags"])
-        ]
-    
-    # Apply limit
-    destinations = destinations[:limit]
-    
-    return {
-        "destinations": destinations,
-        "total": len(destinations),
-        "search": search,
-        "limit": limit
-    }
+    """Search destinations by name, country or tag (prefix and typo tolerant), best rated first, with facet counts"""
+    key = ("destinations", search, country, tuple(tag), offset, limit)
+    cached = _bodies.get(key, catalog.version, lambda: _list_destinations(catalog, search, country, tag, offset, limit))
+    return cached_response(request, cached, CATALOG_CACHE_CONTROL)
+
+def _list_destinations(
+    catalog: DestinationCatalog,
+    search: Optional[str],
+    country: Optional[str],
+    tags: List[str],
+    offset: int,
+    limit: int
+) -> DestinationList:
+    result = catalog.search(search, country=country, tags=tags, offset=offset, limit=limit)
+    return DestinationList(
+        destinations=result.destinations,
+        total=result.total,
+        search=search,
+        limit=limit,
+        offset=offset,
+        facets=result.facets
+    )
 
-@router.get("/popular", response_model=dict)
+@router.get("/popular", response_model=PopularDestinations)
 def get_popular_destinations(
+    request: Request,
     limit: int = Query(default=5, ge=1, le=20),
-    maps_service: MapsService = Depends(get_maps_service)
+    country: Optional[str] = Query(default=None),
+    catalog: DestinationCatalog = Depends(get_catalog)
 ):
     """Get most popular destinations for video carousel"""
-    # Sort by rating and return top destinations
-    popular_destinations = sorted(DESTINATIONS_DATA, key=lambda x: x["rating"], reverse=True)[:limit]
-    
-    return {
-        "success": True,
-        "data": popular_destinations,
-        "total": len(popular_destinations),
-        "limit": limit
-    }
+    cached = _bodies.get(("popular", limit, country), catalog.version, lambda: _popular_destinations(catalog, limit, country))
+    return cached_response(request, cached, CATALOG_CACHE_CONTROL)
+
+def _popular_destinations(catalog: DestinationCatalog, limit: int, country: Optional[str]) -> PopularDestinations:
+    popular_destinations = catalog.popular(limit, country)
+    return PopularDestinations(
+        data=popular_destinations,
+        total=len(popular_destinations),
+        limit=limit
+    )
 
-@router.get("/{destination_id}", response_model=dict)
-def get_destination_details(
+@router.get("/{destination_id}", response_model=DestinationDetails)
+async def get_destination_details(
+    request: Request,
     destination_id: str,
     gemini_service: GeminiService = Depends(get_gemini_service),
-    maps_service: MapsService = Depends(get_maps_service)
+    maps_service: MapsService = Depends(get_maps_service),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    maps_pool: Bulkhead = Depends(get_maps_pool),
+    catalog: DestinationCatalog = Depends(get_catalog),
+    knowledge: KnowledgePacks = Depends(get_knowledge)
 ):
     """Get detailed information about a specific destination"""
-    # Find destination in our data
-    destination = next((dest for dest in DESTINATIONS_DATA if dest["id"] == destination_id), None)
+    destination = catalog.get(destination_id)
     
     if not destination:
         raise HTTPException(status_code=404, detail="Destination not found")
     
-    # Get AI-powered insights if Gemini is available
-    ai_insights = {}
-    if gemini_service.is_healthy():
-        try:
-            ai_insights = gemini_service.get_destination_insights(destination["name"])
-        except Exception as e:
-            ai_insights = {"error": f"Could not fetch AI insights: {str(e)}"}
-    
-    # Get place details from Google Maps if available
-    place_details = {}
-    if maps_service.is_healthy():
-        try:
-            search_result = maps_service.search_places(destination["name"])
-            if search_result.get("results"):
-                place_id = search_result["results"][0]["place_id"]
-                place_details = maps_service.get_place_details(place_id)
-        except Exception as e:
-            place_details = {"error": f"Could not fetch place details: {str(e)}"}
+    # A complete knowledge pack answers without calling Gemini or Maps, and only changes with the pack file
+    pack = knowledge.get(destination_id)
+    if pack and pack.get("insights") and pack.get("place"):
+        version = (catalog.version, knowledge.version)
+        cached = _bodies.get(("details", destination_id), version, lambda: _packed_details(destination, pack, maps_service))
+        return cached_response(request, cached, CATALOG_CACHE_CONTROL)
     
-    return {
-        "destination": destination,
-        "ai_insights": ai_insights,
-        "place_details": place_details
-    }
+    # Gemini and Maps are independent, so the response takes as long as the slower one, not both
+    ai_insights, place_details = await asyncio.gather(
+        _fetch_section("ai_insights", gemini_pool, INSIGHTS_TIMEOUT, _get_insights, destination, gemini_service),
+        _fetch_section("place_details", maps_pool, PLACE_DETAILS_TIMEOUT, _get_place_details, destination, maps_service)
+    )
+    # Empty means the upstream was down or found nothing, which is just as missing as an error
+    missing = [
+        name for name, section in (("ai_insights", ai_insights), ("place_details", place_details))
+        if not section or "error" in section
+    ]
+    return ModelResponse(DestinationDetails(
+        destination=destination,
+        ai_insights=ai_insights or {},
+        place_details=place_details or {},
+        missing=missing
+    ))
+
+def _packed_details(destination: Destination, pack: Dict[str, Any], maps_service: MapsService) -> DestinationDetails:
+    # Packs keep photo references; the URLs carry this deployment's API key
+    photos = [maps_service.get_photo_url(reference) for reference in pack["place"]["photos"]]
+    place = {**pack["place"], "photos": [url for url in photos if url]}
+    return DestinationDetails(destination=destination, ai_insights=pack["insights"], place_details=place)
+
+async def _fetch_section(
+    name: str,
+    pool: Bulkhead,
+    timeout: float,
+    fn: Callable[..., Dict[str, Any]],
+    *args: Any
+) -> Optional[Dict[str, Any]]:
+    """One section of the details response, or None if its pool is full or it runs past timeout"""
+    try:
+        return await asyncio.wait_for(pool.submit(fn, *args), timeout)
+    except asyncio.TimeoutError:
+        # The call keeps running in its pool; a late Gemini answer still fills the insights cache
+        logger.warning(f"Destination {name} did not finish within {timeout:g}s, responding without it")
+    except BulkheadFull:
+        logger.warning(f"{pool.name} pool is full, responding without destination {name}")
+    return None
+
+def _get_insights(destination: Destination, gemini_service: GeminiService) -> Dict[str, Any]:
+    # Get AI-powered insights if Gemini is available
+    if not gemini_service.is_healthy():
+        return {}
+    try:
+        return gemini_service.get_destination_insights(destination.name)
+    except Exception as e:
+        return {"error": f"Could not fetch AI insights: {str(e)}"}
+
+def _get_place_details(destination: Destination, maps_service: MapsService) -> Dict[str, Any]:
+    # Get place details from Google Maps if available; details need the place id from the search
+    if not maps_service.is_healthy():
+        return {}
+    try:
+        search_result = maps_service.search_places(destination.name)
+        if search_result.get("results"):
+            place_id = search_result["results"][0]["place_id"]
+            return maps_service.get_place_details(place_id)
+        return {}
+    except Exception as e:
+        return {"error": f"Could not fetch place details: {str(e)}"}
 
 @router.get("/search/nearby")
-def search_nearby_attractions(
+async def search_nearby_attractions(
     location: str = Query(..., description="Location to search around"),
     radius: int = Query(default=5000, ge=100, le=50000),
     place_type: str = Query(default="tourist_attraction"),
-    maps_service: MapsService = Depends(get_maps_service)
+    maps_service: MapsService = Depends(get_maps_service),
+    maps_pool: Bulkhead = Depends(get_maps_pool)
 ):
     """Search for nearby attractions around a location"""
     if not maps_service.is_healthy():
         raise HTTPException(status_code=503, detail="Google Maps service not available")
     
+    pending = maps_pool.submit(maps_service.nearby_search, location, radius, place_type)
     try:
-        results = maps_service.nearby_search(location, radius, place_type)
+        results = await pending
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 @router.get("/trips/popular")
-def get_popular_trips():
+def get_popular_trips(request: Request):
     """Get popular trips shared by other users"""
-    return {"trips": POPULAR_TRIPS_DATA}
+    cached = _bodies.get("trips", TRIPS_VERSION, lambda: {"trips": POPULAR_TRIPS_DATA})
+    return cached_response(request, cached, TRIPS_CACHE_CONTROL)
 
 @router.get("/trips/recent")
-def get_recent_trips():
+def get_recent_trips(request: Request):
     """Get recent trips from users"""
-    return {"trips": POPULAR_TRIPS_DATA}
\ No newline at end of file
+    cached = _bodies.get("trips", TRIPS_VERSION, lambda: {"trips": POPULAR_TRIPS_DATA})
+    return cached_response(request, cached, TRIPS_CACHE_CONTROL)
\ No newline at end of file
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import Optional, List
 from pydantic import BaseModel
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, extract_json_block
 from services.maps_service import MapsService
+from services.container import get_gemini_service, get_maps_service, get_gemini_pool, get_admission
+from services.bulkhead import Bulkhead, BulkheadFull
+from services.admission import AdmissionController, DEGRADE
+from routers.auth import rate_limit
+from responses import FastJSONResponse
+from services.metrics import FALLBACKS
+from services.knowledge import lodging_grounding
+from services.resolver import name_key
 import json
 import logging
 import os
@@ -10,10 +18,6 @@ import os
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Initialize services
-gemini_service = GeminiService()
-maps_service = MapsService()
-
 class HotelSearchRequest(BaseModel):
     destination: str
     budget: Optional[str] = "medium"  # budget, medium, luxury
@@ -43,7 +47,7 @@ class Hotel(BaseModel):
     amenities: List[HotelAmenity]
     category: str  # budget, mid-range, luxury
 
-def get_hotel_images_from_maps(hotel_name: str, destination: str) -> List[str]:
+def get_hotel_images_from_maps(hotel_name: str, destination: str, maps_service: MapsService) -> List[str]:
     """Get hotel images from Google Maps Places API - simplified version"""
     try:
         # Check if Google Maps API key is configured
@@ -103,6 +107,15 @@ def get_hotel_images_from_maps(hotel_name: str, destination: str) -> List[str]:
         logger.error(f"❌ Error getting hotel images from Maps API: {e}")
         return get_fallback_images()
 
+def get_known_hotel_images(pack: Optional[dict], hotel_name: str, maps_service: MapsService) -> List[str]:
+    """Photos of a hotel in the destination's knowledge pack, saving the Maps search and details calls"""
+    key = name_key(hotel_name)
+    for hotel in (pack or {}).get("lodging") or []:
+        if name_key(hotel["name"]) == key:
+            photos = [maps_service.get_photo_url(reference) for reference in hotel.get("photo_references", [])[:3]]
+            return [url for url in photos if url]
+    return []
+
 def get_fallback_images() -> List[str]:
     """Get fallback hotel images from Unsplash"""
     return [
@@ -112,7 +125,7 @@ def get_fallback_images() -> List[str]:
     ]
 
 @router.get("/maps-status")
-async def get_maps_status():
+async def get_maps_status(maps_service: MapsService = Depends(get_maps_service)):
     """Check Google Maps API configuration status"""
     maps_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
     return {
@@ -121,18 +134,84 @@ async def get_maps_status():
         "api_key_length": len(maps_api_key) if maps_api_key else 0
     }
 
-@router.get("/recommendations")
+def to_frontend_hotel(hotel: Hotel, destination: str) -> dict:
+    """Convert a Hotel to the shape the frontend's hotel cards expect"""
+    return {
+        "id": hotel.id,
+        "name": hotel.name,
+        "description": hotel.description,
+        "summary": hotel.description[:100] + "..." if len(hotel.description) > 100 else hotel.description,
+        "rating": hotel.rating,
+        "reviewCount": hotel.reviewCount,
+        "pricePerNight": {
+            "currency": hotel.pricePerNight.get("currency", "USD"),
+            "amount": hotel.pricePerNight.get("amount", 150),
+            "basePrice": hotel.pricePerNight.get("amount", 150),
+            "taxes": 0,
+            "fees": 0
+        },
+        "images": hotel.images,
+        "location": {
+            "address": hotel.location.address,
+            "city": hotel.location.city,
+            "country": destination,
+            "coordinates": {
+                "latitude": hotel.location.latitude or 0,
+                "longitude": hotel.location.longitude or 0
+            },
+            "distanceFromCenter": {
+                "value": 2.0,
+                "unit": "km"
+            },
+            "nearbyAttractions": ["City Center", "Main Attractions"]
+        },
+        "amenities": [
+            {
+                "id": amenity.name.lower().replace(" ", "-"),
+                "name": amenity.name,
+                "category": "basic",
+                "description": amenity.name
+            } for amenity in hotel.amenities
+        ],
+        "roomTypes": [
+            {
+                "id": "standard",
+                "name": "Standard Room",
+                "capacity": 2,
+                "bedType": "King",
+                "size": 30,
+                "priceModifier": 1.0
+            }
+        ],
+        "policies": {
+            "checkIn": "15:00",
+            "checkOut": "11:00",
+            "cancellation": "Free cancellation up to 24 hours before check-in"
+        },
+        "category": hotel.category,
+        "availabilityStatus": "available"
+    }
+
+@router.get("/recommendations", dependencies=[Depends(rate_limit("hotels.recommendations"))])
 async def get_hotel_recommendations(
+    response: Response,
     destination: str = Query(..., description="Destination city or location"),
     budget: str = Query("medium", description="Budget level: budget, medium, luxury"),
     guests: int = Query(2, description="Number of guests"),
-    duration: int = Query(3, description="Duration of stay in days")
+    duration: int = Query(3, description="Duration of stay in days"),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    maps_service: MapsService = Depends(get_maps_service),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    admission: AdmissionController = Depends(get_admission)
 ):
     """Get AI-powered hotel recommendations for a destination"""
     import time
     request_start = time.time()
     logger.info(f"Hotel recommendation request: {destination}, budget: {budget}, guests: {guests}, duration: {duration}")
     
+    # Under overload, answer with static hotels instead of queueing for Gemini
+    degraded = admission.decide("hotels.recommendations") == DEGRADE
+    
     try:
         # Create hotel search request
         search_request = HotelSearchRequest(
@@ -142,84 +221,39 @@ async def get_hotel_recommendations(
             duration=duration
         )
         
-        # Generate hotel recommendations using AI
-        hotels = await generate_hotel_recommendations(search_request)
+        if degraded:
+            hotels = create_static_hotels(destination, budget)
+        else:
+            # Generate hotel recommendations using AI
+            # Runs on the Gemini pool so the event loop (and the disconnect watcher) stays free
+            hotels = await gemini_pool.run(generate_hotel_recommendations, search_request, gemini_service, maps_service)
         
         # Convert backend hotel format to frontend-compatible format
-        compatible_hotels = []
-        for hotel in hotels:
-            compatible_hotel = {
-                "id": hotel.id,
-                "name": hotel.name,
-                "description": hotel.description,
-                "summary": hotel.description[:100] + "..." if len(hotel.description) > 100 else hotel.description,
-                "rating": hotel.rating,
-                "reviewCount": hotel.reviewCount,
-                "pricePerNight": {
-                    "currency": hotel.pricePerNight.get("currency", "USD"),
-                    "amount": hotel.pricePerNight.get("amount", 150),
-                    "basePrice": hotel.pricePerNight.get("amount", 150),
-                    "taxes": 0,
-                    "fees": 0
-                },
-                "images": hotel.images,
-                "location": {
-                    "address": hotel.location.address,
-                    "city": hotel.location.city,
-                    "country": destination,
-                    "coordinates": {
-                        "latitude": hotel.location.latitude or 0,
-                        "longitude": hotel.location.longitude or 0
-                    },
-                    "distanceFromCenter": {
-                        "value": 2.0,
-                        "unit": "km"
-                    },
-                    "nearbyAttractions": ["City Center", "Main Attractions"]
-                },
-                "amenities": [
-                    {
-                        "id": amenity.name.lower().replace(" ", "-"),
-                        "name": amenity.name,
-                        "category": "basic",
-                        "description": amenity.name
-                    } for amenity in hotel.amenities
-                ],
-                "roomTypes": [
-                    {
-                        "id": "standard",
-                        "name": "Standard Room",
-                        "capacity": 2,
-                        "bedType": "King",
-                        "size": 30,
-                        "priceModifier": 1.0
-                    }
-                ],
-                "policies": {
-                    "checkIn": "15:00",
-                    "checkOut": "11:00",
-                    "cancellation": "Free cancellation up to 24 hours before check-in"
-                },
-                "category": hotel.category,
-                "availabilityStatus": "available"
-            }
-            compatible_hotels.append(compatible_hotel)
+        compatible_hotels = [to_frontend_hotel(hotel, destination) for hotel in hotels]
         
         request_time = time.time() - request_start
         logger.info(f"Hotel recommendation request completed in {request_time:.2f} seconds, returning {len(compatible_hotels)} hotels")
         
-        return {
+        # Already plain JSON types, so skip FastAPI's jsonable_encoder walk over every hotel
+        return FastJSONResponse({
             "success": True,
             "data": compatible_hotels,
             "destination": destination,
-            "total_hotels": len(compatible_hotels)
-        }
+            "total_hotels": len(compatible_hotels),
+            "degraded": degraded
+        }, headers=response.headers)
         
+    except BulkheadFull:
+        raise
     except Exception as e:
         logger.error(f"Error getting hotel recommendations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def generate_hotel_recommendations(search_request: HotelSearchRequest) -> List[Hotel]:
+def generate_hotel_recommendations(
+    search_request: HotelSearchRequest,
+    gemini_service: GeminiService,
+    maps_service: MapsService
+) -> List[Hotel]:
     """Generate hotel recommendations using Gemini AI"""
     import time
     start_time = time.time()
@@ -228,7 +262,30 @@ async def generate_hotel_recommendations(search_request: HotelSearchRequest) ->
     if not gemini_service.is_healthy():
         # Return fallback hotels if AI is not available
         logger.warning("Gemini AI not available, using fallback hotels")
-        return create_fallback_hotels(search_request.destination, search_request.budget)
+        return create_fallback_hotels(search_request.destination, search_request.budget, gemini_service, maps_service)
+    
+    # A knowledge pack lists real hotels with addresses and coordinates, so the model picks instead of recalling them
+    pack = gemini_service.knowledge_pack(search_request.destination)
+    # Spellings of one destination share the Maps lookups for hotel photos
+    destination = gemini_service.resolver.resolve(search_request.destination).name
+    known_hotels = lodging_grounding(pack) if pack else ""
+    if known_hotels:
+        instructions = f"""{known_hotels}
+
+**Instructions:**
+1. Choose the known hotels above that best fit the trip, adding other REAL hotels only if fewer than 6 fit
+2. Copy the name, address and coordinates of known hotels exactly
+3. Include a mix of hotel types and neighborhoods
+4. Provide realistic pricing from the price level and budget level"""
+    else:
+        instructions = f"""**Instructions:**
+1. Research and recommend REAL, EXISTING hotels in {search_request.destination}
+2. Include mix of hotel types (business, boutique, resort, chain hotels, etc.)
+3. Consider location convenience and local attractions
+4. Provide realistic pricing based on actual market rates
+5. Include variety in neighborhoods/areas within the destination
+6. Use actual hotel names that exist in the destination
+7. Provide realistic coordinates and addresses"""
     
     # Build comprehensive prompt for hotel recommendations
     prompt = f"""
@@ -241,14 +298,7 @@ You are a travel expert specializing in hotel recommendations. Generate a list o
 - Duration: {search_request.duration} days
 - Preferences: {', '.join(search_request.preferences) if search_request.preferences else 'None specified'}
 
-**Instructions:**
-1. Research and recommend REAL, EXISTING hotels in {search_request.destination}
-2. Include mix of hotel types (business, boutique, resort, chain hotels, etc.)
-3. Consider location convenience and local attractions
-4. Provide realistic pricing based on actual market rates
-5. Include variety in neighborhoods/areas within the destination
-6. Use actual hotel names that exist in the destination
-7. Provide realistic coordinates and addresses
+{instructions}
 
 **Response Format (MUST be valid JSON):**
 {{
@@ -299,17 +349,15 @@ Make sure the response is ONLY valid JSON without any additional text before or
     try:
         logger.info("Calling Gemini AI for hotel recommendations...")
         ai_start = time.time()
-        response = gemini_service.client.generate_content(prompt)
+        response = gemini_service.generate_content(prompt, "hotels")
         ai_time = time.time() - ai_start
         logger.info(f"Gemini AI response received in {ai_time:.2f} seconds")
         hotels_text = response.text
         
         # Parse the JSON response from Gemini
-        json_start = hotels_text.find('{')
-        json_end = hotels_text.rfind('}') + 1
+        json_text = extract_json_block(hotels_text)
         
-        if json_start != -1 and json_end != 0:
-            json_text = hotels_text[json_start:json_end]
+        if json_text is not None:
             try:
                 hotels_data = json.loads(json_text)
                 
@@ -319,7 +367,10 @@ Make sure the response is ONLY valid JSON without any additional text before or
                     try:
                         # Get real hotel images from Google Maps Places API
                         hotel_name = hotel_dict.get('name', '')
-                        images = get_hotel_images_from_maps(hotel_name, destination)
+                        images = (
+                            get_known_hotel_images(pack, hotel_name, maps_service)
+                            or get_hotel_images_from_maps(hotel_name, destination, maps_service)
+                        )
                         
                         hotel = Hotel(
                             id=hotel_dict['id'],
@@ -347,14 +398,20 @@ Make sure the response is ONLY valid JSON without any additional text before or
                 logger.error(f"JSON decode error: {e}")
                 
         # Fallback if AI parsing fails
-        return create_fallback_hotels(search_request.destination, search_request.budget)
+        return create_fallback_hotels(search_request.destination, search_request.budget, gemini_service, maps_service)
         
     except Exception as e:
         logger.error(f"Error generating hotel recommendations: {e}")
-        return create_fallback_hotels(search_request.destination, search_request.budget)
+        return create_fallback_hotels(search_request.destination, search_request.budget, gemini_service, maps_service)
 
-def get_ai_fallback_hotels(destination: str, budget: str) -> List[Hotel]:
+def get_ai_fallback_hotels(
+    destination: str,
+    budget: str,
+    gemini_service: GeminiService,
+    maps_service: MapsService
+) -> List[Hotel]:
     """Generate realistic hotel recommendations using Gemini AI as fallback"""
+    FALLBACKS.inc(component="hotels", strategy="ai_fallback")
     
     prompt = f"""
 You are a travel expert with access to real hotel data. Generate a list of 4-5 REAL, EXISTING hotels in {destination} for {budget} budget travelers.
@@ -413,15 +470,13 @@ Focus on providing REAL hotel names and accurate information for {destination}.
 """
 
     try:
-        response = gemini_service.client.generate_content(prompt)
+        response = gemini_service.generate_content(prompt, "hotels")
         hotels_text = response.text.strip()
         
         # Parse JSON response
-        json_start = hotels_text.find('{')
-        json_end = hotels_text.rfind('}') + 1
+        json_text = extract_json_block(hotels_text)
         
-        if json_start != -1 and json_end != 0:
-            json_text = hotels_text[json_start:json_end]
+        if json_text is not None:
             hotels_data = json.loads(json_text)
             
             # Convert to Hotel objects
@@ -430,7 +485,10 @@ Focus on providing REAL hotel names and accurate information for {destination}.
                 try:
                     # Get real hotel images from Google Maps Places API
                     hotel_name = hotel_dict.get('name', '')
-                    images = get_hotel_images_from_maps(hotel_name, destination)
+                    images = (
+                        get_known_hotel_images(gemini_service.knowledge_pack(destination), hotel_name, maps_service)
+                        or get_hotel_images_from_maps(hotel_name, gemini_service.resolver.resolve(destination).name, maps_service)
+                    )
                     
                     hotel = Hotel(
                         id=hotel_dict['id'],
@@ -457,16 +515,26 @@ Focus on providing REAL hotel names and accurate information for {destination}.
         logger.error(f"Error generating AI fallback hotels: {e}")
         raise e
 
-def create_fallback_hotels(destination: str, budget: str) -> List[Hotel]:
+def create_fallback_hotels(
+    destination: str,
+    budget: str,
+    gemini_service: GeminiService,
+    maps_service: MapsService
+) -> List[Hotel]:
     """Create AI-generated hotel recommendations as fallback"""
     
     # Try to use Gemini AI even in fallback mode for realistic hotel data
     if gemini_service.is_healthy():
         try:
-            return get_ai_fallback_hotels(destination, budget)
+            return get_ai_fallback_hotels(destination, budget, gemini_service, maps_service)
         except Exception as e:
             logger.warning(f"AI fallback failed, using static data: {e}")
     
+    return create_static_hotels(destination, budget)
+
+def create_static_hotels(destination: str, budget: str) -> List[Hotel]:
+    """Static hotel recommendations that need neither Gemini nor Maps"""
+    FALLBACKS.inc(component="hotels", strategy="static")
     # Determine price range based on budget
     price_ranges = {
         "budget": (60, 100),
@@ -565,7 +633,7 @@ def create_fallback_hotels(destination: str, budget: str) -> List[Hotel]:
     return hotels
 
 @router.get("/debug-maps")
-async def debug_google_maps():
+async def debug_google_maps(maps_service: MapsService = Depends(get_maps_service)):
     """Debug Google Maps photo integration step by step"""
     try:
         # Test the exact same logic used in get_hotel_images_from_maps
@@ -1,86 +1,146 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, List
 from services.gemini_service import GeminiService
 from services.maps_service import MapsService
-from models import TripRequest, ItineraryResponse, ReviewSummary
+from services.container import get_gemini_service, get_maps_service, get_job_queue, get_gemini_pool, get_admission
+from services.bulkhead import Bulkhead
+from services.admission import AdmissionController, DEGRADE
+from services.jobs import JobQueue, PRIORITIES
+from routers.jobs import submit_job
+from routers.auth import rate_limit
+from models import TripRequest, GeneratedItineraryResponse, ReviewSummaryResponse
+from responses import BodyCache, FastJSONResponse, ModelResponse, cached_response, content_version
+from pydantic import ValidationError
 from fastapi import Body
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import logging
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# Create singleton instances
-_gemini_service = None
-_maps_service = None
+def itinerary_response(content: Dict[str, Any], response: Response) -> Response:
+    """
+    The typed response, or the dict as it came when Gemini's days do not fit
+    the schema. Headers set by dependencies (rate limits) on FastAPI's
+    injected response are carried over, since returning a Response skips it.
+    """
+    try:
+        return ModelResponse(GeneratedItineraryResponse.model_validate(content), headers=response.headers)
+    except ValidationError as e:
+        # The frontend has always rendered what Gemini returned, so serve it rather than failing
+        logger.warning(f"Itinerary does not match GeneratedItineraryResponse, serving it untyped: {e.error_count()} errors")
+        return FastJSONResponse(content, headers=response.headers)
 
-def get_gemini_service() -> GeminiService:
-    global _gemini_service
-    if _gemini_service is None:
-        _gemini_service = GeminiService()
-    return _gemini_service
+def build_itinerary_response(
+    request: TripRequest,
+    gemini_service: GeminiService,
+    maps_service: MapsService
+) -> Dict[str, Any]:
+    """Generate the itinerary and look up destination details for a trip request"""
+    # Generate itinerary using Gemini AI
+    itinerary_data = gemini_service.generate_itinerary(request)
+    print(f"🤖 Raw Gemini response: {itinerary_data}")
+    print(f"🤖 Gemini response type: {type(itinerary_data)}")
+    print(f"🤖 Gemini has 'days': {'days' in itinerary_data if isinstance(itinerary_data, dict) else False}")
+    
+    # Get place details from Google Maps
+    place_details = {}
+    if maps_service.is_healthy():
+        try:
+            place_id = gemini_service.resolver.place_id(request.destination)
+            if place_id:
+                place_details = maps_service.get_place_details(place_id)
+        except Exception as e:
+            place_details = {"error": f"Could not fetch place details: {str(e)}"}
+    
+    # Combine the results - format for frontend compatibility
+    return {
+        "itinerary": itinerary_data.get("days", []),
+        "place_details": {
+            "place_id": place_details.get("place_id", ""),
+            "rating": place_details.get("rating"),
+            "address": place_details.get("address", f"{request.destination}"),
+        },
+        "travel_tips": itinerary_data.get("travel_tips", []),
+        "total_estimated_cost": itinerary_data.get("total_estimated_cost"),
+        "description": itinerary_data.get("description", f"AI-generated itinerary for {request.destination}"),
+        "success": True,
+        "message": "Itinerary generated successfully"
+    }
 
-def get_maps_service() -> MapsService:
-    global _maps_service
-    if _maps_service is None:
-        _maps_service = MapsService()
-    return _maps_service
+def build_degraded_itinerary_response(request: TripRequest, gemini_service: GeminiService) -> Dict[str, Any]:
+    """Answer without calling Gemini while it is overloaded: last good itinerary for this trip, or the fallback"""
+    itinerary_data, source = gemini_service.degraded_itinerary(request)
+    return {
+        "itinerary": itinerary_data.get("days", []),
+        "place_details": {
+            "place_id": "",
+            "rating": None,
+            "address": f"{request.destination}",
+        },
+        "travel_tips": itinerary_data.get("travel_tips", []),
+        "total_estimated_cost": itinerary_data.get("total_estimated_cost"),
+        "description": itinerary_data.get("description", f"AI-generated itinerary for {request.destination}"),
+        "success": True,
+        "degraded": True,
+        "source": source,
+        "message": "AI service is busy, served a simplified itinerary"
+    }
 
-@router.post("/generate", response_model=dict)
-def generate_itinerary(
+@router.post("/generate", response_model=GeneratedItineraryResponse, dependencies=[Depends(rate_limit("itinerary.generate"))])
+async def generate_itinerary(
     request: TripRequest,
+    response: Response,
     gemini_service: GeminiService = Depends(get_gemini_service),
-    maps_service: MapsService = Depends(get_maps_service)
+    maps_service: MapsService = Depends(get_maps_service),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    admission: AdmissionController = Depends(get_admission)
 ):
     """Generate a comprehensive travel itinerary using AI"""
     
     if not gemini_service.is_healthy():
         raise HTTPException(status_code=503, detail="AI service not available")
     
+    if admission.decide("itinerary.generate") == DEGRADE:
+        # The cache key may take a Maps search to resolve the destination
+        degraded = await run_in_threadpool(build_degraded_itinerary_response, request, gemini_service)
+        return itinerary_response(degraded, response)
+    
+    pending = gemini_pool.submit(build_itinerary_response, request, gemini_service, maps_service)
     try:
-        # Generate itinerary using Gemini AI
-        itinerary_data = gemini_service.generate_itinerary(request)
-        print(f"🤖 Raw Gemini response: {itinerary_data}")
-        print(f"🤖 Gemini response type: {type(itinerary_data)}")
-        print(f"🤖 Gemini has 'days': {'days' in itinerary_data if isinstance(itinerary_data, dict) else False}")
-        
-        # Get place details from Google Maps
-        place_details = {}
-        if maps_service.is_healthy():
-            try:
-                search_result = maps_service.search_places(request.destination)
-                if search_result.get("results"):
-                    place_id = search_result["results"][0]["place_id"]
-                    place_details = maps_service.get_place_details(place_id)
-            except Exception as e:
-                place_details = {"error": f"Could not fetch place details: {str(e)}"}
-        
-        # Combine the results - format for frontend compatibility
-        response = {
-            "itinerary": itinerary_data.get("days", []),
-            "place_details": {
-                "place_id": place_details.get("place_id", ""),
-                "rating": place_details.get("rating"),
-                "address": place_details.get("address", f"{request.destination}"),
-            },
-            "travel_tips": itinerary_data.get("travel_tips", []),
-            "total_estimated_cost": itinerary_data.get("total_estimated_cost"),
-            "description": itinerary_data.get("description", f"AI-generated itinerary for {request.destination}"),
-            "success": True,
-            "message": "Itinerary generated successfully"
-        }
-        
-        return response
+        content = await pending
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate itinerary: {str(e)}")
+    return itinerary_response(content, response)
+
+@router.post("/jobs", status_code=202, dependencies=[Depends(rate_limit("itinerary.generate"))])
+def submit_itinerary_job(
+    request: TripRequest,
+    priority: str = Query(default="normal", pattern="^(normal|low)$"),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    maps_service: MapsService = Depends(get_maps_service),
+    jobs: JobQueue = Depends(get_job_queue)
+):
+    """Queue itinerary generation and return 202 with a job id to poll under /jobs"""
+    
+    if not gemini_service.is_healthy():
+        raise HTTPException(status_code=503, detail="AI service not available")
+    
+    return submit_job(
+        jobs,
+        "itinerary",
+        lambda: build_itinerary_response(request, gemini_service, maps_service),
+        PRIORITIES[priority]
+    )
 
-@router.post("/reviews/summarize", response_model=dict)
-def summarize_reviews(
+@router.post("/reviews/summarize", response_model=ReviewSummaryResponse, dependencies=[Depends(rate_limit("itinerary.summarize_reviews"))])
+async def summarize_reviews(
+    response: Response,
     reviews: List[str] = Body(..., embed=True),
-    gemini_service: GeminiService = Depends(get_gemini_service)
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    admission: AdmissionController = Depends(get_admission)
 ):
     """Summarize travel reviews using AI"""
     
@@ -90,38 +150,33 @@ def summarize_reviews(
     if not reviews:
         raise HTTPException(status_code=400, detail="No reviews provided")
     
+    admission.decide("itinerary.summarize_reviews")
+    pending = gemini_pool.submit(gemini_service.summarize_reviews, reviews)
     try:
-        summary = gemini_service.summarize_reviews(reviews)
-        return {"summary": summary}
+        summary = await pending
+        return ModelResponse(ReviewSummaryResponse(summary=summary), headers=response.headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to summarize reviews: {str(e)}")
 
-@router.post("/optimize")
-def optimize_itinerary(
+@router.post("/optimize", dependencies=[Depends(rate_limit("itinerary.optimize"))])
+async def optimize_itinerary(
     request: TripRequest,
     preferences: dict = Body(...),
     gemini_service: GeminiService = Depends(get_gemini_service),
-    maps_service: MapsService = Depends(get_maps_service)
+    maps_service: MapsService = Depends(get_maps_service),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    admission: AdmissionController = Depends(get_admission)
 ):
     """Optimize an existing itinerary based on preferences and real-time data"""
     
     if not gemini_service.is_healthy():
         raise HTTPException(status_code=503, detail="AI service not available")
     
+    admission.decide("itinerary.optimize")
+    pending = gemini_pool.submit(_optimize, request, gemini_service, maps_service)
     try:
-        # This could include route optimization, time optimization, etc.
-        # For now, we'll generate a new optimized itinerary
-        optimized_itinerary = gemini_service.generate_itinerary(request)
-        
-        # Add route optimization if Maps service is available
-        route_info = {}
-        if maps_service.is_healthy() and request.source and request.destination:
-            try:
-                directions = maps_service.get_directions(request.source, request.destination)
-                route_info = directions
-            except Exception as e:
-                route_info = {"error": f"Could not fetch route info: {str(e)}"}
+        optimized_itinerary, route_info = await pending
         
         return {
             "optimized_itinerary": optimized_itinerary,
@@ -136,34 +191,55 @@ def optimize_itinerary(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to optimize itinerary: {str(e)}")
 
+def _optimize(request: TripRequest, gemini_service: GeminiService, maps_service: MapsService):
+    # This could include route optimization, time optimization, etc.
+    # For now, we'll generate a new optimized itinerary; a cached one would just repeat the original
+    optimized_itinerary = gemini_service.generate_itinerary(request, reuse=False)
+    
+    # Add route optimization if Maps service is available
+    route_info = {}
+    if maps_service.is_healthy() and request.source and request.destination:
+        try:
+            directions = maps_service.get_directions(request.source, request.destination)
+            route_info = directions
+        except Exception as e:
+            route_info = {"error": f"Could not fetch route info: {str(e)}"}
+    
+    return optimized_itinerary, route_info
+
+# Templates change only with a deploy, so the rendered body is reused and revalidated by ETag
+ITINERARY_TEMPLATES = [
+    {
+        "id": "paris-romantic-3day",
+        "name": "Romantic Paris Getaway",
+        "destination": "Paris, France",
+        "duration": 3,
+        "style": "romantic",
+        "highlights": ["Eiffel Tower sunset", "Seine river cruise", "Louvre visit"]
+    },
+    {
+        "id": "tokyo-culture-5day", 
+        "name": "Tokyo Cultural Experience",
+        "destination": "Tokyo, Japan",
+        "duration": 5,
+        "style": "cultural",
+        "highlights": ["Temple visits", "Traditional dining", "Art museums"]
+    },
+    {
+        "id": "bali-wellness-7day",
+        "name": "Bali Wellness Retreat",
+        "destination": "Bali, Indonesia", 
+        "duration": 7,
+        "style": "wellness",
+        "highlights": ["Yoga sessions", "Spa treatments", "Nature walks"]
+    }
+]
+TEMPLATES_VERSION = content_version(ITINERARY_TEMPLATES)
+TEMPLATES_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+_bodies = BodyCache()
+
 @router.get("/templates")
-def get_itinerary_templates():
+def get_itinerary_templates(request: Request):
     """Get pre-made itinerary templates for popular destinations"""
-    templates = [
-        {
-            "id": "paris-romantic-3day",
-            "name": "Romantic Paris Getaway",
-            "destination": "Paris, France",
-            "duration": 3,
-            "style": "romantic",
-            "highlights": ["Eiffel Tower sunset", "Seine river cruise", "Louvre visit"]
-        },
-        {
-            "id": "tokyo-culture-5day", 
-            "name": "Tokyo Cultural Experience",
-            "destination": "Tokyo, Japan",
-            "duration": 5,
-            "style": "cultural",
-            "highlights": ["Temple visits", "Traditional dining", "Art museums"]
-        },
-        {
-            "id": "bali-wellness-7day",
-            "name": "Bali Wellness Retreat",
-            "destination": "Bali, Indonesia", 
-            "duration": 7,
-            "style": "wellness",
-            "highlights": ["Yoga sessions", "Spa treatments", "Nature walks"]
-        }
-    ]
-    
-    return {"templates": templates}
\ No newline at end of file
+    cached = _bodies.get("templates", TEMPLATES_VERSION, lambda: {"templates": ITINERARY_TEMPLATES})
+    return cached_response(request, cached, TEMPLATES_CACHE_CONTROL)
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from typing import Any, Callable, Dict, Optional
+from services.container import get_job_queue
+from services.jobs import JobQueue, QueueFullError, TERMINAL_STATES, SUCCEEDED, CANCELLED
+import asyncio
+
+router = APIRouter()
+
+# Long-poll checks the shared store at this interval; a thread is held only for each read
+POLL_INTERVAL_SECONDS = 0.25
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {key: value for key, value in job.items() if key != "result"}
+    view["status_url"] = f"/jobs/{job['job_id']}"
+    view["result_url"] = f"/jobs/{job['job_id']}/result"
+    return view
+
+def submit_job(jobs: JobQueue, kind: str, fn: Callable[[], Any], priority: int) -> JSONResponse:
+    """Queue work and answer 202 Accepted with the job's status location"""
+    try:
+        job = jobs.submit(kind, fn, priority=priority)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    view = _job_view(job)
+    return JSONResponse(status_code=202, content=view, headers={"Location": view["status_url"]})
+
+async def _wait_for_job(jobs: JobQueue, job_id: str, wait: float) -> Optional[Dict[str, Any]]:
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        # With STATE_STORE=sqlite this is a database read that may wait on a writer
+        job = await run_in_threadpool(jobs.get, job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return job
+        if asyncio.get_running_loop().time() >= deadline:
+            return job
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+@router.get("/{job_id}")
+async def get_job_status(
+    job_id: str,
+    wait: float = Query(default=0, ge=0, le=30, description="Seconds to long-poll for completion"),
+    jobs: JobQueue = Depends(get_job_queue)
+):
+    """Get the status of a background job"""
+    job = await _wait_for_job(jobs, job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_view(job)
+
+@router.get("/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    wait: float = Query(default=0, ge=0, le=30, description="Seconds to long-poll for completion"),
+    jobs: JobQueue = Depends(get_job_queue)
+):
+    """Get the result of a finished job (202 while it is still queued or running)"""
+    job = await _wait_for_job(jobs, job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == SUCCEEDED:
+        return job["result"]
+    if job["status"] == CANCELLED:
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    if job["status"] in TERMINAL_STATES:
+        raise HTTPException(status_code=500, detail=job["error"] or "Job failed")
+    return JSONResponse(status_code=202, content=_job_view(job), headers={"Retry-After": "2"})
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str, jobs: JobQueue = Depends(get_job_queue)):
+    """Cancel a queued or running job"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_view(job)
@@ -1,41 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, Any, Optional
 from services.gemini_service import GeminiService
 from services.maps_service import MapsService
+from services.container import get_gemini_service, get_maps_service, get_session_store, get_speculation, get_job_queue, get_gemini_pool, get_admission, get_suggestion_engine, get_rate_limiter, get_state_store
+from services.bulkhead import Bulkhead
+from services.admission import ADMIT, DEGRADE, AdmissionController, Overloaded
+from services.jobs import JobQueue, PRIORITY_HIGH
+from routers.jobs import submit_job
+from services.session_store import PlanningSessionStore
+from services.speculation import DEFAULT_ADOPT_TIMEOUT, SpeculativeGenerator
+from services.rate_limit import RateLimiter
+from services.state_store import StateStore
+from routers.auth import charge_caller
+from services.suggestions import SuggestionEngine, suggestion_payload
 from models import TripRequest, PlanningSession, PlanningStep
 from datetime import datetime
 import uuid
 import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_env_result = load_dotenv()
-print(f"Planning router - Environment loaded: {load_env_result}")
-print(f"Planning router - GOOGLE_AI_API_KEY exists: {bool(os.getenv('GOOGLE_AI_API_KEY'))}")
 
 router = APIRouter()
 
-# Create singleton instances
-_gemini_service = None
-_maps_service = None
-
-def get_gemini_service() -> GeminiService:
-    global _gemini_service
-    if _gemini_service is None:
-        _gemini_service = GeminiService()
-    return _gemini_service
+# Speculative generation starts once this step is done and the trip request compiles
+SPECULATE_AFTER_STEP = int(os.getenv("SPECULATE_AFTER_STEP", "5"))
+# How long /generate waits for an in-flight speculative result before generating itself
+SPECULATION_ADOPT_TIMEOUT = float(os.getenv("SPECULATION_ADOPT_TIMEOUT_SECONDS", str(DEFAULT_ADOPT_TIMEOUT)))
 
-def get_maps_service() -> MapsService:
-    global _maps_service
-    if _maps_service is None:
-        _maps_service = MapsService()
-    return _maps_service
-
-# In-memory storage for planning sessions (in production, use a database)
-planning_sessions = {}
+def _load_session(store: PlanningSessionStore, session_id: str) -> PlanningSession:
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Planning session not found")
+    return session
 
 @router.post("/session/start")
-def start_planning_session(user_id: Optional[str] = None):
+def start_planning_session(
+    user_id: Optional[str] = None,
+    store: PlanningSessionStore = Depends(get_session_store)
+):
     """Start a new planning session"""
     session_id = str(uuid.uuid4())
     
@@ -58,17 +59,14 @@ def start_planning_session(user_id: Optional[str] = None):
         updated_at=datetime.now()
     )
     
-    planning_sessions[session_id] = session
+    store.create(session)
     
     return {"session_id": session_id, "current_step": 1, "steps": steps}
 
 @router.get("/session/{session_id}")
-def get_planning_session(session_id: str):
+def get_planning_session(session_id: str, store: PlanningSessionStore = Depends(get_session_store)):
     """Get current planning session status"""
-    if session_id not in planning_sessions:
-        raise HTTPException(status_code=404, detail="Planning session not found")
-    
-    session = planning_sessions[session_id]
+    session = _load_session(store, session_id)
     return {
         "session_id": session_id,
         "current_step": session.current_step,
@@ -76,28 +74,41 @@ def get_planning_session(session_id: str):
         "trip_request": session.trip_request
     }
 
+def _may_speculate(request: Request, admission: AdmissionController, limiter: RateLimiter, state: StateStore) -> bool:
+    """Speculation spends Gemini calls like /generate, so it needs admission and the caller's quota"""
+    try:
+        if admission.decide("planning.speculate") != ADMIT:
+            return False
+    except Overloaded:
+        return False
+    return charge_caller("planning.speculate", request, state, limiter).allowed
+
 @router.put("/session/{session_id}/step/{step_number}")
 def update_planning_step(
+    request: Request,
     session_id: str,
     step_number: int,
-    step_data: Dict[str, Any]
+    step_data: Dict[str, Any],
+    store: PlanningSessionStore = Depends(get_session_store),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    speculation: Optional[SpeculativeGenerator] = Depends(get_speculation),
+    admission: AdmissionController = Depends(get_admission),
+    limiter: RateLimiter = Depends(get_rate_limiter),
+    state: StateStore = Depends(get_state_store)
 ):
     """Update a specific planning step with data"""
-    if session_id not in planning_sessions:
-        raise HTTPException(status_code=404, detail="Planning session not found")
-    
-    session = planning_sessions[session_id]
+    session = _load_session(store, session_id)
     
     # Find and update the step
-    step_found = False
+    updated_step = None
     for step in session.steps:
         if step.step == step_number:
             step.data = step_data
             step.completed = True
-            step_found = True
+            updated_step = step
             break
     
-    if not step_found:
+    if updated_step is None:
         raise HTTPException(status_code=404, detail="Planning step not found")
     
     # Update current step to next incomplete step
@@ -111,6 +122,23 @@ def update_planning_step(
     if step_number == 6:  # Itinerary generation step
         session.trip_request = _compile_trip_request(session)
     
+    # Only the changed step and the header fields are written back
+    store.update_step(session_id, updated_step, session.current_step, session.updated_at, session.trip_request)
+    
+    # Start generating in the background as soon as the inputs are complete;
+    # later edits supersede the speculation, /generate adopts it
+    if speculation is not None and gemini_service.is_healthy():
+        trip_request = session.trip_request or _compile_trip_request(session)
+        last_completed = max((step.step for step in session.steps if step.completed), default=0)
+        if trip_request is None:
+            speculation.cancel(session_id)
+        elif last_completed >= SPECULATE_AFTER_STEP and not speculation.is_current(session_id, trip_request):
+            if _may_speculate(request, admission, limiter, state):
+                speculation.propose(session_id, trip_request)
+            else:
+                # The inputs changed, so the old speculation is no use either
+                speculation.cancel(session_id)
+    
     return {
         "session_id": session_id,
         "updated_step": step_number,
@@ -118,17 +146,13 @@ def update_planning_step(
         "completed": step_number == len(session.steps)
     }
 
-@router.post("/session/{session_id}/generate")
-def generate_from_session(
+def _load_generatable_session(
+    store: PlanningSessionStore,
     session_id: str,
-    gemini_service: GeminiService = Depends(get_gemini_service),
-    maps_service: MapsService = Depends(get_maps_service)
-):
-    """Generate itinerary from completed planning session"""
-    if session_id not in planning_sessions:
-        raise HTTPException(status_code=404, detail="Planning session not found")
-    
-    session = planning_sessions[session_id]
+    gemini_service: GeminiService
+) -> PlanningSession:
+    """Load a session and make sure it has a trip request the AI service can work on"""
+    session = _load_session(store, session_id)
     
     if not session.trip_request:
         # Try to compile trip request from current step data
@@ -140,75 +164,121 @@ def generate_from_session(
     if not gemini_service.is_healthy():
         raise HTTPException(status_code=503, detail="AI service not available")
     
-    try:
+    return session
+
+def build_session_itinerary(
+    session: PlanningSession,
+    store: PlanningSessionStore,
+    gemini_service: GeminiService,
+    maps_service: MapsService,
+    speculation: Optional[SpeculativeGenerator]
+) -> Dict[str, Any]:
+    """Generate the itinerary for a planning session and record it on the final step"""
+    session_id = session.id
+    
+    # Reuse the speculative result when it was built from the same inputs
+    itinerary_data = None
+    if speculation is not None:
+        itinerary_data = speculation.adopt(session_id, session.trip_request, timeout=SPECULATION_ADOPT_TIMEOUT)
+    if itinerary_data is None:
         # Generate itinerary using the compiled trip request
         itinerary_data = gemini_service.generate_itinerary(session.trip_request)
-        
-        # Get place details if Maps service is available
-        place_details = {}
-        if maps_service.is_healthy():
-            try:
-                search_result = maps_service.search_places(session.trip_request.destination)
-                if search_result.get("results"):
-                    place_id = search_result["results"][0]["place_id"]
-                    place_details = maps_service.get_place_details(place_id)
-            except Exception:
-                place_details = {"error": "Could not fetch place details"}
-        
-        # Mark the final step as completed
-        for step in session.steps:
-            if step.step == 6:
-                step.completed = True
-                step.data = {"itinerary": itinerary_data}
-                break
-        
+    
+    # Get place details if Maps service is available
+    place_details = {}
+    if maps_service.is_healthy():
+        try:
+            place_id = gemini_service.resolver.place_id(session.trip_request.destination)
+            if place_id:
+                place_details = maps_service.get_place_details(place_id)
+        except Exception:
+            place_details = {"error": "Could not fetch place details"}
+    
+    # Mark the final step as completed
+    for step in session.steps:
+        if step.step == 6:
+            step.completed = True
+            step.data = {"itinerary": itinerary_data}
+            store.update_step(session_id, step, session.current_step, datetime.now(), session.trip_request)
+            break
+    
+    return {
+        "session_id": session_id,
+        "itinerary": itinerary_data.get("days", []),
+        "place_details": place_details,
+        "travel_tips": itinerary_data.get("travel_tips", []),
+        "total_estimated_cost": itinerary_data.get("total_estimated_cost"),
+        "trip_request": session.trip_request.dict()
+    }
+
+@router.post("/session/{session_id}/generate")
+async def generate_from_session(
+    session_id: str,
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    maps_service: MapsService = Depends(get_maps_service),
+    store: PlanningSessionStore = Depends(get_session_store),
+    speculation: Optional[SpeculativeGenerator] = Depends(get_speculation),
+    gemini_pool: Bulkhead = Depends(get_gemini_pool),
+    admission: AdmissionController = Depends(get_admission)
+):
+    """Generate itinerary from completed planning session"""
+    session = await run_in_threadpool(_load_generatable_session, store, session_id, gemini_service)
+    
+    if admission.decide("planning.generate") == DEGRADE:
+        # Not recorded on the session, so a later retry still gets a full itinerary
+        itinerary_data, source = await run_in_threadpool(gemini_service.degraded_itinerary, session.trip_request)
         return {
             "session_id": session_id,
             "itinerary": itinerary_data.get("days", []),
-            "place_details": place_details,
+            "place_details": {},
             "travel_tips": itinerary_data.get("travel_tips", []),
             "total_estimated_cost": itinerary_data.get("total_estimated_cost"),
-            "trip_request": session.trip_request.dict()
+            "trip_request": session.trip_request.dict(),
+            "degraded": True,
+            "source": source
         }
+    
+    pending = gemini_pool.submit(build_session_itinerary, session, store, gemini_service, maps_service, speculation)
+    try:
+        return await pending
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate itinerary: {str(e)}")
 
+@router.post("/session/{session_id}/jobs", status_code=202)
+def submit_session_itinerary_job(
+    session_id: str,
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    maps_service: MapsService = Depends(get_maps_service),
+    store: PlanningSessionStore = Depends(get_session_store),
+    speculation: Optional[SpeculativeGenerator] = Depends(get_speculation),
+    jobs: JobQueue = Depends(get_job_queue)
+):
+    """Queue itinerary generation for a planning session and return 202 with a job id"""
+    session = _load_generatable_session(store, session_id, gemini_service)
+    
+    # The user is waiting at the end of the wizard, so this jumps ahead of API jobs
+    return submit_job(
+        jobs,
+        "planning_itinerary",
+        lambda: build_session_itinerary(session, store, gemini_service, maps_service, speculation),
+        PRIORITY_HIGH
+    )
+
 @router.get("/destinations/suggestions")
 def get_destination_suggestions(
     interests: str,
     budget: str,
-    duration: int,
-    gemini_service: GeminiService = Depends(get_gemini_service)
+    duration: int = Query(..., ge=1, le=90),
+    month: Optional[int] = Query(default=None, ge=1, le=12, description="Travel month, 1-12"),
+    limit: int = Query(default=5, ge=1, le=20),
+    engine: SuggestionEngine = Depends(get_suggestion_engine)
 ):
-    """Get AI-powered destination suggestions based on preferences"""
-    if not gemini_service.is_healthy():
-        # Return static suggestions if AI is not available
-        suggestions = [
-            {"name": "Paris, France", "reason": "Perfect for culture and art lovers"},
-            {"name": "Tokyo, Japan", "reason": "Great blend of tradition and modernity"},
-            {"name": "Bali, Indonesia", "reason": "Ideal for relaxation and nature"}
-        ]
-        return {"suggestions": suggestions, "source": "static"}
-    
-    # In a real implementation, you would use Gemini to generate personalized suggestions
-    # For now, return some intelligent suggestions based on the parameters
-    suggestions = []
-    
-    if "culture" in interests.lower():
-        suggestions.append({"name": "Rome, Italy", "reason": "Rich historical culture and architecture"})
-    if "nature" in interests.lower():
-        suggestions.append({"name": "New Zealand", "reason": "Stunning natural landscapes and outdoor activities"})
-    if "food" in interests.lower():
-        suggestions.append({"name": "Bangkok, Thailand", "reason": "World-class street food and culinary experiences"})
-    
-    # Add budget-appropriate suggestions
-    if budget == "budget":
-        suggestions.append({"name": "Prague, Czech Republic", "reason": "Beautiful city with affordable prices"})
-    elif budget == "luxury":
-        suggestions.append({"name": "Maldives", "reason": "Ultimate luxury resort destination"})
-    
-    return {"suggestions": suggestions, "source": "ai-powered"}
+    """Suggest catalog destinations for comma-separated interests, a budget level, a trip length and month"""
+    # Scored against the whole catalog in one vectorized pass; no Gemini call on this path
+    wanted = [interest for interest in interests.split(",") if interest.strip()]
+    suggestions = engine.suggest(wanted, budget, duration, month=month, limit=limit)
+    return {"suggestions": [suggestion_payload(suggestion) for suggestion in suggestions], "source": "catalog"}
 
 def _compile_trip_request(session: PlanningSession) -> Optional[TripRequest]:
     """Compile a TripRequest from planning session step data"""
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from services.profiling import Profile, Profiler, get_profiler
+
+router = APIRouter()
+
+def require_admin(
+    x_profile_token: Optional[str] = Header(None),
+    profiler: Profiler = Depends(get_profiler)
+) -> Profiler:
+    """Profiles expose code paths and timings, so only the admin token may read them"""
+    if not profiler.admin_token:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if not profiler.is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token is required")
+    return profiler
+
+def _get_profile(profiler: Profiler, profile_id: str) -> Profile:
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("")
+def list_profiles(profiler: Profiler = Depends(require_admin)):
+    """Summaries of the most recent profiles, newest first"""
+    return {"profiles": [profile.summary() for profile in profiler.recent()]}
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str, profiler: Profiler = Depends(require_admin)):
+    """Time split between upstream waits and CPU, plus the heaviest stacks"""
+    profile = _get_profile(profiler, profile_id)
+    return {
+        **profile.summary(),
+        "top_stacks": [
+            {"stack": stack.split(";"), "samples": count}
+            for stack, count in profile.stacks.most_common(20)
+        ],
+        "collapsed_url": f"/debug/profiles/{profile_id}/collapsed"
+    }
+
+@router.get("/{profile_id}/collapsed", response_class=PlainTextResponse)
+def get_collapsed_profile(profile_id: str, profiler: Profiler = Depends(require_admin)):
+    """Collapsed stacks for flamegraph.pl or speedscope"""
+    return PlainTextResponse(_get_profile(profiler, profile_id).collapsed())
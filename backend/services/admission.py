@@ -0,0 +1,206 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from services.bulkhead import Bulkhead
+from services.metrics import REGISTRY
+from settings import env_flag
+import logging
+
+logger = logging.getLogger(__name__)
+
+ADMIT = "admit"
+DEGRADE = "degrade"
+REJECT = "reject"
+
+# Thresholds per priority class; None disables a signal
+DEFAULT_THRESHOLDS: Dict[str, Dict[str, Optional[float]]] = {
+    # The user is at the end of the planning wizard
+    "high": {"max_queued": 32, "max_in_flight": None, "max_latency_seconds": 60},
+    "normal": {"max_queued": 16, "max_in_flight": 20, "max_latency_seconds": 30},
+    "low": {"max_queued": 4, "max_in_flight": 12, "max_latency_seconds": 20}
+}
+
+# What each AI endpoint does once its priority class is over threshold. Entries
+# may also override any of the class thresholds.
+DEFAULT_ENDPOINTS: Dict[str, Dict[str, Any]] = {
+    "planning.generate": {"priority": "high", "on_overload": DEGRADE},
+    "itinerary.generate": {"priority": "normal", "on_overload": DEGRADE},
+    "hotels.recommendations": {"priority": "normal", "on_overload": DEGRADE},
+    "itinerary.optimize": {"priority": "low", "on_overload": REJECT},
+    "itinerary.summarize_reviews": {"priority": "low", "on_overload": REJECT},
+    # Background pre-generation in the planning wizard, the first work to shed
+    "planning.speculate": {"priority": "low", "on_overload": REJECT}
+}
+
+# A latency sample older than this no longer says anything about the upstream
+LATENCY_STALE_SECONDS = 30
+
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "tripmigo_admission_decisions_total",
+    "Admission decisions for AI endpoints",
+    ("endpoint", "priority", "decision", "reason")
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge("tripmigo_upstream_in_flight", "Upstream calls currently in flight", ("upstream",))
+UPSTREAM_LATENCY_EWMA = REGISTRY.gauge(
+    "tripmigo_upstream_latency_ewma_seconds",
+    "Exponentially weighted moving average of upstream call latency",
+    ("upstream",)
+)
+
+
+class Overloaded(Exception):
+    """Raised when an AI request is shed by the admission controller"""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"AI service is overloaded ({reason}), try again shortly")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UpstreamLoad:
+    """In-flight count and smoothed latency of the calls made to one upstream"""
+
+    def __init__(self, name: str, alpha: float = 0.2):
+        self.name = name
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._latency: Optional[float] = None
+        self._sampled_at = 0.0
+
+    @property
+    def latency_seconds(self) -> float:
+        """Recent latency, or 0 once nothing has completed for a while"""
+        if self._latency is None or time.monotonic() - self._sampled_at > LATENCY_STALE_SECONDS:
+            return 0.0
+        return self._latency
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+            UPSTREAM_IN_FLIGHT.set(self.in_flight, upstream=self.name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.in_flight -= 1
+                if self._latency is None or time.monotonic() - self._sampled_at > LATENCY_STALE_SECONDS:
+                    self._latency = elapsed
+                else:
+                    self._latency = self.alpha * elapsed + (1 - self.alpha) * self._latency
+                self._sampled_at = time.monotonic()
+                UPSTREAM_IN_FLIGHT.set(self.in_flight, upstream=self.name)
+                UPSTREAM_LATENCY_EWMA.set(self._latency, upstream=self.name)
+
+
+class AdmissionController:
+    """
+    Decide up front whether an AI request is worth starting.
+
+    Looks at the Gemini pool's queue, the number of Gemini calls in flight
+    (including background jobs and speculation) and recent Gemini latency.
+    While those are under the thresholds of the endpoint's priority class the
+    request is admitted; otherwise it is either degraded (answered from cache
+    or a deterministic fallback without calling Gemini) or rejected with 503.
+    Shedding early keeps admitted requests fast instead of letting every
+    request time out together.
+    """
+
+    def __init__(
+        self,
+        pool: Bulkhead,
+        load: UpstreamLoad,
+        thresholds: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+        endpoints: Optional[Dict[str, Dict[str, Any]]] = None,
+        enabled: bool = True
+    ):
+        self.pool = pool
+        self.load = load
+        self.thresholds = thresholds or DEFAULT_THRESHOLDS
+        self.endpoints = endpoints or DEFAULT_ENDPOINTS
+        self.enabled = enabled
+
+    def policy(self, endpoint: str) -> Dict[str, Any]:
+        config = self.endpoints.get(endpoint, {"priority": "normal", "on_overload": REJECT})
+        policy = dict(self.thresholds.get(config["priority"], self.thresholds["normal"]))
+        policy.update(config)
+        return policy
+
+    def decide(self, endpoint: str) -> str:
+        """Return ADMIT or DEGRADE for a request to endpoint, or raise Overloaded"""
+        if not self.enabled:
+            return ADMIT
+        policy = self.policy(endpoint)
+        reason = self._overload_reason(policy)
+        decision = ADMIT if reason is None else policy["on_overload"]
+        ADMISSION_DECISIONS.inc(
+            endpoint=endpoint,
+            priority=policy["priority"],
+            decision=decision,
+            reason=reason or ""
+        )
+        if decision == REJECT:
+            logger.warning(f"Shedding {endpoint} request: {reason}")
+            raise Overloaded(endpoint, reason, self.retry_after())
+        if decision == DEGRADE:
+            logger.info(f"Serving degraded {endpoint} response: {reason}")
+        return decision
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        latency = self.load.latency_seconds or 1.0
+        backlog = latency * (self.pool.queued / max(1, self.pool.max_workers) + 1)
+        return max(1, min(30, math.ceil(backlog)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self.pool.queued,
+            "in_flight": self.load.in_flight,
+            "latency_seconds": round(self.load.latency_seconds, 3)
+        }
+
+    def _overload_reason(self, policy: Dict[str, Any]) -> Optional[str]:
+        max_queued = policy.get("max_queued")
+        if max_queued is not None and self.pool.queued >= max_queued:
+            return "queue"
+        max_in_flight = policy.get("max_in_flight")
+        if max_in_flight is not None and self.load.in_flight >= max_in_flight:
+            return "in_flight"
+        max_latency = policy.get("max_latency_seconds")
+        if max_latency is not None and self.load.latency_seconds > max_latency:
+            return "latency"
+        return None
+
+
+def create_admission_controller(pool: Bulkhead, load: UpstreamLoad) -> AdmissionController:
+    """
+    Build the controller from ADMISSION_CONTROL and ADMISSION_POLICIES.
+
+    ADMISSION_POLICIES is a JSON object with optional "thresholds" and
+    "endpoints" keys, merged over the defaults per priority class / endpoint.
+    """
+    thresholds = {name: dict(values) for name, values in DEFAULT_THRESHOLDS.items()}
+    endpoints = {name: dict(values) for name, values in DEFAULT_ENDPOINTS.items()}
+    overrides = os.getenv("ADMISSION_POLICIES")
+    if overrides:
+        config = json.loads(overrides)
+        for name, values in config.get("thresholds", {}).items():
+            thresholds.setdefault(name, {}).update(values)
+        for name, values in config.get("endpoints", {}).items():
+            endpoints.setdefault(name, {"priority": "normal", "on_overload": REJECT}).update(values)
+    return AdmissionController(
+        pool,
+        load,
+        thresholds=thresholds,
+        endpoints=endpoints,
+        enabled=env_flag("ADMISSION_CONTROL", default=True)
+    )
@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from anyio import to_thread
+from services.metrics import REGISTRY
+
+POOL_ACTIVE = REGISTRY.gauge("tripmigo_pool_active", "Calls currently running in an execution pool", ("pool",))
+POOL_QUEUED = REGISTRY.gauge("tripmigo_pool_queued", "Calls waiting for a thread in an execution pool", ("pool",))
+POOL_CAPACITY = REGISTRY.gauge("tripmigo_pool_capacity", "Worker threads in an execution pool", ("pool",))
+POOL_REJECTED = REGISTRY.counter(
+    "tripmigo_pool_rejected_total",
+    "Calls turned away because an execution pool and its queue were full",
+    ("pool",)
+)
+
+
+class BulkheadFull(Exception):
+    """Raised when a call is submitted to a bulkhead whose queue is already full"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} pool is at capacity, try again shortly")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """
+    Dedicated, bounded thread pool for one class of blocking work.
+
+    Gemini- and Maps-bound endpoints each run on their own bulkhead instead of
+    Starlette's shared threadpool, so a slow upstream can only exhaust its own
+    threads; catalog and auth requests keep the shared pool to themselves. At
+    most max_queue calls wait for a thread - beyond that submit() fails fast
+    with BulkheadFull rather than letting latency pile up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 5):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        POOL_CAPACITY.set(max_workers, pool=name)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return self._pending - self._active
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued
+        }
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> "asyncio.Future[Any]":
+        """
+        Schedule fn(*args, **kwargs) on the pool and return an awaitable for its result.
+
+        Admission happens here rather than on await, so callers can turn a full
+        pool into a 503 before entering their own error handling. The caller's
+        context variables (e.g. the request's cancellation token) are carried
+        over to the worker thread.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                POOL_REJECTED.inc(pool=self.name)
+                raise BulkheadFull(self.name, self.retry_after)
+            self._pending += 1
+            self._publish()
+
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, self._run, fn, *args, **kwargs)
+        future = self._executor.submit(call)
+        # Also fires when the future is cancelled before it ever started
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.submit(fn, *args, **kwargs)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            self._active += 1
+            self._publish()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._publish()
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._publish()
+
+    def _publish(self) -> None:
+        POOL_ACTIVE.set(self._active, pool=self.name)
+        POOL_QUEUED.set(self._pending - self._active, pool=self.name)
+
+
+def configure_local_pool(workers: int) -> None:
+    """
+    Size Starlette's shared threadpool and export its usage as the "local" pool.
+
+    With upstream-bound work moved onto bulkheads, the shared pool only runs
+    local work (catalog, auth, planning sessions). Must be called from the
+    event loop, e.g. in the lifespan handler.
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = workers
+    POOL_CAPACITY.set(workers, pool="local")
+    POOL_ACTIVE.set_function(lambda: limiter.borrowed_tokens, pool="local")
+    POOL_QUEUED.set_function(lambda: limiter.statistics().tasks_waiting, pool="local")
@@ -0,0 +1,77 @@
+"""
+Cooperative cancellation of upstream work when a client disconnects.
+
+The disconnect middleware attaches a CancellationToken to each request through
+a context variable, which Starlette copies into the threadpool for sync
+endpoints. Services call check_cancelled() before each Gemini or Maps call, so
+a request whose client has gone away stops at the next upstream boundary:
+retries, fallbacks and enrichment lookups are skipped. A call already on the
+wire is left to finish.
+
+Work that other callers depend on (coalesced lookups, cache fills) runs inside
+shielded() and is never cancelled.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from services.metrics import CANCELLED_UPSTREAM_CALLS
+
+
+class RequestCancelled(BaseException):
+    """
+    Raised when the client that asked for the work has disconnected.
+
+    Like asyncio.CancelledError this derives from BaseException, so the many
+    `except Exception` fallbacks in the services and routers let it through.
+    """
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "client disconnected") -> None:
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+_shielded: contextvars.ContextVar[bool] = contextvars.ContextVar("cancellation_shielded", default=False)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def bind_token(token: Optional[CancellationToken]) -> contextvars.Token:
+    return _current_token.set(token)
+
+
+def reset_token(reset: contextvars.Token) -> None:
+    _current_token.reset(reset)
+
+
+def check_cancelled(upstream: str) -> None:
+    """Raise RequestCancelled instead of starting an upstream call nobody is waiting for"""
+    token = _current_token.get()
+    if token is not None and token.cancelled and not _shielded.get():
+        CANCELLED_UPSTREAM_CALLS.inc(upstream=upstream)
+        raise RequestCancelled(token.reason)
+
+
+@contextmanager
+def shielded():
+    """Run work that is shared with other waiters without cancellation checks"""
+    reset = _shielded.set(True)
+    try:
+        yield
+    finally:
+        _shielded.reset(reset)
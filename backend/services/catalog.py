@@ -0,0 +1,377 @@
+"""
+In-memory destination catalog.
+
+Destinations are loaded once at startup from a JSON file (data/destinations.json,
+or DESTINATIONS_FILE) and indexed for the catalog endpoints:
+- an id -> destination hash map for detail lookups;
+- document numbers assigned in rating order, best first, so the popular list
+  is a prefix and any ordered set of matches is already ranked;
+- an inverted index from the normalized words of each name, country and tag
+  to document numbers, with a sorted vocabulary for prefix matching;
+- a trigram index over that vocabulary, used for a word that matches nothing
+  by prefix, so misspellings like "barcelna" still find Barcelona;
+- per-country and per-tag postings for filters and facet counts, and each
+  country's destinations precomputed in rating order;
+- facet counts for every dense posting, so a broad one-term query is a lookup.
+
+Postings covering few destinations are frozensets. Postings covering many
+(at least 1/64 of the catalog), every country and tag, and the dense
+one- to three-letter prefixes are also kept as bitmaps: Python ints with
+bit n set for document n. Intersecting those is an AND, facet counts are
+popcounts, and a page of results is read straight off the bits, so broad
+queries never sort or count tens of thousands of matches one by one.
+
+Multi-word queries match destinations having every word. Matches for each
+distinct query and filter combination are kept in an LRU together with
+their facet counts, so paging through a result set costs a slice.
+"""
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+from pydantic import TypeAdapter
+from models import Destination
+from responses import content_version
+from services.cache import TTLCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "destinations.json")
+TOKEN_PATTERN = re.compile(r"\w+")
+# Share of trigrams (Jaccard) a vocabulary word needs in common with a misspelt query word
+FUZZY_THRESHOLD = 0.3
+FUZZY_MIN_LENGTH = 3
+FACET_SIZE = 20
+# Postings with at least max(DENSE_MINIMUM, catalog size / DENSE_FRACTION) documents get a bitmap
+DENSE_MINIMUM = 1024
+DENSE_FRACTION = 64
+PREFIX_BITMAP_LENGTH = 3
+EMPTY: FrozenSet[int] = frozenset()
+
+_DESTINATIONS = TypeAdapter(List[Destination])
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form: "São Paulo" -> "sao paulo" """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Bitmap(NamedTuple):
+    bits: int
+    count: int
+
+
+Posting = Union[FrozenSet[int], Bitmap]
+
+
+def to_bitmap(numbers: Iterable[int], size: int) -> Bitmap:
+    buffer = bytearray((size + 7) // 8)
+    count = 0
+    for number in numbers:
+        buffer[number >> 3] |= 1 << (number & 7)
+        count += 1
+    return Bitmap(int.from_bytes(buffer, "little"), count)
+
+
+def bit_positions(bits: int, start: int, stop: int) -> List[int]:
+    """The positions of set bits start to stop - 1, counting set bits from the lowest"""
+    words = array("Q", bits.to_bytes((bits.bit_length() + 63) // 64 * 8, "little"))
+    if sys.byteorder == "big":
+        words.byteswap()
+    positions: List[int] = []
+    seen = 0
+    for index, word in enumerate(words):
+        if not word:
+            continue
+        count = word.bit_count()
+        if seen + count <= start:
+            seen += count
+            continue
+        base = index * 64
+        while word and seen < stop:
+            low = word & -word
+            if seen >= start:
+                positions.append(base + low.bit_length() - 1)
+            seen += 1
+            word ^= low
+        if seen >= stop:
+            break
+    return positions
+
+
+def _size(posting: Posting) -> int:
+    return posting.count if isinstance(posting, Bitmap) else len(posting)
+
+
+class _RankedBits:
+    """Matches held as a bitmap, sliced like the sorted list of their document numbers"""
+
+    def __init__(self, bitmap: Bitmap):
+        self.bitmap = bitmap
+
+    def __len__(self) -> int:
+        return self.bitmap.count
+
+    def __getitem__(self, page: slice) -> List[int]:
+        start, stop, _ = page.indices(self.bitmap.count)
+        return bit_positions(self.bitmap.bits, start, stop)
+
+
+class SearchResult(NamedTuple):
+    destinations: List[Destination]
+    total: int
+    facets: Dict[str, Dict[str, int]]
+
+
+class _Matches(NamedTuple):
+    ids: Union[Sequence[int], _RankedBits]
+    facets: Dict[str, Dict[str, int]]
+
+
+class DestinationCatalog:
+    """Destinations indexed for lookup by id, ranked listing and faceted search"""
+
+    def __init__(self, records: List[Dict[str, Any]], version: Optional[str] = None, result_cache_size: int = 1024):
+        destinations = _DESTINATIONS.validate_python(records)
+        # sorted() is stable, so equally rated destinations keep their file order
+        self._docs: List[Destination] = sorted(destinations, key=lambda destination: -destination.rating)
+        self.version = version or content_version(records)
+        self._by_id = {destination.id: destination for destination in self._docs}
+        if len(self._by_id) != len(self._docs):
+            raise ValueError("Destination ids must be unique")
+        size = len(self._docs)
+        self._dense_limit = max(DENSE_MINIMUM, size // DENSE_FRACTION)
+
+        words: Dict[str, Set[int]] = {}
+        by_country: Dict[str, Set[int]] = {}
+        by_tag: Dict[str, Set[int]] = {}
+        self._labels: Dict[Tuple[str, str], str] = {}
+        self._country_keys: List[str] = []
+        self._tag_keys: List[Tuple[str, ...]] = []
+        for number, destination in enumerate(self._docs):
+            document_words = set(tokenize(destination.name)) | set(tokenize(destination.country))
+            for tag in destination.tags:
+                document_words.update(tokenize(tag))
+            for word in document_words:
+                words.setdefault(word, set()).add(number)
+
+            country = normalize(destination.country)
+            by_country.setdefault(country, set()).add(number)
+            self._labels.setdefault(("country", country), destination.country)
+            self._country_keys.append(country)
+            tags: Dict[str, None] = {}
+            for label in destination.tags:
+                tag = normalize(label)
+                tags[tag] = None
+                by_tag.setdefault(tag, set()).add(number)
+                self._labels.setdefault(("tags", tag), label)
+            self._tag_keys.append(tuple(tags))
+
+        self._postings = {word: self._posting(numbers) for word, numbers in words.items()}
+        self._vocabulary: List[str] = sorted(self._postings)
+        self._prefixes = self._dense_prefixes(words)
+        self._trigrams: Dict[str, List[int]] = {}
+        self._trigram_counts: List[int] = []
+        for index, word in enumerate(self._vocabulary):
+            word_trigrams = trigrams(word)
+            self._trigram_counts.append(len(word_trigrams))
+            for trigram in word_trigrams:
+                self._trigrams.setdefault(trigram, []).append(index)
+
+        self._by_country = {country: self._posting(numbers) for country, numbers in by_country.items()}
+        self._by_tag = {tag: self._posting(numbers) for tag, numbers in by_tag.items()}
+        self._ranked_by_country = {country: tuple(sorted(numbers)) for country, numbers in by_country.items()}
+        # Every facet value as a bitmap, for counting facets of large match sets
+        self._facet_bits = {
+            "country": {country: to_bitmap(numbers, size).bits for country, numbers in by_country.items()},
+            "tags": {tag: to_bitmap(numbers, size).bits for tag, numbers in by_tag.items()}
+        }
+
+        # Broad queries are mostly one dense word, prefix, country or tag: count their facets up front
+        self._dense_facets: Dict[int, Dict[str, Dict[str, int]]] = {}
+        for posting in chain(self._postings.values(), self._prefixes.values(), self._by_country.values(), self._by_tag.values()):
+            if isinstance(posting, Bitmap) and posting.bits not in self._dense_facets:
+                self._dense_facets[posting.bits] = self._count_facet_bits(posting.bits)
+
+        self._everything = _Matches(range(size), self._count_facets(range(size)))
+        self._results = TTLCache(max_entries=result_cache_size, ttl_seconds=float("inf"), name="catalog_search")
+
+    def _posting(self, numbers: Set[int]) -> Posting:
+        if len(numbers) >= self._dense_limit:
+            return to_bitmap(numbers, len(self._docs))
+        return frozenset(numbers)
+
+    def _dense_prefixes(self, words: Dict[str, Set[int]]) -> Dict[str, Bitmap]:
+        """Bitmaps for the short prefixes whose words, together, cover many destinations"""
+        estimates: Counter = Counter()
+        for word, numbers in words.items():
+            for length in range(1, min(len(word), PREFIX_BITMAP_LENGTH) + 1):
+                estimates[word[:length]] += len(numbers)
+        prefixes = {}
+        for prefix, estimate in estimates.items():
+            if estimate >= self._dense_limit:
+                posting = self._union(prefix)
+                if isinstance(posting, Bitmap):
+                    prefixes[prefix] = posting
+        return prefixes
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, destination_id: str) -> Optional[Destination]:
+        return self._by_id.get(destination_id)
+
+    def all(self) -> List[Destination]:
+        """Every destination, best rated first"""
+        return list(self._docs)
+
+    def popular(self, limit: int, country: Optional[str] = None) -> List[Destination]:
+        if country is None:
+            return self._docs[:limit]
+        return [self._docs[number] for number in self._ranked_by_country.get(normalize(country), ())[:limit]]
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        country: Optional[str] = None,
+        tags: Iterable[str] = (),
+        offset: int = 0,
+        limit: int = 10
+    ) -> SearchResult:
+        """
+        Destinations matching every word of query (by prefix, or by trigram
+        similarity for a word with no prefix match) and all the filters, best
+        rated first. total and facets cover all matches, not just the page.
+        """
+        key = (
+            tuple(tokenize(query or "")),
+            normalize(country) if country else None,
+            tuple(sorted({normalize(tag) for tag in tags}))
+        )
+        matches = self._results.get(key)
+        if matches is None:
+            matches = self._match(*key)
+            self._results.set(key, matches)
+        page = [self._docs[number] for number in matches.ids[offset:offset + limit]]
+        return SearchResult(page, len(matches.ids), matches.facets)
+
+    def _match(self, words: Tuple[str, ...], country: Optional[str], tags: Tuple[str, ...]) -> _Matches:
+        terms: List[Posting] = [self._word_matches(word) for word in words]
+        if country is not None:
+            terms.append(self._by_country.get(country, EMPTY))
+        terms.extend(self._by_tag.get(tag, EMPTY) for tag in tags)
+        if not terms:
+            return self._everything
+        # Intersecting from the smallest term keeps every step as cheap as the rarest one
+        terms.sort(key=_size)
+        first, rest = terms[0], terms[1:]
+
+        if isinstance(first, Bitmap):
+            bits = first.bits
+            for term in rest:
+                bits &= term.bits if isinstance(term, Bitmap) else to_bitmap(term, len(self._docs)).bits
+            bitmap = Bitmap(bits, bits.bit_count())
+            if bitmap.count >= self._dense_limit:
+                facets = self._dense_facets.get(bitmap.bits) or self._count_facet_bits(bitmap.bits)
+                return _Matches(_RankedBits(bitmap), facets)
+            ids = bit_positions(bitmap.bits, 0, bitmap.count)
+            return _Matches(ids, self._count_facets(ids))
+
+        numbers = first
+        for term in rest:
+            if isinstance(term, Bitmap):
+                data = term.bits.to_bytes((len(self._docs) + 7) // 8, "little")
+                numbers = frozenset(number for number in numbers if data[number >> 3] >> (number & 7) & 1)
+            else:
+                numbers = numbers & term
+        ids = sorted(numbers)
+        return _Matches(ids, self._count_facets(ids))
+
+    def _word_matches(self, word: str) -> Posting:
+        prefix = self._prefixes.get(word)
+        if prefix is not None:
+            return prefix
+        start = bisect_left(self._vocabulary, word)
+        end = bisect_left(self._vocabulary, word + "\uffff", start)
+        if end - start == 1:
+            return self._postings[self._vocabulary[start]]
+        if end > start:
+            return self._union(word, start, end)
+        return self._fuzzy_matches(word)
+
+    def _union(self, prefix: str, start: Optional[int] = None, end: Optional[int] = None) -> Posting:
+        """Documents having any word that starts with prefix"""
+        if start is None:
+            start = bisect_left(self._vocabulary, prefix)
+            end = bisect_left(self._vocabulary, prefix + "\uffff", start)
+        return self._combine([self._postings[self._vocabulary[i]] for i in range(start, end)])
+
+    def _combine(self, postings: List[Posting]) -> Posting:
+        """The union of postings, as a bitmap once it may be dense"""
+        if sum(map(_size, postings)) < self._dense_limit:
+            return frozenset().union(*postings)
+        sparse = [posting for posting in postings if not isinstance(posting, Bitmap)]
+        bits = to_bitmap(chain.from_iterable(sparse), len(self._docs)).bits
+        for posting in postings:
+            if isinstance(posting, Bitmap):
+                bits |= posting.bits
+        return Bitmap(bits, bits.bit_count())
+
+    def _fuzzy_matches(self, word: str) -> Posting:
+        if len(word) < FUZZY_MIN_LENGTH:
+            return EMPTY
+        wanted = trigrams(word)
+        shared = Counter(chain.from_iterable(self._trigrams.get(trigram, ()) for trigram in wanted))
+        # Jaccard similarity c / (q + w - c) with c <= w can only reach the threshold when c >= threshold * q
+        minimum = math.ceil(FUZZY_THRESHOLD * len(wanted))
+        similar = []
+        for index, common in shared.items():
+            if common >= minimum and common / (len(wanted) + self._trigram_counts[index] - common) >= FUZZY_THRESHOLD:
+                similar.append(self._postings[self._vocabulary[index]])
+        return self._combine(similar)
+
+    def _count_facets(self, ids: Sequence[int]) -> Dict[str, Dict[str, int]]:
+        countries = Counter(map(self._country_keys.__getitem__, ids))
+        tags = Counter(chain.from_iterable(map(self._tag_keys.__getitem__, ids)))
+        return {
+            "country": {self._labels[("country", key)]: count for key, count in countries.most_common(FACET_SIZE)},
+            "tags": {self._labels[("tags", key)]: count for key, count in tags.most_common(FACET_SIZE)}
+        }
+
+    def _count_facet_bits(self, bits: int) -> Dict[str, Dict[str, int]]:
+        facets = {}
+        for facet, values in self._facet_bits.items():
+            counts = ((key, (bits & value_bits).bit_count()) for key, value_bits in values.items())
+            top = heapq.nlargest(FACET_SIZE, (item for item in counts if item[1]), key=lambda item: item[1])
+            facets[facet] = {self._labels[(facet, key)]: count for key, count in top}
+        return facets
+
+
+def load_catalog(path: Optional[str] = None) -> DestinationCatalog:
+    """The catalog from a JSON array of destinations, by default data/destinations.json"""
+    path = path or os.getenv("DESTINATIONS_FILE") or DEFAULT_CATALOG_FILE
+    with open(path, "rb") as f:
+        raw = f.read()
+    catalog = DestinationCatalog(json.loads(raw), version=hashlib.blake2b(raw, digest_size=16).hexdigest())
+    logger.info(f"Loaded {len(catalog)} destinations from {path}")
+    return catalog
@@ -0,0 +1,195 @@
+from fastapi import Request
+from services.gemini_service import GeminiService
+from services.maps_service import MapsService
+from services.fixtures import create_upstream_fixtures
+from services.state_store import StateStore, create_state_store
+from services.session_store import PlanningSessionStore, create_session_store
+from services.speculation import SpeculativeGenerator
+from services.jobs import JobQueue
+from services.bulkhead import Bulkhead, POOL_ACTIVE, POOL_CAPACITY, POOL_QUEUED
+from services.admission import AdmissionController, create_admission_controller
+from services.rate_limit import RateLimiter, create_rate_limiter
+from services.catalog import DestinationCatalog, load_catalog
+from services.knowledge import KnowledgePacks, load_knowledge_packs
+from services.resolver import DestinationResolver
+from services.similarity import DEFAULT_MAX_TRIM_DAYS, DEFAULT_THRESHOLD, SimilarTripIndex
+from services.suggestions import SuggestionEngine
+from models import TripRequest
+from settings import load_environment, env_flag
+from typing import Any, Dict, Optional
+import os
+import startup_profiler
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Application-wide owner of the upstream clients and their shared resources"""
+
+    def __init__(self):
+        load_environment()
+        # Set UPSTREAM_FIXTURES to record upstream responses or to replay them offline
+        self.fixtures = create_upstream_fixtures()
+        self.catalog = load_catalog()
+        self.suggestions = SuggestionEngine(self.catalog)
+        # Built offline by build_knowledge_packs.py; memory-mapped, so workers share the pages
+        self.knowledge = load_knowledge_packs()
+        self.maps = MapsService(fixtures=self.fixtures)
+        # One canonical key per destination for every cache, coalescing key and pack lookup
+        self.resolver = DestinationResolver(self.catalog, self.maps)
+        self.gemini = GeminiService(
+            fixtures=self.fixtures,
+            knowledge=self.knowledge,
+            resolver=self.resolver,
+            similar_trips=SimilarTripIndex(
+                threshold=float(os.getenv("ITINERARY_SIMILARITY_THRESHOLD", str(DEFAULT_THRESHOLD))),
+                max_trim_days=int(os.getenv("ITINERARY_SIMILARITY_MAX_TRIM_DAYS", str(DEFAULT_MAX_TRIM_DAYS)))
+            )
+        )
+        # Separate pools so a Gemini slowdown cannot starve Maps, catalog or auth traffic
+        self.gemini_pool = Bulkhead(
+            "gemini",
+            max_workers=int(os.getenv("GEMINI_POOL_WORKERS", "16")),
+            max_queue=int(os.getenv("GEMINI_POOL_QUEUE", "32"))
+        )
+        self.maps_pool = Bulkhead(
+            "maps",
+            max_workers=int(os.getenv("MAPS_POOL_WORKERS", "16")),
+            max_queue=int(os.getenv("MAPS_POOL_QUEUE", "64"))
+        )
+        self.admission = create_admission_controller(self.gemini_pool, self.gemini.load)
+        self.rate_limiter = create_rate_limiter()
+        self.state = create_state_store()
+        self.sessions = create_session_store()
+        self.jobs = JobQueue(
+            self.state,
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            max_queue=int(os.getenv("JOB_MAX_QUEUE", "100")),
+            result_ttl_seconds=float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+        )
+        self.speculation: Optional[SpeculativeGenerator] = None
+        if env_flag("SPECULATIVE_GENERATION", default=True):
+            self.speculation = SpeculativeGenerator(
+                self.pregenerate_itinerary,
+                debounce_seconds=float(os.getenv("SPECULATION_DEBOUNCE_SECONDS", "1.5")),
+                fingerprint=self.gemini.trip_key
+            )
+        self.warmed_up = threading.Event()
+        logger.info("Service container initialized")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Import the upstream SDKs and build their clients on a background thread"""
+        thread = threading.Thread(target=self.warm_up, name="service-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def warm_up(self) -> None:
+        for name, service in (("gemini", self.gemini), ("maps", self.maps)):
+            try:
+                service.warm_up()
+                startup_profiler.mark(f"{name}_client_ready")
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} service failed: {e}")
+        self.warmed_up.set()
+        startup_profiler.report_ready()
+        logger.info("Service warm-up complete")
+
+    def pregenerate_itinerary(self, trip_request: TripRequest) -> Dict[str, Any]:
+        """Generate an itinerary ahead of time and warm the Maps cache for its destination"""
+        itinerary_data = self.gemini.generate_itinerary(trip_request)
+        if self.maps.is_healthy():
+            try:
+                place_id = self.resolver.place_id(trip_request.destination)
+                if place_id:
+                    self.maps.get_place_details(place_id)
+            except Exception as e:
+                logger.warning(f"Speculative place lookup failed: {e}")
+        return itinerary_data
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "gemini": self.gemini_pool.stats(),
+            "maps": self.maps_pool.stats(),
+            "local": {
+                "workers": int(POOL_CAPACITY.value(pool="local")),
+                "active": int(POOL_ACTIVE.value(pool="local")),
+                "queued": int(POOL_QUEUED.value(pool="local"))
+            }
+        }
+
+    def close(self) -> None:
+        """Release upstream connections on application shutdown"""
+        self.jobs.close()
+        self.gemini_pool.close()
+        self.maps_pool.close()
+        if self.speculation is not None:
+            self.speculation.close()
+        try:
+            self.maps.close()
+        except Exception as e:
+            logger.warning(f"Error closing Maps service: {e}")
+        try:
+            self.rate_limiter.close()
+        except Exception as e:
+            logger.warning(f"Error closing rate limit store: {e}")
+        try:
+            self.sessions.close()
+        except Exception as e:
+            logger.warning(f"Error closing session store: {e}")
+        try:
+            self.state.close()
+        except Exception as e:
+            logger.warning(f"Error closing state store: {e}")
+        if self.fixtures is not None:
+            self.fixtures.close()
+        self.knowledge.close()
+        logger.info("Service container shut down")
+
+
+# FastAPI dependencies - the container is created by the lifespan handler in main.py
+def get_services(request: Request) -> ServiceContainer:
+    return request.app.state.services
+
+def get_gemini_service(request: Request) -> GeminiService:
+    return request.app.state.services.gemini
+
+def get_maps_service(request: Request) -> MapsService:
+    return request.app.state.services.maps
+
+def get_state_store(request: Request) -> StateStore:
+    return request.app.state.services.state
+
+def get_session_store(request: Request) -> PlanningSessionStore:
+    return request.app.state.services.sessions
+
+def get_catalog(request: Request) -> DestinationCatalog:
+    return request.app.state.services.catalog
+
+def get_suggestion_engine(request: Request) -> SuggestionEngine:
+    return request.app.state.services.suggestions
+
+def get_resolver(request: Request) -> DestinationResolver:
+    return request.app.state.services.resolver
+
+def get_knowledge(request: Request) -> KnowledgePacks:
+    return request.app.state.services.knowledge
+
+def get_gemini_pool(request: Request) -> Bulkhead:
+    return request.app.state.services.gemini_pool
+
+def get_maps_pool(request: Request) -> Bulkhead:
+    return request.app.state.services.maps_pool
+
+def get_admission(request: Request) -> AdmissionController:
+    return request.app.state.services.admission
+
+def get_rate_limiter(request: Request) -> RateLimiter:
+    return request.app.state.services.rate_limiter
+
+def get_job_queue(request: Request) -> JobQueue:
+    return request.app.state.services.jobs
+
+def get_speculation(request: Request) -> Optional[SpeculativeGenerator]:
+    return request.app.state.services.speculation
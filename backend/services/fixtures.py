@@ -0,0 +1,246 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, NamedTuple, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+
+class FixtureMissing(Exception):
+    """Raised in replay mode for an upstream request that was never recorded"""
+
+    def __init__(self, upstream: str, method: str, key: str):
+        super().__init__(f"No recorded {upstream}.{method} response for request {key[:12]}")
+        self.upstream = upstream
+        self.method = method
+        self.key = key
+
+
+class ReplayedError(Exception):
+    """A failure recorded from the upstream (or its client library), raised again on replay"""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+class Fixture(NamedTuple):
+    # {"response": ...} for a successful call, {"error": {"type": ..., "message": ...}} for a failed one
+    outcome: Dict[str, Any]
+    latency_seconds: float
+
+
+def _jsonable(value: Any) -> Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def normalize_request(request: Dict[str, Any]) -> str:
+    """Canonical JSON for a request, so equivalent calls share a fixture"""
+    return json.dumps(request, sort_keys=True, separators=(",", ":"), default=_jsonable)
+
+
+def fixture_key(upstream: str, method: str, request: Dict[str, Any]) -> str:
+    return hashlib.sha256(f"{upstream}.{method}:{normalize_request(request)}".encode("utf-8")).hexdigest()
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":"), default=_jsonable).encode("utf-8"), 6)
+
+
+def _unpack(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class FixtureStore:
+    """
+    Recorded upstream responses in a single SQLite file.
+
+    Rows are keyed by a hash of the normalized request; request and response
+    bodies are stored zlib-compressed JSON, the request only so a fixture can
+    be inspected later. Recording the same request again replaces the row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS upstream_fixtures ("
+            " key TEXT PRIMARY KEY,"
+            " upstream TEXT NOT NULL,"
+            " method TEXT NOT NULL,"
+            " request BLOB NOT NULL,"
+            " response BLOB NOT NULL,"
+            " latency_seconds REAL NOT NULL,"
+            " recorded_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, key: str) -> Optional[Fixture]:
+        row = self._connection().execute(
+            "SELECT response, latency_seconds FROM upstream_fixtures WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Fixture(_unpack(row[0]), row[1])
+
+    def put(self, key: str, upstream: str, method: str, request: Dict[str, Any], outcome: Dict[str, Any], latency_seconds: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO upstream_fixtures"
+            " (key, upstream, method, request, response, latency_seconds, recorded_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, upstream, method, _pack(request), _pack(outcome), latency_seconds, time.time())
+        )
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM upstream_fixtures").fetchone()[0]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class UpstreamFixtures:
+    """
+    Record real upstream responses, or replay them instead of calling out.
+
+    In record mode every call is passed through and its response, or the
+    exception it raised, is stored with its latency. In replay mode nothing
+    leaves the process: the recorded outcome comes back after its original
+    latency times latency_scale (0 replays instantly), failures as
+    ReplayedError, and an unrecorded request raises FixtureMissing. The
+    services treat both like any other upstream failure.
+    """
+
+    def __init__(self, store: FixtureStore, mode: str, latency_scale: float = 1.0):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unknown fixture mode '{mode}', expected {MODE_RECORD} or {MODE_REPLAY}")
+        self.store = store
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    def call(
+        self,
+        upstream: str,
+        method: str,
+        request: Dict[str, Any],
+        fn: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda response: response,
+        decode: Callable[[Any], Any] = lambda data: data
+    ) -> Any:
+        """
+        Answer one upstream call from the store or through fn().
+
+        encode/decode convert between what fn returns and the JSON that is
+        stored, for responses that are SDK objects rather than plain data.
+        """
+        key = fixture_key(upstream, method, request)
+        if self.replaying:
+            fixture = self.store.get(key)
+            with self._lock:
+                if fixture is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if fixture is None:
+                logger.warning(f"No fixture for {upstream}.{method} request {key[:12]}")
+                raise FixtureMissing(upstream, method, key)
+            if self.latency_scale > 0:
+                time.sleep(fixture.latency_seconds * self.latency_scale)
+            error = fixture.outcome.get("error")
+            if error is not None:
+                raise ReplayedError(error["type"], error["message"])
+            return decode(fixture.outcome["response"])
+
+        start = time.perf_counter()
+        try:
+            response = fn()
+        except Exception as e:
+            error = {"type": type(e).__name__, "message": str(e)}
+            self._record(key, upstream, method, request, lambda: {"error": error}, time.perf_counter() - start)
+            raise
+        latency = time.perf_counter() - start
+        self._record(key, upstream, method, request, lambda: {"response": encode(response)}, latency)
+        return response
+
+    def _record(
+        self,
+        key: str,
+        upstream: str,
+        method: str,
+        request: Dict[str, Any],
+        outcome: Callable[[], Dict[str, Any]],
+        latency: float
+    ) -> None:
+        # Encoding happens here so a response that cannot be stored never fails the call itself
+        try:
+            self.store.put(key, upstream, method, request, outcome(), latency)
+            with self._lock:
+                self.recorded += 1
+        except Exception as e:
+            logger.warning(f"Could not record {upstream}.{method} response: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded
+        }
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def create_upstream_fixtures() -> Optional[UpstreamFixtures]:
+    """
+    Build the fixture layer from UPSTREAM_FIXTURES (off, record or replay),
+    UPSTREAM_FIXTURES_PATH and UPSTREAM_FIXTURES_LATENCY_SCALE; None when off.
+    """
+    mode = os.getenv("UPSTREAM_FIXTURES", "off").strip().lower()
+    if mode in ("", "off"):
+        return None
+    path = os.getenv("UPSTREAM_FIXTURES_PATH", "upstream_fixtures.db")
+    fixtures = UpstreamFixtures(
+        FixtureStore(path),
+        mode,
+        latency_scale=float(os.getenv("UPSTREAM_FIXTURES_LATENCY_SCALE", "1.0"))
+    )
+    logger.info(f"Upstream fixtures in {mode} mode at {path} ({fixtures.store.count()} recorded)")
+    return fixtures
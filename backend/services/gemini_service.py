@@ -1,31 +1,133 @@
 import os
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+import threading
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Tuple
 from models import TripRequest, ReviewSummary
+from services.cancellation import check_cancelled
+from services.admission import UpstreamLoad
+from services.cache import SingleFlight, TTLCache
+from services.fixtures import UpstreamFixtures
+from services.knowledge import KnowledgePacks, itinerary_grounding
+from services.resolver import DestinationResolver
+from services.similarity import SimilarTripIndex, adapt_itinerary
+from services.metrics import CACHE_REQUESTS, FALLBACKS, GEMINI_TOKENS, UPSTREAM_RETRIES, record_upstream_call
+from services.tracing import SPAN_KIND_CLIENT, set_attribute, start_span
+from services.speculation import trip_fingerprint
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class ReplayedResponse:
+    """Stands in for a GenerateContentResponse served from a recorded fixture"""
+
+    def __init__(self, text: str, usage_metadata: Optional[SimpleNamespace] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+    @classmethod
+    def from_fixture(cls, data: Dict[str, Any]) -> "ReplayedResponse":
+        usage = data.get("usage")
+        return cls(data["text"], SimpleNamespace(**usage) if usage else None)
+
+
+def extract_json_block(text: str) -> Optional[str]:
+    """The text from the first '{' to the last '}', since Gemini sometimes wraps its JSON in prose"""
+    json_start = text.find('{')
+    json_end = text.rfind('}') + 1
+    if json_start == -1 or json_end == 0:
+        return None
+    return text[json_start:json_end]
+
+
+def fix_item_locations(itinerary: Dict[str, Any], destination: str) -> None:
+    """Complete activity locations that Gemini left empty or cut off, in place"""
+    for day in itinerary.get('days') or []:
+        for item in day.get('items', []):
+            if not item.get('location') or item['location'].endswith(' '):
+                item['location'] = item['location'].replace(' ', destination)
+
+
+def _encode_response(response: Any) -> Dict[str, Any]:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": response.text,
+        "usage": None if usage is None else {
+            "prompt_token_count": usage.prompt_token_count,
+            "candidates_token_count": usage.candidates_token_count
+        }
+    }
+
+
 class GeminiService:
-    def __init__(self):
+    def __init__(
+        self,
+        fixtures: Optional[UpstreamFixtures] = None,
+        knowledge: Optional[KnowledgePacks] = None,
+        resolver: Optional[DestinationResolver] = None,
+        similar_trips: Optional[SimilarTripIndex] = None
+    ):
         self.api_key = os.getenv("GOOGLE_AI_API_KEY")
+        # Records real responses, or replays them without calling Gemini at all
+        self.fixtures = fixtures
+        if fixtures is not None and fixtures.replaying and not self.api_key:
+            # Replay never reaches the API, but the client is still built to create request configs
+            self.api_key = "replay"
+        # Point the SDK at another Generative Language API endpoint, e.g. the bench stubs
+        self.base_url = os.getenv("GEMINI_API_BASE_URL")
+        # The google.generativeai SDK is slow to import, so the client is built
+        # on first use (or by the container's warm-up thread) rather than here
+        self._genai = None
+        self._client = None
+        self._init_failed = False
+        self._init_lock = threading.Lock()
+        self.load = UpstreamLoad("gemini")
+        # Last good itinerary per trip, served when admission control degrades a request
+        self.itinerary_cache = TTLCache(max_entries=1024, ttl_seconds=6 * 3600, name="itinerary")
+        # Destination insights barely change; one generation serves every visitor for a day
+        self.insights_cache = TTLCache(max_entries=1024, ttl_seconds=24 * 3600, name="destination_insights")
+        self._insights_inflight = SingleFlight()
+        # Prebuilt facts about catalog destinations, answered locally and used to ground prompts
+        self.knowledge = knowledge if knowledge is not None else KnowledgePacks()
+        # Every destination-keyed cache goes through it, so "PARIS" and "Paris, France" share entries
+        self.resolver = resolver if resolver is not None else DestinationResolver()
+        # Trips close enough to a cached one reuse its itinerary, cut to length, instead of generating
+        self.similar_trips = similar_trips if similar_trips is not None else SimilarTripIndex()
         if not self.api_key:
             logger.warning("GOOGLE_AI_API_KEY not found in environment variables")
-            self.client = None
-        else:
-            try:
-                genai.configure(api_key=self.api_key)
-                self.client = genai.GenerativeModel('gemini-2.0-flash-lite')
-                logger.info("Gemini AI service initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize Gemini service: {e}")
-                self.client = None
+    
+    @property
+    def client(self):
+        """The GenerativeModel, created lazily on first access"""
+        if self._client is None and self.api_key and not self._init_failed:
+            with self._init_lock:
+                if self._client is None and not self._init_failed:
+                    try:
+                        import google.generativeai as genai
+                        if self.base_url:
+                            genai.configure(
+                                api_key=self.api_key,
+                                transport="rest",
+                                client_options={"api_endpoint": self.base_url}
+                            )
+                        else:
+                            genai.configure(api_key=self.api_key)
+                        self._genai = genai
+                        self._client = genai.GenerativeModel('gemini-2.0-flash-lite')
+                        logger.info("Gemini AI service initialized successfully")
+                    except Exception as e:
+                        logger.error(f"Failed to initialize Gemini service: {e}")
+                        self._init_failed = True
+        return self._client
+    
+    def warm_up(self) -> None:
+        """Import the SDK and build the client ahead of the first request"""
+        self.client
     
     def is_healthy(self) -> bool:
         """Check if Gemini service is available"""
-        if self.client is None or not self.api_key:
+        if not self.api_key or self._init_failed:
             logger.warning("Gemini service is not healthy: missing client or API key")
             return False
         
@@ -37,8 +139,65 @@ class GeminiService:
             logger.error(f"Gemini health check failed: {e}")
             return False
     
-    def generate_itinerary(self, trip_request: TripRequest) -> Dict[str, Any]:
-        """Generate a comprehensive travel itinerary using Gemini AI"""
+    def generate_content(self, prompt: str, method: str, attempt: int = 1, **kwargs: Any):
+        """Call the model, tracking in-flight calls, latency and token usage"""
+        check_cancelled("gemini")
+        attributes = {"gen_ai.system": "gemini", "gemini.method": method, "attempt": attempt}
+        with start_span(f"gemini.{method}", kind=SPAN_KIND_CLIENT, **attributes) as span:
+            with self.load.track(), record_upstream_call("gemini", method):
+                if self.fixtures is None:
+                    response = self.client.generate_content(prompt, **kwargs)
+                else:
+                    response = self.fixtures.call(
+                        "gemini", method,
+                        # Indentation changes in a prompt template should not invalidate fixtures
+                        {"prompt": " ".join(prompt.split()), **kwargs},
+                        lambda: self.client.generate_content(prompt, **kwargs),
+                        encode=_encode_response,
+                        decode=ReplayedResponse.from_fixture
+                    )
+            prompt_tokens, completion_tokens, source = self._record_usage(method, prompt, response)
+            span.set_attribute("gen_ai.usage.input_tokens", prompt_tokens)
+            span.set_attribute("gen_ai.usage.output_tokens", completion_tokens)
+            span.set_attribute("gen_ai.usage.source", source)
+        return response
+    
+    def _record_usage(self, method: str, prompt: str, response: Any) -> Tuple[int, int, str]:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            prompt_tokens, completion_tokens, source = usage.prompt_token_count, usage.candidates_token_count, "usage_metadata"
+        else:
+            # Older SDK releases do not surface usage metadata; ~4 characters per token
+            try:
+                completion_chars = len(response.text)
+            except Exception:
+                completion_chars = 0
+            prompt_tokens, completion_tokens, source = len(prompt) // 4, completion_chars // 4, "estimate"
+        GEMINI_TOKENS.inc(prompt_tokens, method=method, kind="prompt", source=source)
+        GEMINI_TOKENS.inc(completion_tokens, method=method, kind="completion", source=source)
+        return prompt_tokens, completion_tokens, source
+    
+    def knowledge_pack(self, destination: str) -> Optional[Dict[str, Any]]:
+        """The prebuilt knowledge pack of a catalog destination, however it is spelled"""
+        destination_id = self.resolver.resolve(destination).destination_id
+        return self.knowledge.get(destination_id) if destination_id else None
+    
+    def trip_key(self, trip_request: TripRequest) -> str:
+        """
+        Itinerary cache, degradation and speculation key, the same for every spelling
+        of the destination. It goes through lookup(), so a destination Maps is still
+        to learn gets its learned key from the start; it may make that one Maps search
+        and belongs on worker threads.
+        """
+        return trip_fingerprint(trip_request, self.resolver.lookup(trip_request.destination).key)
+    
+    def generate_itinerary(self, trip_request: TripRequest, reuse: bool = True) -> Dict[str, Any]:
+        """Generate a comprehensive travel itinerary using Gemini AI; reuse=False skips the cached ones"""
+        attributes = {"trip.destination": trip_request.destination, "trip.duration_days": trip_request.duration_days}
+        with start_span("GeminiService.generate_itinerary", **attributes):
+            return self._generate_itinerary(trip_request, reuse)
+    
+    def _generate_itinerary(self, trip_request: TripRequest, reuse: bool = True) -> Dict[str, Any]:
         if not self.is_healthy():
             raise Exception("Gemini service is not available")
         
@@ -51,12 +210,24 @@ class GeminiService:
             logger.error("Empty destination provided to generate_itinerary")
             raise Exception("Destination is required for itinerary generation")
         
+        # The canonical key only names the cache entries, so every spelling shares them;
+        # the prompt and the itinerary keep the destination as the user wrote it
+        destination_key = self.resolver.lookup(trip_request.destination).key
+        # The same key as trip_key(), which speculation and degradation look it up by
+        cache_key = trip_fingerprint(trip_request, destination_key)
+        if reuse:
+            cached = self._reuse_itinerary(trip_request, destination_key, cache_key)
+            if cached is not None:
+                return cached
         prompt = self._build_itinerary_prompt(trip_request)
         
         try:
             logger.info("Sending request to Gemini AI...")
             # Configure generation with timeout and other parameters
-            generation_config = genai.types.GenerationConfig(
+            client = self.client
+            if client is None:
+                raise Exception("Gemini service is not available")
+            generation_config = self._genai.types.GenerationConfig(
                 temperature=0.7,
                 max_output_tokens=4096,  # Increased for detailed itineraries
                 top_p=0.8,
@@ -68,8 +239,11 @@ class GeminiService:
             max_retries = 2
             for attempt in range(max_retries + 1):
                 try:
-                    response = self.client.generate_content(
+                    # Stops retrying once the client that asked has gone away
+                    response = self.generate_content(
                         prompt,
+                        "generate_itinerary",
+                        attempt=attempt + 1,
                         generation_config=generation_config
                     )
                     break  # Success, exit retry loop
@@ -77,6 +251,8 @@ class GeminiService:
                     if attempt == max_retries:
                         raise e  # Last attempt failed, re-raise
                     logger.warning(f"Gemini API attempt {attempt + 1} failed: {e}. Retrying...")
+                    UPSTREAM_RETRIES.inc(upstream="gemini", method="generate_itinerary")
+                    check_cancelled("gemini")
                     time.sleep(2 ** attempt)  # Exponential backoff
             
             if not response or not response.text:
@@ -88,11 +264,9 @@ class GeminiService:
             
             # Parse the JSON response from Gemini
             # Gemini sometimes includes extra text, so we need to extract the JSON
-            json_start = itinerary_text.find('{')
-            json_end = itinerary_text.rfind('}') + 1
+            json_text = extract_json_block(itinerary_text)
             
-            if json_start != -1 and json_end != 0:
-                json_text = itinerary_text[json_start:json_end]
+            if json_text is not None:
                 try:
                     parsed_result = json.loads(json_text)
                     logger.info("Successfully parsed JSON response from Gemini")
@@ -103,13 +277,10 @@ class GeminiService:
                         return self._create_fallback_itinerary(trip_request, "Invalid structure")
                     
                     # Check if the days contain empty destination strings
-                    if parsed_result.get('days'):
-                        for day in parsed_result['days']:
-                            for item in day.get('items', []):
-                                if not item.get('location') or item['location'].endswith(' '):
-                                    # Fix incomplete location strings
-                                    item['location'] = item['location'].replace(' ', trip_request.destination)
+                    fix_item_locations(parsed_result, trip_request.destination)
                     
+                    self.itinerary_cache.set(cache_key, parsed_result)
+                    self.similar_trips.add(trip_request, destination_key, cache_key)
                     return parsed_result
                     
                 except json.JSONDecodeError as e:
@@ -125,6 +296,35 @@ class GeminiService:
             logger.error(f"Error generating itinerary: {e}")
             raise Exception(f"Failed to generate itinerary: {str(e)}")
     
+    def _reuse_itinerary(self, trip_request: TripRequest, destination_key: str, cache_key: str) -> Optional[Dict[str, Any]]:
+        """The cached itinerary of this trip, or of a near-duplicate adapted to it"""
+        cached = self.itinerary_cache.get(cache_key)
+        if cached is not None or not self.similar_trips.enabled:
+            return cached
+        for match in self.similar_trips.find(trip_request, destination_key):
+            itinerary = self.itinerary_cache.get(match.cache_key)
+            if itinerary is None:
+                self.similar_trips.discard(trip_request, destination_key, match.cache_key)
+                continue
+            logger.info(f"Reusing the itinerary of a similar trip (score {match.score:.3f}, {match.duration_days} days)")
+            CACHE_REQUESTS.inc(cache="itinerary_similar", result="hit")
+            adapted = adapt_itinerary(itinerary, trip_request)
+            # Served from now on as this trip's own, but never matched against; it may be cut short
+            self.itinerary_cache.set(cache_key, adapted)
+            return adapted
+        CACHE_REQUESTS.inc(cache="itinerary_similar", result="miss")
+        return None
+    
+    def degraded_itinerary(self, trip_request: TripRequest) -> Tuple[Dict[str, Any], str]:
+        """
+        Itinerary for an overloaded moment without calling Gemini: cached if possible,
+        else the fallback. Finding the cache key may search Maps; call it off the event loop.
+        """
+        cached = self.itinerary_cache.get(self.trip_key(trip_request))
+        if cached is not None:
+            return cached, "cache"
+        return self._create_fallback_itinerary(trip_request, "AI service overloaded"), "fallback"
+    
     def _build_itinerary_prompt(self, trip: TripRequest) -> str:
         """Build a comprehensive prompt for itinerary generation"""
         
@@ -134,6 +334,15 @@ class GeminiService:
         food_preference = trip.foodPreference or "Any"
         essentials = ', '.join(trip.selectedEssentials) if trip.selectedEssentials else "Standard travel items"
         
+        # With a knowledge pack the model can pick from known places instead of describing the city from scratch
+        pack = self.knowledge_pack(trip.destination)
+        grounding = itinerary_grounding(pack) if pack else ""
+        knowledge_section = f"\n{grounding}\n" if grounding else ""
+        knowledge_instruction = (
+            "\n10. Prefer the places under Local Knowledge, using their exact names, and keep each description to one or two sentences"
+            if grounding else ""
+        )
+        
         return f"""
 You are an expert travel planner with deep knowledge of destinations worldwide. Create a detailed, practical itinerary for the following trip with comprehensive planning details:
 
@@ -154,7 +363,7 @@ You are an expert travel planner with deep knowledge of destinations worldwide.
 - Food Preference: {food_preference}
 - Essential Items: {essentials}
 - Constraints: {trip.constraints or 'None specified'}
-
+{knowledge_section}
 **Instructions:**
 1. Create a day-by-day itinerary with specific times that considers ALL the selected preferences
 2. Include activities that match the interests and accommodation level
@@ -164,7 +373,7 @@ You are an expert travel planner with deep knowledge of destinations worldwide.
 6. Include mix of activities based on budget level and travel style
 7. Add practical details like duration, location, and costs
 8. Suggest booking requirements where needed
-9. Make the itinerary personalized based on the comprehensive trip data
+9. Make the itinerary personalized based on the comprehensive trip data{knowledge_instruction}
 
 **Response Format (MUST be valid JSON):**
 {{
@@ -211,6 +420,8 @@ Make sure the response is ONLY valid JSON without any additional text before or
     
     def _create_fallback_itinerary(self, trip: TripRequest, error_info: str) -> Dict[str, Any]:
         """Create a basic itinerary structure as fallback"""
+        FALLBACKS.inc(component="gemini_itinerary", strategy="template")
+        set_attribute("fallback.reason", error_info)
         days = []
         for day in range(1, trip.duration_days + 1):
             days.append({
@@ -288,15 +499,13 @@ Focus on common themes and provide actionable insights.
 """
         
         try:
-            response = self.client.generate_content(prompt)
+            response = self.generate_content(prompt, "summarize_reviews")
             result_text = response.text
             
             # Extract JSON from response
-            json_start = result_text.find('{')
-            json_end = result_text.rfind('}') + 1
+            json_text = extract_json_block(result_text)
             
-            if json_start != -1 and json_end != 0:
-                json_text = result_text[json_start:json_end]
+            if json_text is not None:
                 data = json.loads(json_text)
                 return ReviewSummary(**data)
             else:
@@ -308,6 +517,7 @@ Focus on common themes and provide actionable insights.
     
     def _create_fallback_review_summary(self) -> ReviewSummary:
         """Create a fallback review summary"""
+        FALLBACKS.inc(component="gemini_reviews", strategy="template")
         return ReviewSummary(
             pros=["Generally positive feedback", "Good service quality"],
             cons=["Some minor issues reported", "Limited feedback available"],
@@ -315,10 +525,22 @@ Focus on common themes and provide actionable insights.
         )
     
     def get_destination_insights(self, destination: str) -> Dict[str, Any]:
-        """Get AI-powered insights about a destination"""
+        """Get AI-powered insights about a destination, from its knowledge pack or cached per destination"""
+        pack = self.knowledge_pack(destination)
+        if pack and pack.get("insights"):
+            return pack["insights"]
         if not self.is_healthy():
             return {"error": "Gemini service not available"}
         
+        resolved = self.resolver.resolve(destination)
+        key = resolved.key
+        cached = self.insights_cache.get(key)
+        if cached is not None:
+            return cached
+        # Concurrent requests for the same destination share one generation
+        return self._insights_inflight.do(key, lambda: self._get_destination_insights(key, resolved.name))
+    
+    def _get_destination_insights(self, key: str, destination: str) -> Dict[str, Any]:
         prompt = f"""
 Provide comprehensive insights about {destination} as a travel destination.
 
@@ -339,15 +561,15 @@ Include the following in JSON format:
 """
         
         try:
-            response = self.client.generate_content(prompt)
+            response = self.generate_content(prompt, "get_destination_insights")
             result_text = response.text
             
-            json_start = result_text.find('{')
-            json_end = result_text.rfind('}') + 1
+            json_text = extract_json_block(result_text)
             
-            if json_start != -1 and json_end != 0:
-                json_text = result_text[json_start:json_end]
-                return json.loads(json_text)
+            if json_text is not None:
+                insights = json.loads(json_text)
+                self.insights_cache.set(key, insights)
+                return insights
             else:
                 return {"error": "Could not parse destination insights"}
                 
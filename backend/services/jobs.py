@@ -0,0 +1,179 @@
+import itertools
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from services.cancellation import CancellationToken, RequestCancelled, bind_token, reset_token
+from services.state_store import StateStore
+from services.metrics import REGISTRY
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOBS = "jobs"
+
+# Lower numbers run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+PRIORITIES = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+JOB_QUEUE_DEPTH = REGISTRY.gauge("tripmigo_job_queue_depth", "Background jobs waiting to start in this process")
+JOBS_FINISHED = REGISTRY.counter("tripmigo_jobs_finished_total", "Background jobs by kind and final status", ("kind", "status"))
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobQueue:
+    """
+    Bounded, prioritized background queue for slow generation work.
+
+    Jobs run on a fixed pool of worker threads, so request threads return as
+    soon as a job is queued. Every state change is written to the shared state
+    store with a TTL, which lets any worker process answer status and result
+    calls and keeps finished results around for result_ttl_seconds. Status
+    changes are compare-and-set, so a cancel racing a worker's start or finish
+    is never overwritten.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        workers: int = 4,
+        max_queue: int = 100,
+        result_ttl_seconds: float = 3600
+    ):
+        self.store = store
+        self.max_queue = max_queue
+        self.result_ttl_seconds = result_ttl_seconds
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._functions: Dict[str, Callable[[], Any]] = {}
+        # Jobs running in this process, stopped at their next upstream call by cancel()
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        JOB_QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting to start in this process"""
+        return len(self._functions)
+
+    def submit(self, kind: str, fn: Callable[[], Any], priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        """Queue fn() and return the new job record"""
+        with self._lock:
+            if len(self._functions) >= self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+            job_id = str(uuid.uuid4())
+            self._functions[job_id] = fn
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "priority": priority,
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        self._save(job)
+        self._queue.put((priority, next(self._sequence), job_id))
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(JOBS, job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job. Queued jobs never start; a job running in this process
+        stops at its next upstream call, retries included. A call already on
+        the wire, or a job running in another worker process, is left to
+        finish, but its result is discarded.
+        """
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATES:
+                return job
+            cancelled = {**job, "status": CANCELLED, "finished_at": datetime.now().isoformat()}
+            # Fails when a worker started or finished the job since it was read; read it again
+            if self._transition(job, cancelled):
+                break
+        with self._lock:
+            self._functions.pop(job_id, None)
+            token = self._tokens.get(job_id)
+        if token is not None:
+            token.cancel("job cancelled")
+        return cancelled
+
+    def close(self) -> None:
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._sequence), None))
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        self.store.set(JOBS, job["job_id"], job, ttl_seconds=self.result_ttl_seconds)
+
+    def _transition(self, job: Dict[str, Any], updated: Dict[str, Any]) -> bool:
+        """Write updated only if the stored job is still job as read"""
+        return self.store.compare_and_set(JOBS, job["job_id"], job, updated, ttl_seconds=self.result_ttl_seconds)
+
+    def _work(self) -> None:
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                fn = self._functions.pop(job_id, None)
+            queued = self.get(job_id)
+            # Cancelled while queued (possibly by another worker process)
+            if fn is None or queued is None or queued["status"] != QUEUED:
+                continue
+            job = {**queued, "status": RUNNING, "started_at": datetime.now().isoformat()}
+            token = CancellationToken()
+            with self._lock:
+                self._tokens[job_id] = token
+            # A cancel that landed since the read wins; the job never starts
+            if not self._transition(queued, job):
+                with self._lock:
+                    self._tokens.pop(job_id, None)
+                continue
+
+            start = time.perf_counter()
+            reset = bind_token(token)
+            try:
+                result, error, status = fn(), None, SUCCEEDED
+            except RequestCancelled:
+                logger.info(f"Job {job_id} ({job['kind']}) stopped after cancellation")
+                continue
+            except Exception as e:
+                result, error, status = None, str(e), FAILED
+                logger.error(f"Job {job_id} ({job['kind']}) failed: {e}")
+            finally:
+                reset_token(reset)
+                with self._lock:
+                    self._tokens.pop(job_id, None)
+
+            finished = {**job, "status": status, "result": result, "error": error, "finished_at": datetime.now().isoformat()}
+            if not self._transition(job, finished):
+                logger.info(f"Job {job_id} finished after cancellation, discarding result")
+                continue
+            JOBS_FINISHED.inc(kind=job["kind"], status=status)
+            logger.info(f"Job {job_id} ({job['kind']}) {status} in {time.perf_counter() - start:.2f} seconds")
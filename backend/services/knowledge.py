@@ -0,0 +1,185 @@
+"""
+Precomputed destination knowledge packs.
+
+`python build_knowledge_packs.py` asks Gemini and Maps once per catalog
+destination for what every request about that destination would otherwise
+rediscover: the insights JSON, the place details of the destination itself,
+its top attractions with place ids and coordinates, and a lodging inventory
+with review summaries. The packs are written to one file
+(data/knowledge_packs.bin, or KNOWLEDGE_PACKS_FILE):
+
+    MAGIC | index length (8 bytes, little-endian) | index JSON | pack JSON...
+
+The index maps destination ids to the offset and length of their pack; the
+DestinationResolver turns what users type into those ids. At runtime the
+file is memory-mapped, so worker processes share one copy in the page cache
+and a pack is only read and parsed when it is first asked for. Photo
+references are stored instead of photo URLs, which carry the Maps API key.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, List, Optional
+from responses import dumps
+from services.cache import TTLCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "knowledge_packs.bin")
+MAGIC = b"TMKPACK1"
+_LENGTH = struct.Struct("<Q")
+# How much of a pack goes into a prompt; enough to ground it without growing it back
+GROUNDING_ATTRACTIONS = 12
+GROUNDING_HOTELS = 10
+
+
+def write_packs(path: str, packs: Dict[str, Dict[str, Any]]) -> str:
+    """Write packs keyed by destination id to path atomically, returning their version"""
+    offset = 0
+    bodies = []
+    digest = hashlib.blake2b(digest_size=16)
+    index: Dict[str, Any] = {"packs": {}}
+    for destination_id, pack in packs.items():
+        body = dumps(pack)
+        index["packs"][destination_id] = [offset, len(body)]
+        bodies.append(body)
+        digest.update(body)
+        offset += len(body)
+    index["version"] = digest.hexdigest()
+    header = dumps(index)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        for body in bodies:
+            f.write(body)
+    # Replacing rather than rewriting keeps the old file valid for processes that still map it
+    os.replace(temporary, path)
+    return index["version"]
+
+
+class KnowledgePacks:
+    """Read-only, memory-mapped packs by catalog destination id; empty when there is no file"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.version = "none"
+        self._map: Optional[mmap.mmap] = None
+        self._packs: Dict[str, List[int]] = {}
+        self._start = 0
+        # Parsed packs; the file never changes under a running process
+        self._parsed = TTLCache(max_entries=256, ttl_seconds=float("inf"), name="knowledge_packs")
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a knowledge pack file")
+        start = len(MAGIC) + _LENGTH.size
+        (length,) = _LENGTH.unpack_from(self._map, len(MAGIC))
+        index = json.loads(self._map[start:start + length])
+        self._packs = index["packs"]
+        self._start = start + length
+        self.version = index["version"]
+
+    def __len__(self) -> int:
+        return len(self._packs)
+
+    def __contains__(self, destination_id: str) -> bool:
+        return destination_id in self._packs
+
+    def ids(self) -> Iterable[str]:
+        return self._packs.keys()
+
+    def raw(self, destination_id: str) -> Optional[bytes]:
+        """The stored JSON of one pack"""
+        location = self._packs.get(destination_id)
+        if location is None or self._map is None:
+            return None
+        offset, length = location
+        return self._map[self._start + offset:self._start + offset + length]
+
+    def get(self, destination_id: str) -> Optional[Dict[str, Any]]:
+        """The pack of a catalog destination; shared between callers, so never modify it"""
+        pack = self._parsed.get(destination_id)
+        if pack is None:
+            raw = self.raw(destination_id)
+            if raw is None:
+                return None
+            pack = json.loads(raw)
+            self._parsed.set(destination_id, pack)
+        return pack
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._parsed.clear()
+
+
+def _budget_line(budget_estimates: Dict[str, Any]) -> str:
+    return ", ".join(f"{level} {value}" for level, value in budget_estimates.items())
+
+
+def itinerary_grounding(pack: Dict[str, Any]) -> str:
+    """Facts about a destination for the itinerary prompt, one line each"""
+    insights = pack.get("insights") or {}
+    lines = [f"**Local Knowledge for {pack['name']} (verified; build on it rather than restating it):**"]
+    for label, field in (
+        ("Best time to visit", "best_time_to_visit"),
+        ("Highlights", "highlights"),
+        ("Local cuisine", "local_cuisine"),
+        ("Getting around", "transportation")
+    ):
+        value = insights.get(field)
+        if value:
+            lines.append(f"- {label}: {value if isinstance(value, str) else '; '.join(value)}")
+    if insights.get("budget_estimates"):
+        lines.append(f"- Daily budget: {_budget_line(insights['budget_estimates'])}")
+    attractions = pack.get("attractions") or []
+    if attractions:
+        places = "; ".join(
+            f"{place['name']} ({place['lat']:.4f},{place['lng']:.4f})"
+            for place in attractions[:GROUNDING_ATTRACTIONS] if place.get("lat") is not None
+        )
+        lines.append(f"- Top places (name and coordinates): {places}")
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def lodging_grounding(pack: Dict[str, Any]) -> str:
+    """The known hotels of a destination for the hotel prompts, one line each"""
+    hotels = (pack.get("lodging") or [])[:GROUNDING_HOTELS]
+    if not hotels:
+        return ""
+    lines = [f"**Known hotels in {pack['name']} (real; copy name, address and coordinates exactly):**"]
+    for hotel in hotels:
+        parts = [hotel["name"], hotel.get("address") or ""]
+        if hotel.get("lat") is not None:
+            parts.append(f"{hotel['lat']:.5f},{hotel['lng']:.5f}")
+        if hotel.get("rating") is not None:
+            parts.append(f"rating {hotel['rating']} ({hotel.get('user_ratings_total') or 0} reviews)")
+        if hotel.get("price_level") is not None:
+            parts.append(f"price level {hotel['price_level']}/4")
+        summary = hotel.get("review_summary")
+        if summary:
+            parts.append(f"guests like {'; '.join(summary.get('pros', [])[:2])}; dislike {'; '.join(summary.get('cons', [])[:2])}")
+        lines.append("- " + " | ".join(parts))
+    return "\n".join(lines)
+
+
+def load_knowledge_packs(path: Optional[str] = None) -> KnowledgePacks:
+    """The packs from data/knowledge_packs.bin (or KNOWLEDGE_PACKS_FILE); empty if it was never built"""
+    path = path or os.getenv("KNOWLEDGE_PACKS_FILE") or DEFAULT_KNOWLEDGE_FILE
+    if not os.path.exists(path):
+        logger.info(f"No knowledge packs at {path}; run build_knowledge_packs.py to create them")
+        return KnowledgePacks()
+    packs = KnowledgePacks(path)
+    logger.info(f"Mapped {len(packs)} destination knowledge packs from {path}")
+    return packs
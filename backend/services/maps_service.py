@@ -1,23 +1,91 @@
 import os
-import googlemaps
-from typing import Dict, Any, List, Optional
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Callable, List, Optional
+from services.cache import SingleFlight, TTLCache
+from services.cancellation import check_cancelled
+from services.fixtures import UpstreamFixtures
+from services.metrics import FALLBACKS, record_upstream_call
+from services.resolver import name_key
+from services.tracing import SPAN_KIND_CLIENT, set_attribute, start_span
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class MapsService:
-    def __init__(self):
+    def __init__(
+        self,
+        pool_size: int = 20,
+        cache_ttl_seconds: float = 6 * 3600,
+        fixtures: Optional[UpstreamFixtures] = None
+    ):
         self.api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+        # Records real responses, or replays them without calling Maps at all
+        self.fixtures = fixtures
+        if fixtures is not None and fixtures.replaying and not self.api_key:
+            # googlemaps only accepts keys in the AIza... format, even though replay never sends it
+            self.api_key = "AIzaReplayOnlyPlaceholderKey0000000000"
+        # Maps web services host; overridden to run against the bench stubs
+        self.base_url = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+        
+        # One pooled HTTP session shared by the googlemaps client and our direct Places calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Place lookups are stable for hours, so cache them across requests
+        self.search_cache = TTLCache(max_entries=2048, ttl_seconds=cache_ttl_seconds, name="maps_search")
+        self.details_cache = TTLCache(max_entries=2048, ttl_seconds=cache_ttl_seconds, name="maps_details")
+        self._inflight = SingleFlight()
+        
+        # googlemaps is imported on first use (or by the container's warm-up thread)
+        self._client = None
+        self._init_lock = threading.Lock()
         if not self.api_key:
             logger.warning("GOOGLE_MAPS_API_KEY not found in environment variables")
-            self.client = None
-        else:
-            self.client = googlemaps.Client(key=self.api_key)
+    
+    @property
+    def client(self):
+        """The googlemaps.Client, created lazily on first access"""
+        if self._client is None and self.api_key:
+            with self._init_lock:
+                if self._client is None:
+                    import googlemaps
+                    self._client = googlemaps.Client(
+                        key=self.api_key,
+                        requests_session=self.session,
+                        base_url=self.base_url
+                    )
+        return self._client
+    
+    def warm_up(self) -> None:
+        """Import the SDK and build the client ahead of the first request"""
+        self.client
+    
+    def close(self) -> None:
+        """Release pooled connections and drop cached lookups"""
+        self.search_cache.clear()
+        self.details_cache.clear()
+        self.session.close()
     
     def is_healthy(self) -> bool:
         """Check if Google Maps service is available"""
-        return self.client is not None and self.api_key is not None
+        return bool(self.api_key)
+    
+    def _call(self, method: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Make one Maps API request, recording its latency, outcome and a client span"""
+        with start_span(f"maps.{method}", kind=SPAN_KIND_CLIENT, **{"maps.method": method}):
+            with record_upstream_call("maps", method):
+                if self.fixtures is None:
+                    return fn(*args, **kwargs)
+                return self.fixtures.call("maps", method, {"args": args, "kwargs": kwargs}, lambda: fn(*args, **kwargs))
+    
+    def _text_search(self, query: str) -> Dict[str, Any]:
+        url = f"{self.base_url}/maps/api/place/textsearch/json"
+        return self.session.get(url, params={"query": query, "key": self.api_key}).json()
     
     def get_api_key(self) -> str:
         """Get the Google Maps API key for frontend"""
@@ -30,13 +98,25 @@ class MapsService:
         if not self.is_healthy():
             return {"error": "Google Maps service not available", "results": []}
         
-        try:
-            # Validate the query first
-            if not query or not query.strip():
-                return {"error": "Empty query provided", "results": []}
+        # Validate the query first
+        if not query or not query.strip():
+            return {"error": "Empty query provided", "results": []}
+        
+        # Clean the query; "Paris, France " and "paris france" share one cache entry
+        query = query.strip()
+        key = name_key(query) or query
+        with start_span("MapsService.search_places", **{"maps.query": query}) as span:
+            cached = self.search_cache.get(key)
+            span.set_attribute("cache.hit", cached is not None)
+            if cached is not None:
+                return cached
             
-            # Clean the query
-            query = query.strip()
+            check_cancelled("maps")
+            # Concurrent searches for the same query share one set of upstream calls
+            return self._inflight.do(("search", key), lambda: self._search_places(query, key))
+    
+    def _search_places(self, query: str, key: str) -> Dict[str, Any]:
+        try:
             logger.info(f"Searching for places with query: '{query}'")
             
             # Try different approaches based on query type
@@ -44,16 +124,7 @@ class MapsService:
             # Method 1: Try text search (most flexible)
             try:
                 # Use the newer places API with text search
-                import requests
-                
-                url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-                params = {
-                    'query': query,
-                    'key': self.api_key
-                }
-                
-                response = requests.get(url, params=params)
-                result = response.json()
+                result = self._call("textsearch", self._text_search, query)
                 
                 if result.get('status') == 'OK':
                     places = result.get('results', [])
@@ -73,7 +144,10 @@ class MapsService:
                         }
                         formatted_places.append(formatted_place)
                     
-                    return {"results": formatted_places, "status": "OK"}
+                    search_result = {"results": formatted_places, "status": "OK"}
+                    self.search_cache.set(key, search_result)
+                    set_attribute("maps.search.strategy", "textsearch")
+                    return search_result
                 else:
                     logger.warning(f"Text search failed with status: {result.get('status')}")
             
@@ -81,8 +155,10 @@ class MapsService:
                 logger.warning(f"Text search failed: {text_search_error}")
             
             # Method 2: Fallback to find_place
+            FALLBACKS.inc(component="maps_search", strategy="find_place")
             try:
-                result = self.client.find_place(
+                result = self._call(
+                    "find_place", self.client.find_place,
                     input=query,
                     input_type="textquery",
                     fields=[
@@ -108,14 +184,19 @@ class MapsService:
                     }
                     formatted_places.append(formatted_place)
                 
-                return {"results": formatted_places, "status": "OK"}
+                search_result = {"results": formatted_places, "status": "OK"}
+                if formatted_places:
+                    self.search_cache.set(key, search_result)
+                set_attribute("maps.search.strategy", "find_place")
+                return search_result
                 
             except Exception as find_place_error:
                 logger.warning(f"Find place failed: {find_place_error}")
             
             # Method 3: Last resort - geocoding
+            FALLBACKS.inc(component="maps_search", strategy="geocode")
             try:
-                geocode_result = self.client.geocode(query)
+                geocode_result = self._call("geocode", self.client.geocode, query)
                 if geocode_result:
                     place = geocode_result[0]
                     formatted_place = {
@@ -128,7 +209,10 @@ class MapsService:
                         "geometry": place.get("geometry", {}),
                         "photos": []
                     }
-                    return {"results": [formatted_place], "status": "OK"}
+                    search_result = {"results": [formatted_place], "status": "OK"}
+                    self.search_cache.set(key, search_result)
+                    set_attribute("maps.search.strategy", "geocode")
+                    return search_result
             except Exception as geocode_error:
                 logger.warning(f"Geocoding failed: {geocode_error}")
             
@@ -143,6 +227,16 @@ class MapsService:
         if not self.is_healthy():
             return {"error": "Google Maps service not available"}
         
+        with start_span("MapsService.get_place_details", **{"maps.place_id": place_id}) as span:
+            cached = self.details_cache.get(place_id)
+            span.set_attribute("cache.hit", cached is not None)
+            if cached is not None:
+                return cached
+            
+            check_cancelled("maps")
+            return self._inflight.do(("details", place_id), lambda: self._get_place_details(place_id))
+    
+    def _get_place_details(self, place_id: str) -> Dict[str, Any]:
         try:
             # Request comprehensive place details INCLUDING photos
             fields = [
@@ -152,7 +246,7 @@ class MapsService:
                 "price_level", "photos", "types"
             ]
             
-            result = self.client.place(place_id=place_id, fields=fields)
+            result = self._call("place", self.client.place, place_id=place_id, fields=fields)
             place_data = result.get("result", {})
             
             # Get and format photos 
@@ -176,6 +270,7 @@ class MapsService:
                 "types": place_data.get("types", [])
             }
             
+            self.details_cache.set(place_id, formatted_place)
             return formatted_place
             
         except Exception as e:
@@ -187,8 +282,11 @@ class MapsService:
         if not self.is_healthy():
             return {"error": "Google Maps service not available"}
         
+        check_cancelled("maps")
+        
         try:
-            result = self.client.directions(
+            result = self._call(
+                "directions", self.client.directions,
                 origin=origin,
                 destination=destination,
                 mode=mode,
@@ -221,8 +319,10 @@ class MapsService:
         if not self.is_healthy():
             return {"error": "Google Maps service not available"}
         
+        check_cancelled("maps")
+        
         try:
-            result = self.client.geocode(address)
+            result = self._call("geocode", self.client.geocode, address)
             
             if not result:
                 return {"error": "Address not found", "results": []}
@@ -248,16 +348,19 @@ class MapsService:
         if not self.is_healthy():
             return {"error": "Google Maps service not available"}
         
+        check_cancelled("maps")
+        
         try:
             # First geocode the location to get coordinates
-            geocode_result = self.client.geocode(location)
+            geocode_result = self._call("geocode", self.client.geocode, location)
             if not geocode_result:
                 return {"error": "Location not found", "results": []}
             
             location_coords = geocode_result[0]["geometry"]["location"]
             
             # Search for nearby places
-            result = self.client.places_nearby(
+            result = self._call(
+                "places_nearby", self.client.places_nearby,
                 location=location_coords,
                 radius=radius,
                 type=place_type
@@ -346,12 +449,13 @@ class MapsService:
             # If location is provided, use nearby search
             if location:
                 # Geocode the location first
-                geocode_result = self.client.geocode(location)
+                geocode_result = self._call("geocode", self.client.geocode, location)
                 if geocode_result:
                     lat_lng = geocode_result[0]['geometry']['location']
                     
                     # Perform nearby search
-                    result = self.client.places_nearby(
+                    result = self._call(
+                        "places_nearby", self.client.places_nearby,
                         location=lat_lng,
                         radius=radius,
                         keyword=query
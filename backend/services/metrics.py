@@ -0,0 +1,274 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+
+class _Metric:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Point-in-time value that can go up and down"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels: str) -> None:
+        """Read the value from fn whenever the gauge is sampled"""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        with self._lock:
+            fn = self._functions.get(key)
+            if fn is None:
+                return self._values.get(key, 0)
+        return fn()
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            functions = list(self._functions.items())
+        return super().samples() + [(dict(zip(self.labelnames, key)), fn()) for key, fn in functions]
+
+
+# Upstream calls take seconds, so the upper buckets go well past the usual 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies) in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def series(self) -> List[Tuple[Dict[str, str], List[Tuple[float, float]], float, float]]:
+        """(labels, cumulative bucket counts by upper bound, sum, count) per label set"""
+        result = []
+        with self._lock:
+            items = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in items:
+            cumulative, running = [], 0
+            for bound, count in zip(self.buckets, values):
+                running += count
+                cumulative.append((bound, running))
+            cumulative.append((float("inf"), values[-1]))
+            result.append((dict(zip(self.labelnames, key)), cumulative, values[-2], values[-1]))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Tuple[str, ...]):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return metric
+
+    def metrics(self) -> List[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in sorted(self.metrics(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            if isinstance(metric, Histogram):
+                for labels, buckets, total, count in metric.series():
+                    for bound, cumulative in buckets:
+                        le = "+Inf" if bound == float("inf") else _format_value(bound)
+                        lines.append(f"{metric.name}_bucket{_format_labels(labels, le=le)} {_format_value(cumulative)}")
+                    lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(count)}")
+            else:
+                for labels, value in metric.samples():
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str], **extra: str) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Process-wide registry shared by all services
+REGISTRY = Registry()
+
+# Upstream calls skipped because the client that asked for them had gone away
+CANCELLED_UPSTREAM_CALLS = REGISTRY.counter(
+    "tripmigo_cancelled_upstream_calls_total",
+    "Upstream calls not made because the requesting client disconnected",
+    ("upstream",)
+)
+CANCELLED_REQUESTS = REGISTRY.counter(
+    "tripmigo_cancelled_requests_total",
+    "Requests abandoned by the client before a response was sent, by route template",
+    ("route",)
+)
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "tripmigo_http_request_duration_seconds",
+    "Time to serve a request, by route template",
+    ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "tripmigo_http_requests_in_progress",
+    "Requests currently being served",
+    ("method",)
+)
+UPSTREAM_REQUEST_DURATION = REGISTRY.histogram(
+    "tripmigo_upstream_request_duration_seconds",
+    "Latency of individual Gemini and Maps API calls",
+    ("upstream", "method", "outcome")
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "tripmigo_upstream_retries_total",
+    "Upstream calls retried after a failed attempt",
+    ("upstream", "method")
+)
+FALLBACKS = REGISTRY.counter(
+    "tripmigo_fallbacks_total",
+    "Responses built from a fallback strategy instead of the primary upstream result",
+    ("component", "strategy")
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "tripmigo_cache_requests_total",
+    "Cache lookups by cache and result",
+    ("cache", "result")
+)
+GEMINI_TOKENS = REGISTRY.counter(
+    "tripmigo_gemini_tokens_total",
+    "Gemini tokens used, from the response usage metadata or estimated from text length",
+    ("method", "kind", "source")
+)
+
+
+@contextmanager
+def record_upstream_call(upstream: str, method: str):
+    """Time one upstream API call into UPSTREAM_REQUEST_DURATION, labelled by outcome"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start, upstream=upstream, method=method, outcome=outcome)
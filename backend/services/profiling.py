@@ -0,0 +1,345 @@
+"""
+Sampling profiler for single requests.
+
+While a request is profiled, a background thread wakes every few
+milliseconds and records the Python stack of every thread in the worker.
+A thread that used CPU for most of the interval, by its own CPU clock, is
+computing. Threads without a CPU clock (outside Linux) fall back to
+whether the innermost frame is in socket, ssl or lock code. Each sample is
+sorted into one of these buckets:
+- waiting on Gemini or Maps: a blocked thread under a Gemini or Maps
+  service call;
+- other waits: a blocked thread inside application code;
+- CPU in parsing and serialization: json, Pydantic, or FastAPI's encoders
+  and responses;
+- other CPU.
+Idle threads are skipped: blocked threads with no application frame, like
+the event loop in select, and workers waiting on their queue for work.
+
+Stacks are kept in collapsed form ("bucket;thread;frame;...;frame count"),
+which flamegraph.pl and speedscope read directly.
+
+Sampling covers the whole process. A profile taken while other requests
+are running includes their work too; max_concurrent_requests in the
+summary says when that happened. The sampler only runs while at least one
+profile is open, so there is no cost between profiled requests.
+"""
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+WAIT_GEMINI = "wait:gemini"
+WAIT_MAPS = "wait:maps"
+WAIT_OTHER = "wait:other"
+CPU_SERIALIZATION = "cpu:serialization"
+CPU_OTHER = "cpu:other"
+CATEGORIES = (WAIT_GEMINI, WAIT_MAPS, WAIT_OTHER, CPU_SERIALIZATION, CPU_OTHER)
+
+# A thread whose innermost frame is in one of these is blocked, not computing
+BLOCKING_MODULES = {"socket", "ssl", "selectors", "select", "threading", "queue", "http.client", "concurrent.futures._base"}
+SERIALIZATION_PREFIXES = ("json", "pydantic", "fastapi.encoders", "starlette.responses")
+APP_PREFIXES = ("routers", "services", "middleware", "models", "main", "settings", "gemini_utils")
+MAX_STACK_DEPTH = 128
+
+
+def _module_name(frame) -> str:
+    return frame.f_globals.get("__name__") or os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+
+
+def _has_prefix(module: str, prefixes: Tuple[str, ...]) -> bool:
+    return any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes)
+
+
+def _thread_role(name: str) -> str:
+    """Thread names without their pool index, so a pool's threads share one flame graph root"""
+    return re.sub(r"[-_ ]?\d+(_\d+)?$", "", name) or name
+
+
+def _thread_cpu_time(thread_id: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def classify(modules: List[str], functions: List[str], blocked: bool) -> Optional[str]:
+    """The bucket for one thread's stack, given its frames from root to leaf; None if idle"""
+    if blocked:
+        if ("queue", "get") in zip(modules, functions):
+            return None
+        if "services.gemini_service" in modules:
+            return WAIT_GEMINI
+        if "services.maps_service" in modules:
+            return WAIT_MAPS
+        if any(_has_prefix(module, APP_PREFIXES) for module in modules):
+            return WAIT_OTHER
+        return None
+    if any(_has_prefix(module, SERIALIZATION_PREFIXES) for module in modules):
+        return CPU_SERIALIZATION
+    return CPU_OTHER
+
+
+class Profile:
+    """Samples collected for one request"""
+
+    def __init__(self, profile_id: str, name: str, trigger: str):
+        self.id = profile_id
+        self.name = name
+        self.trigger = trigger
+        self.stacks: Counter = Counter()
+        self.categories: Counter = Counter()
+        self.samples = 0
+        self.sampled_seconds = 0.0
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_concurrent_requests = 1
+        self.status_code: Optional[int] = None
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def add(self, samples: List[Tuple[str, str]], interval: float) -> None:
+        self.samples += 1
+        self.sampled_seconds += interval
+        for category, stack in samples:
+            self.categories[category] += 1
+            self.stacks[stack] += 1
+
+    def finish(self) -> None:
+        self.wall_seconds = time.perf_counter() - self._start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+
+    def collapsed(self) -> str:
+        """Flame-graph input, one "frame;frame;... count" line per distinct stack"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        # Each sample stands for the time since the previous one, on every thread it caught
+        seconds_per_sample = self.sampled_seconds / self.samples if self.samples else 0.0
+        return {
+            "id": self.id,
+            "name": self.name,
+            "trigger": self.trigger,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_seconds * 1000, 2),
+            "process_cpu_ms": round(self.cpu_seconds * 1000, 2),
+            "samples": self.samples,
+            "max_concurrent_requests": self.max_concurrent_requests,
+            "thread_ms": {
+                category: round(self.categories[category] * seconds_per_sample * 1000, 2)
+                for category in CATEGORIES
+            }
+        }
+
+
+class Sampler:
+    """One background thread sampling every thread's stack for all open profiles"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._profiles: List[Profile] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._cpu_times: Dict[int, float] = {}
+
+    def open(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def close(self, profile: Profile) -> None:
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+        profile.finish()
+
+    def _take_sample(self, interval: float) -> List[Tuple[str, str]]:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        previous_cpu_times, self._cpu_times = self._cpu_times, {}
+        samples = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            modules = [_module_name(f) for f in frames]
+            functions = [f.f_code.co_name for f in frames]
+            cpu_time = _thread_cpu_time(thread_id)
+            if cpu_time is None:
+                blocked = modules[-1] in BLOCKING_MODULES
+            else:
+                previous = previous_cpu_times.get(thread_id)
+                self._cpu_times[thread_id] = cpu_time
+                blocked = previous is None or cpu_time - previous < interval / 2
+            category = classify(modules, functions, blocked)
+            if category is None:
+                continue
+            labels = [f"{module}:{function}" for module, function in zip(modules, functions)]
+            role = _thread_role(names.get(thread_id, str(thread_id)))
+            samples.append((category, ";".join([category, role] + labels)))
+        return samples
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                while not self._profiles:
+                    self._wake.wait()
+                    # CPU clocks read before the pause would make every thread look busy
+                    self._cpu_times = {}
+                    last = time.perf_counter()
+            time.sleep(self.interval_seconds)
+            now = time.perf_counter()
+            try:
+                samples = self._take_sample(now - last)
+            except Exception as e:
+                logger.warning(f"Profiler sample failed: {e}")
+                continue
+            with self._lock:
+                for profile in self._profiles:
+                    profile.add(samples, now - last)
+            last = now
+
+
+class Profiler:
+    """
+    Decides which requests to profile and keeps the most recent profiles.
+
+    A request is profiled when it carries the admin token in the
+    X-Profile-Token header, or at random for sample_rate of all requests.
+    Finished profiles are kept in memory (the last `keep`) and, when a
+    directory is configured, written there as <id>.json and <id>.collapsed.
+    """
+
+    def __init__(
+        self,
+        admin_token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        interval_seconds: float = 0.005,
+        keep: int = 50,
+        directory: Optional[str] = None
+    ):
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.sampler = Sampler(interval_seconds)
+        self.keep = keep
+        self.directory = directory
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._open: List[Profile] = []
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.admin_token) or self.sample_rate > 0
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        return bool(self.admin_token and token) and hmac.compare_digest(token, self.admin_token)
+
+    def request_started(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            for profile in self._open:
+                profile.max_concurrent_requests = max(profile.max_concurrent_requests, self._in_flight)
+
+    def request_finished(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def start(self, name: str, token: Optional[str] = None, profile_id: Optional[str] = None) -> Optional[Profile]:
+        """A running profile for this request, or None if it should not be profiled"""
+        if self.is_admin(token):
+            trigger = "header"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trigger = "sampled"
+        else:
+            if token:
+                logger.warning("Ignoring X-Profile-Token that does not match PROFILING_ADMIN_TOKEN")
+            return None
+        profile = Profile(profile_id or uuid.uuid4().hex, name, trigger)
+        with self._lock:
+            profile.max_concurrent_requests = self._in_flight
+            self._open.append(profile)
+        self.sampler.open(profile)
+        return profile
+
+    def finish(self, profile: Profile, name: Optional[str] = None, status_code: Optional[int] = None) -> None:
+        self.sampler.close(profile)
+        if name:
+            profile.name = name
+        profile.status_code = status_code
+        with self._lock:
+            self._open.remove(profile)
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        if self.directory:
+            self._write(profile)
+        logger.info(
+            f"Profiled {profile.name} ({profile.trigger}): {profile.wall_seconds * 1000:.0f} ms wall, "
+            f"{profile.samples} samples, id {profile.id}"
+        )
+
+    def _write(self, profile: Profile) -> None:
+        base = os.path.join(self.directory, profile.id)
+        try:
+            with open(base + ".json", "w", encoding="utf-8") as f:
+                json.dump(profile.summary(), f, indent=2)
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write(profile.collapsed())
+        except OSError as e:
+            logger.warning(f"Could not write profile {profile.id}: {e}")
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def recent(self) -> List[Profile]:
+        with self._lock:
+            return list(reversed(self._profiles.values()))
+
+
+_profiler = Profiler()
+
+
+def configure_profiling() -> Profiler:
+    """
+    Set up the process profiler from PROFILING_ADMIN_TOKEN, PROFILING_SAMPLE_RATE,
+    PROFILING_INTERVAL_MS, PROFILING_KEEP and PROFILING_DIR. Profiling is off
+    unless a token or a sample rate is set.
+    """
+    global _profiler
+    _profiler = Profiler(
+        admin_token=os.getenv("PROFILING_ADMIN_TOKEN") or None,
+        sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+        interval_seconds=float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000,
+        keep=int(os.getenv("PROFILING_KEEP", "50")),
+        directory=os.getenv("PROFILING_DIR") or None
+    )
+    return _profiler
+
+
+def get_profiler() -> Profiler:
+    return _profiler
@@ -0,0 +1,222 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+from services.metrics import REGISTRY
+from settings import env_flag
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tokens each request takes from the caller's bucket, roughly in proportion to its Gemini cost
+DEFAULT_COSTS: Dict[str, float] = {
+    "itinerary.generate": 5,
+    "itinerary.optimize": 5,
+    # A speculative itinerary costs a generation whether or not /generate adopts it
+    "planning.speculate": 5,
+    "hotels.recommendations": 3,
+    "itinerary.summarize_reviews": 1
+}
+
+RATE_LIMITED_REQUESTS = REGISTRY.counter(
+    "tripmigo_rate_limited_requests_total",
+    "Requests refused because the caller's token bucket was empty",
+    ("endpoint", "identity_type")
+)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the bucket is full again
+    reset_seconds: int
+    # Seconds until this request would have been allowed (0 when allowed)
+    retry_after: int
+
+
+class BucketStore(ABC):
+    """
+    Holds token buckets as (tokens, updated_at) pairs.
+
+    take() must refill and debit a bucket atomically, so concurrent requests
+    for the same caller can never both spend the last tokens.
+    """
+
+    @abstractmethod
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        """Debit cost tokens if available; returns (allowed, tokens left)"""
+
+    def close(self) -> None:
+        pass
+
+
+def _refill(tokens: float, updated_at: float, now: float, capacity: float, refill_per_second: float) -> float:
+    return min(capacity, tokens + (now - updated_at) * refill_per_second)
+
+
+class MemoryBucketStore(BucketStore):
+    """Process-local buckets; each worker enforces the limit on its own"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, now, capacity, refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Buckets of idle callers are full anyway, so dropping them loses nothing
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SQLiteBucketStore(BucketStore):
+    """Buckets shared by all worker processes on a host through SQLite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self.purge_idle(24 * 3600)
+        logger.info(f"SQLite rate limit store ready at {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        conn = self._connection()
+        # Wall clock, since the buckets are shared between processes
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], now, capacity, refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def purge_idle(self, idle_seconds: float) -> int:
+        """Drop buckets untouched for idle_seconds (they would be full again anyway)"""
+        cursor = self._connection().execute(
+            "DELETE FROM rate_buckets WHERE updated_at < ?",
+            (time.time() - idle_seconds,)
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class RateLimiter:
+    """
+    Token-bucket quotas for the endpoints that spend our shared Gemini quota.
+
+    Every caller (a signed-in user, or else a client IP) gets a bucket of
+    `capacity` tokens that refills at `refill_per_minute`. Each request takes
+    its endpoint's cost, so one client can burst briefly but cannot take more
+    than its share of upstream capacity.
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        capacity: float = 30,
+        refill_per_minute: float = 30,
+        costs: Optional[Dict[str, float]] = None,
+        enabled: bool = True
+    ):
+        self.store = store
+        self.capacity = capacity
+        self.refill_per_second = refill_per_minute / 60.0
+        self.costs = costs or DEFAULT_COSTS
+        self.enabled = enabled
+
+    def cost(self, endpoint: str) -> float:
+        return self.costs.get(endpoint, 1)
+
+    def take(self, endpoint: str, identity: str) -> RateLimitResult:
+        cost = self.cost(endpoint)
+        if not self.enabled:
+            return RateLimitResult(True, int(self.capacity), int(self.capacity), 0, 0)
+        allowed, tokens = self.store.take(identity, cost, self.capacity, self.refill_per_second)
+        reset_seconds = math.ceil((self.capacity - tokens) / self.refill_per_second)
+        retry_after = 0 if allowed else max(1, math.ceil((cost - tokens) / self.refill_per_second))
+        if not allowed:
+            RATE_LIMITED_REQUESTS.inc(endpoint=endpoint, identity_type=identity.split(":", 1)[0])
+        return RateLimitResult(allowed, int(self.capacity), int(tokens), reset_seconds, retry_after)
+
+    def close(self) -> None:
+        self.store.close()
+
+
+# Backends selectable through the RATE_LIMIT_STORE environment variable
+RATE_LIMIT_BACKENDS: Dict[str, Callable[[], BucketStore]] = {
+    "memory": MemoryBucketStore,
+    "sqlite": lambda: SQLiteBucketStore(os.getenv("STATE_STORE_PATH", "tripmigo_state.db")),
+}
+
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Build the limiter from RATE_LIMIT_* settings.
+
+    RATE_LIMIT_STORE defaults to STATE_STORE, so multi-worker deployments
+    share buckets; RATE_LIMIT_COSTS overrides endpoint costs as
+    "endpoint=cost,endpoint=cost".
+    """
+    backend = os.getenv("RATE_LIMIT_STORE", os.getenv("STATE_STORE", "memory")).strip().lower()
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"Unknown RATE_LIMIT_STORE backend '{backend}', expected one of {sorted(RATE_LIMIT_BACKENDS)}")
+    costs = dict(DEFAULT_COSTS)
+    for item in filter(None, os.getenv("RATE_LIMIT_COSTS", "").split(",")):
+        endpoint, _, cost = item.partition("=")
+        costs[endpoint.strip()] = float(cost)
+    return RateLimiter(
+        RATE_LIMIT_BACKENDS[backend](),
+        capacity=float(os.getenv("RATE_LIMIT_CAPACITY", "30")),
+        refill_per_minute=float(os.getenv("RATE_LIMIT_REFILL_PER_MINUTE", "30")),
+        costs=costs,
+        enabled=env_flag("RATE_LIMIT", default=True)
+    )
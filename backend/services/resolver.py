@@ -0,0 +1,127 @@
+"""
+Canonical destinations for cache and coalescing keys.
+
+"Paris", "paris, france", "Paris France " and "PARIS" are one destination,
+but as strings they would each get their own cache entries. The resolver
+maps a destination as a user typed it to one canonical key:
+
+- text is normalized (case, accents, punctuation, spacing), so "PARIS " is "paris";
+- an alias index seeded from the catalog maps "paris", "paris france" and
+  "paris, france" to the catalog destination paris-france;
+- anything else is looked up once in Maps, and spellings that find the same
+  place_id share a key and the name Maps gives that place.
+
+resolve() only uses what is already known locally and never blocks, so it is
+safe on the event loop. lookup() may make that one Maps search and belongs on
+worker threads; what it learns is kept for a day and then also served by
+resolve().
+"""
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set
+from models import Destination
+from services.cache import SingleFlight, TTLCache
+from services.catalog import DestinationCatalog, tokenize
+import logging
+
+if TYPE_CHECKING:
+    # MapsService keys its own caches with name_key
+    from services.maps_service import MapsService
+
+logger = logging.getLogger(__name__)
+
+TEXT_PREFIX = "text:"
+UNKNOWN_TTL_SECONDS = 3600
+
+
+def name_key(destination: str) -> str:
+    """How a destination is compared: "São Paulo,  Brazil" -> "sao paulo brazil" """
+    return " ".join(tokenize(destination))
+
+
+def name_keys(name: str, country: str) -> List[str]:
+    """Every way a request may spell a destination: "Paris, France", "Paris France", "Paris" """
+    city = name.split(",")[0]
+    keys = [name_key(name), name_key(f"{city} {country}"), name_key(city)]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def name_index(destinations: Iterable[Destination]) -> Dict[str, str]:
+    """Name keys to destination ids, leaving out short names that two destinations share"""
+    owners: Dict[str, Set[str]] = {}
+    for destination in destinations:
+        for key in name_keys(destination.name, destination.country):
+            owners.setdefault(key, set()).add(destination.id)
+    return {key: ids.pop() for key, ids in owners.items() if len(ids) == 1}
+
+
+class ResolvedDestination(NamedTuple):
+    key: str  # "catalog:paris-france", "place:<place_id>" or "text:paris"
+    name: str  # what to put in Maps queries, the same for every spelling; not shown to users
+    destination_id: Optional[str] = None
+    place_id: Optional[str] = None
+
+
+class DestinationResolver:
+    """Destination text -> canonical key, from the catalog aliases and learned Maps place ids"""
+
+    def __init__(self, catalog: Optional[DestinationCatalog] = None, maps: Optional["MapsService"] = None):
+        self.catalog = catalog
+        self.maps = maps
+        self._aliases = name_index(catalog.all()) if catalog is not None else {}
+        # Normalized spellings resolved through Maps, and the first resolution of each place
+        self._learned = TTLCache(max_entries=8192, ttl_seconds=24 * 3600, name="destination_resolver")
+        self._places = TTLCache(max_entries=4096, ttl_seconds=24 * 3600)
+        self._unknown = TTLCache(max_entries=4096, ttl_seconds=UNKNOWN_TTL_SECONDS)
+        self._inflight = SingleFlight()
+
+    def resolve(self, destination: str) -> ResolvedDestination:
+        """The canonical destination from local knowledge only"""
+        key = name_key(destination)
+        # Only whole aliases count: "Paris, Texas" must not become Paris, France
+        destination_id = self._aliases.get(key)
+        if destination_id is not None:
+            return ResolvedDestination(f"catalog:{destination_id}", self.catalog.get(destination_id).name, destination_id)
+        learned = self._learned.get(key)
+        if learned is not None:
+            return learned
+        return ResolvedDestination(f"{TEXT_PREFIX}{key}", " ".join(destination.split()))
+
+    def lookup(self, destination: str) -> ResolvedDestination:
+        """resolve(), falling back to one (cached) Maps search for destinations it does not know yet"""
+        resolved = self.resolve(destination)
+        if not resolved.key.startswith(TEXT_PREFIX) or resolved.key == TEXT_PREFIX or self._unknown.get(resolved.key):
+            return resolved
+        if self.maps is None or not self.maps.is_healthy():
+            return resolved
+        return self._inflight.do(resolved.key, lambda: self._learn(resolved))
+
+    def _learn(self, resolved: ResolvedDestination) -> ResolvedDestination:
+        try:
+            results = self.maps.search_places(resolved.name).get("results") or []
+        except Exception as e:
+            logger.warning(f"Could not resolve destination '{resolved.name}' through Maps: {e}")
+            return resolved
+        if not results or not results[0].get("place_id"):
+            # Not a place Maps knows; ask again in a while rather than on every request
+            self._unknown.set(resolved.key, True)
+            return resolved
+        place_id = results[0]["place_id"]
+        canonical = self._places.get(place_id)
+        if canonical is None:
+            # "Paris, Ile-de-France" comes back as "Paris, France", which the catalog knows
+            address = results[0].get("address") or resolved.name
+            canonical = self.resolve(address)
+            if canonical.destination_id is None:
+                canonical = ResolvedDestination(f"place:{place_id}", address, None, place_id)
+            self._places.set(place_id, canonical)
+        # The canonical name must resolve to the same key as the spelling it came from
+        self._learned.set(resolved.key[len(TEXT_PREFIX):], canonical)
+        self._learned.set(name_key(canonical.name), canonical)
+        return canonical
+
+    def place_id(self, destination: str) -> Optional[str]:
+        """The Maps place of a destination, searched for under its canonical name"""
+        resolved = self.lookup(destination)
+        if resolved.place_id is not None or self.maps is None:
+            return resolved.place_id
+        results = self.maps.search_places(resolved.name).get("results") or []
+        return results[0].get("place_id") if results else None
@@ -0,0 +1,370 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from models import PlanningSession, PlanningStep, TripRequest
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A read extends a SQLite session's expiry only once it is this stale, so busy sessions are not rewritten per read
+TOUCH_INTERVAL_SECONDS = 60
+
+
+def _split_session(session: PlanningSession) -> Tuple[Dict[str, Any], Dict[int, Dict[str, Any]]]:
+    """Split a session into its header fields and its per-step records"""
+    data = session.model_dump(mode="json")
+    steps = {step["step"]: step for step in data.pop("steps")}
+    return data, steps
+
+
+def _join_session(header: Dict[str, Any], steps: Dict[int, Dict[str, Any]]) -> PlanningSession:
+    return PlanningSession(**header, steps=[steps[number] for number in sorted(steps)])
+
+
+def _header_update(current_step: int, updated_at: datetime, trip_request: Optional[TripRequest]) -> Dict[str, Any]:
+    update = {"current_step": current_step, "updated_at": updated_at.isoformat()}
+    if trip_request is not None:
+        update["trip_request"] = trip_request.model_dump(mode="json")
+    return update
+
+
+class PlanningSessionStore(ABC):
+    """
+    Storage for planning wizard sessions.
+
+    A session is kept as a header (ids, current step, compiled trip request,
+    timestamps) plus one record per step, so a step update only writes the
+    step that changed instead of the whole session.
+    """
+
+    @abstractmethod
+    def create(self, session: PlanningSession) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[PlanningSession]:
+        ...
+
+    @abstractmethod
+    def update_step(
+        self,
+        session_id: str,
+        step: PlanningStep,
+        current_step: int,
+        updated_at: datetime,
+        trip_request: Optional[TripRequest] = None
+    ) -> None:
+        """Partial write of one step plus the header fields that move with it"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session_id -> [expires_at, header, steps]; ordered oldest-used first
+        self.entries: "OrderedDict[str, list]" = OrderedDict()
+
+
+class MemorySessionStore(PlanningSessionStore):
+    """
+    Process-local store with a sliding TTL and an LRU bound on entries.
+
+    Sessions are spread over independently locked shards, because sync
+    endpoints run concurrently on the threadpool and a single lock would
+    serialize every wizard request.
+    """
+
+    def __init__(self, ttl_seconds: float = 86400, max_entries: int = 10000, shards: int = 16):
+        self.ttl_seconds = ttl_seconds
+        self.max_per_shard = max(1, max_entries // shards)
+        self._shards = [_Shard() for _ in range(shards)]
+        self.evictions = 0
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def create(self, session: PlanningSession) -> None:
+        header, steps = _split_session(session)
+        shard = self._shard(session.id)
+        with shard.lock:
+            shard.entries[session.id] = [time.monotonic() + self.ttl_seconds, header, steps]
+            shard.entries.move_to_end(session.id)
+            while len(shard.entries) > self.max_per_shard:
+                shard.entries.popitem(last=False)
+                self.evictions += 1
+
+    def _live_entry(self, shard: _Shard, session_id: str) -> Optional[list]:
+        entry = shard.entries.get(session_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[0] < now:
+            del shard.entries[session_id]
+            return None
+        entry[0] = now + self.ttl_seconds
+        shard.entries.move_to_end(session_id)
+        return entry
+
+    def get(self, session_id: str) -> Optional[PlanningSession]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            entry = self._live_entry(shard, session_id)
+            if entry is None:
+                return None
+            header = dict(entry[1])
+            steps = dict(entry[2])
+        return _join_session(header, steps)
+
+    def update_step(self, session_id, step, current_step, updated_at, trip_request=None) -> None:
+        step_record = step.model_dump(mode="json")
+        update = _header_update(current_step, updated_at, trip_request)
+        shard = self._shard(session_id)
+        with shard.lock:
+            entry = self._live_entry(shard, session_id)
+            if entry is None:
+                return
+            entry[1] = {**entry[1], **update}
+            entry[2] = {**entry[2], step.step: step_record}
+
+    def delete(self, session_id: str) -> None:
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.entries.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
+
+
+class SQLiteSessionStore(PlanningSessionStore):
+    """
+    Durable store in a local SQLite database (WAL mode) with write-behind batching.
+
+    Writes are coalesced in memory and flushed by a background thread in a
+    single transaction every flush_interval seconds, or as soon as batch_size
+    writes are pending. Reads in this process see pending writes immediately;
+    other workers see them after the next flush, so keep the interval short
+    (or set it to 0 for write-through) when running several workers.
+
+    The TTL slides like MemorySessionStore's: reads push expires_at forward
+    too, batched with the other writes and at most once a minute per session.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = 86400,
+        flush_interval: float = 0.2,
+        batch_size: int = 256
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS planning_sessions ("
+            " id TEXT PRIMARY KEY, header TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS planning_steps ("
+            " session_id TEXT NOT NULL, step INTEGER NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, step))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS planning_sessions_expires ON planning_sessions (expires_at)")
+        self._db_lock = threading.Lock()
+
+        # Pending writes, coalesced by target row: the latest value wins
+        self._pending_headers: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._pending_steps: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        # Sessions read since the last flush, whose expiry moves forward without rewriting them
+        self._pending_touches: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="session-store-flush", daemon=True)
+            self._flusher.start()
+        self._purge_expired()
+        logger.info(f"SQLite session store ready at {path}")
+
+    # -- reads --------------------------------------------------------------
+
+    def _read_header(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            if session_id in self._pending_headers:
+                return self._pending_headers[session_id]
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT header, expires_at FROM planning_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        now = time.time()
+        if row is None or row[1] < now:
+            return None
+        if row[1] < now + self.ttl_seconds - TOUCH_INTERVAL_SECONDS:
+            with self._pending_lock:
+                self._pending_touches.add(session_id)
+            if self._flusher is None:
+                self.flush()
+        return json.loads(row[0])
+
+    def get(self, session_id: str) -> Optional[PlanningSession]:
+        header = self._read_header(session_id)
+        if header is None:
+            return None
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT step, data FROM planning_steps WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        steps = {step: json.loads(data) for step, data in rows}
+        with self._pending_lock:
+            for (pending_id, number), record in self._pending_steps.items():
+                if pending_id == session_id:
+                    steps[number] = record
+        return _join_session(header, steps)
+
+    # -- writes -------------------------------------------------------------
+
+    def _enqueue(self, headers: Dict[str, Optional[Dict[str, Any]]], steps: Dict[Tuple[str, int], Dict[str, Any]]) -> None:
+        with self._pending_lock:
+            self._pending_headers.update(headers)
+            self._pending_steps.update(steps)
+            pending = len(self._pending_headers) + len(self._pending_steps)
+        if self._flusher is None:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wake.set()
+
+    def create(self, session: PlanningSession) -> None:
+        header, steps = _split_session(session)
+        self._enqueue(
+            {session.id: header},
+            {(session.id, number): record for number, record in steps.items()}
+        )
+
+    def update_step(self, session_id, step, current_step, updated_at, trip_request=None) -> None:
+        header = self._read_header(session_id)
+        if header is None:
+            return
+        header = {**header, **_header_update(current_step, updated_at, trip_request)}
+        self._enqueue({session_id: header}, {(session_id, step.step): step.model_dump(mode="json")})
+
+    def delete(self, session_id: str) -> None:
+        with self._pending_lock:
+            for key in [key for key in self._pending_steps if key[0] == session_id]:
+                del self._pending_steps[key]
+            # None marks a pending delete
+            self._pending_headers[session_id] = None
+        if self._flusher is None:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all pending changes in one transaction; returns the number of rows written"""
+        with self._pending_lock:
+            headers, self._pending_headers = self._pending_headers, {}
+            steps, self._pending_steps = self._pending_steps, {}
+            touches, self._pending_touches = self._pending_touches, set()
+        if not headers and not steps and not touches:
+            return 0
+
+        expires_at = time.time() + self.ttl_seconds
+        upserts = [(sid, json.dumps(h), expires_at) for sid, h in headers.items() if h is not None]
+        deletes = [(sid,) for sid, h in headers.items() if h is None]
+        step_rows = [(sid, number, json.dumps(record)) for (sid, number), record in steps.items()]
+        # Rewritten headers get the new expiry anyway, and deleted ones must stay deleted
+        refreshes = [(expires_at, sid) for sid in touches if sid not in headers]
+        try:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO planning_sessions (id, header, expires_at) VALUES (?, ?, ?)", upserts
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO planning_steps (session_id, step, data) VALUES (?, ?, ?)", step_rows
+                )
+                self._conn.executemany("UPDATE planning_sessions SET expires_at = ? WHERE id = ?", refreshes)
+                self._conn.executemany("DELETE FROM planning_steps WHERE session_id = ?", deletes)
+                self._conn.executemany("DELETE FROM planning_sessions WHERE id = ?", deletes)
+                self._conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Session store flush failed, re-queueing {len(headers) + len(steps)} writes: {e}")
+            with self._db_lock:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            with self._pending_lock:
+                # Keep any newer writes that arrived during the failed flush
+                self._pending_headers = {**headers, **self._pending_headers}
+                self._pending_steps = {**steps, **self._pending_steps}
+                self._pending_touches |= touches
+            return 0
+        return len(upserts) + len(step_rows) + len(deletes) + len(refreshes)
+
+    def _purge_expired(self) -> None:
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM planning_steps WHERE session_id IN "
+                "(SELECT id FROM planning_sessions WHERE expires_at < ?)", (time.time(),)
+            )
+            self._conn.execute("DELETE FROM planning_sessions WHERE expires_at < ?", (time.time(),))
+            self._conn.execute("COMMIT")
+
+    def _flush_loop(self) -> None:
+        last_purge = time.monotonic()
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - last_purge > 300:
+                try:
+                    self._purge_expired()
+                except Exception as e:
+                    logger.warning(f"Session store purge failed: {e}")
+                last_purge = time.monotonic()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+def create_session_store() -> PlanningSessionStore:
+    """
+    Build the planning session store configured by SESSION_STORE.
+
+    Defaults to the same backend as STATE_STORE, so multi-worker deployments
+    get durable shared sessions without extra configuration.
+    """
+    backend = os.getenv("SESSION_STORE", os.getenv("STATE_STORE", "memory")).strip().lower()
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    if backend == "memory":
+        return MemorySessionStore(
+            ttl_seconds=ttl_seconds,
+            max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+        )
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("SESSION_STORE_PATH", os.getenv("STATE_STORE_PATH", "tripmigo_state.db")),
+            ttl_seconds=ttl_seconds,
+            flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL_MS", "200")) / 1000
+        )
+    raise ValueError(f"Unknown SESSION_STORE backend '{backend}', expected 'memory' or 'sqlite'")
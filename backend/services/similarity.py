@@ -0,0 +1,225 @@
+"""
+Near-duplicate trip requests for the itinerary cache.
+
+The itinerary cache is keyed by the whole TripRequest, so interests
+["food", "culture"] and ["culture", "food", "sightseeing"], or the same
+constraints in other words, each cost a generation. SimilarTripIndex keeps
+the trips whose itineraries are cached, per destination, and finds the ones
+closest to a new request:
+
+- what must match exactly is the partition: the canonical destination, the
+  origin, the party size, the budget, the travelers, the travel style and
+  the food preference (the prompt plans travel and costs from all of them);
+- the rest is hashed into one unit block each for the interests, the
+  constraints (words and word pairs, so "no seafood" is not "seafood") and
+  the other preferences (accommodation, transport, essentials), scaled so a
+  dot product is the weighted sum of the per-block cosines;
+- a cached trip may be up to max_trim_days longer than the new one.
+
+adapt_itinerary() turns a match into an answer without calling Gemini: days
+past the requested length are dropped, the days are renumbered and dated
+from the new start date, and a "$" total is scaled to the days kept. The
+index only holds cache keys; the itineraries stay in the itinerary cache and
+a key whose itinerary has expired there is dropped when it is found.
+"""
+import re
+import threading
+import zlib
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from models import TripRequest
+from services.cache import TTLCache
+from services.catalog import tokenize
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_MAX_TRIM_DAYS = 2
+# Hashed features per block; collisions only blur trips of one destination and profile
+FEATURES = 256
+BLOCK_WEIGHTS = {"interests": 0.5, "constraints": 0.3, "preferences": 0.2}
+# Among matches, an itinerary of the requested length beats a longer one cut short
+TRIM_PENALTY = 0.02
+MAX_TRIPS_PER_PARTITION = 32
+STOPWORDS = {
+    "a", "an", "and", "are", "be", "for", "i", "in", "is", "it", "like", "my", "of", "on", "or", "our",
+    "please", "some", "the", "to", "us", "we", "with", "would"
+}
+# Marks an empty block, so two trips without constraints match on them rather than score 0
+EMPTY = "<none>"
+COST_PATTERN = re.compile(r"([$€£¥]\s?)(\d[\d,]*)(?:(\s*[-–]\s*[$€£¥]?\s?)(\d[\d,]*))?")
+
+
+def _words(text: Optional[str]) -> List[str]:
+    """Tokens with a plural "s" dropped, so "museums" and "Museum" are one feature"""
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in tokenize(text or "")]
+
+
+def _phrase(text: Optional[str]) -> str:
+    return " ".join(_words(text))
+
+
+def _block(features: Iterable[str], weight: float) -> np.ndarray:
+    block = np.zeros(FEATURES, dtype=np.float32)
+    found = False
+    for feature in features:
+        # crc32 rather than hash(), which differs between processes
+        block[zlib.crc32(feature.encode()) % FEATURES] += 1.0
+        found = True
+    if not found:
+        block[zlib.crc32(EMPTY.encode()) % FEATURES] = 1.0
+    return block * (np.sqrt(weight) / np.linalg.norm(block))
+
+
+def trip_profile(trip: TripRequest, destination_key: str) -> Tuple[str, ...]:
+    """What two trips must share for one itinerary to serve both"""
+    return (
+        destination_key,
+        _phrase(trip.source or trip.sourceLocation or trip.source_location),
+        str(trip.numberOfPeople or ""),
+        _phrase(trip.budget),
+        _phrase(trip.travelers),
+        _phrase(trip.travel_style),
+        _phrase(trip.foodPreference) or "any"
+    )
+
+
+def trip_vector(trip: TripRequest) -> np.ndarray:
+    interests = {_phrase(interest) for interest in trip.interests} - {""}
+    words = [word for word in _words(trip.constraints) if word not in STOPWORDS]
+    constraints = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    preferences = (
+        [f"stay={word}" for word in _words(f"{trip.accommodation_type or ''} {trip.selectedHotel or ''}")]
+        + [f"mode={word}" for word in _words(trip.travelMode)]
+        + [f"pack={_phrase(item)}" for item in trip.selectedEssentials or []]
+    )
+    return np.concatenate([
+        _block(sorted(interests), BLOCK_WEIGHTS["interests"]),
+        _block(constraints, BLOCK_WEIGHTS["constraints"]),
+        _block(preferences, BLOCK_WEIGHTS["preferences"])
+    ])
+
+
+class SimilarTrip(NamedTuple):
+    cache_key: str
+    score: float
+    duration_days: int
+
+
+class _Partition(NamedTuple):
+    # Replaced, never modified, so lookups read it without the lock
+    keys: Tuple[str, ...]
+    days: np.ndarray
+    vectors: np.ndarray
+
+
+class SimilarTripIndex:
+    """Itinerary cache keys of recent trips, searchable by how close a new trip is to them"""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_trim_days: int = DEFAULT_MAX_TRIM_DAYS,
+        ttl_seconds: float = 6 * 3600
+    ):
+        # Above 1 nothing matches, which leaves only exact cache hits
+        self.threshold = threshold
+        self.max_trim_days = max_trim_days
+        self._partitions = TTLCache(max_entries=512, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold <= 1.0
+
+    def add(self, trip: TripRequest, destination_key: str, cache_key: str) -> None:
+        """Make the itinerary cached under cache_key findable for trips like this one"""
+        if not self.enabled:
+            return
+        profile = trip_profile(trip, destination_key)
+        vector = trip_vector(trip)
+        with self._lock:
+            partition = self._partitions.get(profile)
+            keys, days, vectors = (list(partition.keys), list(partition.days), list(partition.vectors)) if partition else ([], [], [])
+            if cache_key in keys:
+                position = keys.index(cache_key)
+                del keys[position], days[position], vectors[position]
+            keys.append(cache_key)
+            days.append(trip.duration_days)
+            vectors.append(vector)
+            # The oldest trips go first; their itineraries are the next to expire anyway
+            keys, days, vectors = keys[-MAX_TRIPS_PER_PARTITION:], days[-MAX_TRIPS_PER_PARTITION:], vectors[-MAX_TRIPS_PER_PARTITION:]
+            self._partitions.set(profile, _Partition(tuple(keys), np.array(days), np.vstack(vectors)))
+
+    def discard(self, trip: TripRequest, destination_key: str, cache_key: str) -> None:
+        profile = trip_profile(trip, destination_key)
+        with self._lock:
+            partition = self._partitions.get(profile)
+            if partition is None or cache_key not in partition.keys:
+                return
+            keep = [position for position, key in enumerate(partition.keys) if key != cache_key]
+            if not keep:
+                self._partitions.delete(profile)
+                return
+            self._partitions.set(profile, _Partition(
+                tuple(partition.keys[position] for position in keep),
+                partition.days[keep],
+                partition.vectors[keep]
+            ))
+
+    def find(self, trip: TripRequest, destination_key: str) -> List[SimilarTrip]:
+        """Cached trips at or above the threshold that can be cut to this trip's length, best first"""
+        if not self.enabled:
+            return []
+        partition = self._partitions.get(trip_profile(trip, destination_key))
+        if partition is None:
+            return []
+        extra_days = partition.days - trip.duration_days
+        scores = partition.vectors @ trip_vector(trip) - TRIM_PENALTY * np.maximum(extra_days, 0)
+        usable = (extra_days >= 0) & (extra_days <= self.max_trim_days) & (scores >= self.threshold)
+        return [
+            SimilarTrip(partition.keys[position], round(float(scores[position]), 4), int(partition.days[position]))
+            for position in np.flatnonzero(usable)[np.argsort(-scores[usable], kind="stable")]
+        ]
+
+    def __len__(self) -> int:
+        return len(self._partitions)
+
+
+def _start_date(start_date: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(start_date[:10]) if start_date else None
+    except ValueError:
+        return None
+
+
+def _scale_amount(amount: str, ratio: float) -> str:
+    scaled = round(int(amount.replace(",", "")) * ratio)
+    return f"{scaled:,}" if "," in amount else str(scaled)
+
+
+def _scale_costs(text: str, ratio: float) -> str:
+    def scale(match: "re.Match[str]") -> str:
+        low = f"{match.group(1)}{_scale_amount(match.group(2), ratio)}"
+        if match.group(4) is None:
+            return low
+        return f"{low}{match.group(3)}{_scale_amount(match.group(4), ratio)}"
+    return COST_PATTERN.sub(scale, text)
+
+
+def adapt_itinerary(itinerary: Dict[str, Any], trip: TripRequest) -> Dict[str, Any]:
+    """A copy of a cached itinerary cut to the trip's length and dated from its start date"""
+    days = itinerary.get("days") or []
+    start = _start_date(trip.start_date)
+    adapted_days = []
+    for number, day in enumerate(days[:trip.duration_days], 1):
+        adapted_days.append({
+            **day,
+            "day": number,
+            "date": (start + timedelta(days=number - 1)).isoformat() if start else f"Day {number}",
+            "items": [dict(item) for item in day.get("items") or []]
+        })
+    adapted = {**itinerary, "days": adapted_days}
+    total = itinerary.get("total_estimated_cost")
+    if len(adapted_days) < len(days) and isinstance(total, str):
+        adapted["total_estimated_cost"] = _scale_costs(total, len(adapted_days) / len(days))
+    return adapted
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+from models import TripRequest
+from services.cancellation import CancellationToken, RequestCancelled, bind_token, check_cancelled, reset_token
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long adopt() waits for a speculation that is already calling Gemini: about as
+# long as a generation with its retries takes, since giving up means starting one over
+DEFAULT_ADOPT_TIMEOUT = 60.0
+# How often a waiting adopt() checks whether its own client is still there
+ADOPT_POLL_SECONDS = 0.25
+
+
+def trip_fingerprint(trip_request: TripRequest, destination_key: Optional[str] = None) -> str:
+    """
+    Stable hash of everything in a TripRequest that affects the generated itinerary.
+    With destination_key (see DestinationResolver), spellings of one destination share it.
+    """
+    fields = trip_request.model_dump(mode="json")
+    if destination_key is not None:
+        fields["destination"] = destination_key
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Speculation:
+    def __init__(self, fingerprint: str, trip_request: TripRequest):
+        self.fingerprint = fingerprint
+        self.trip_request = trip_request
+        self.created_at = time.monotonic()
+        self.timer: Optional[threading.Timer] = None
+        self.future: Optional[Future] = None
+        # Stops the generation at its next upstream call once nobody will use it
+        self.token = CancellationToken()
+
+
+class SpeculativeGenerator:
+    """
+    Starts itinerary generation for a planning session before the user asks for it.
+
+    Each time the wizard produces a complete TripRequest, propose() schedules a
+    background generation once the request has been stable for debounce_seconds.
+    A later proposal with different inputs supersedes the earlier one: a pending
+    start is cancelled, and a generation already in flight stops at its next
+    upstream call. adopt() hands the in-flight or finished result to /generate
+    when the inputs still match.
+
+    Speculation is per process: with several workers, /generate on a worker
+    that did not see the step updates simply generates normally.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[TripRequest], Dict[str, Any]],
+        max_workers: int = 2,
+        debounce_seconds: float = 1.5,
+        ttl_seconds: float = 900,
+        fingerprint: Callable[[TripRequest], str] = trip_fingerprint
+    ):
+        self._generate = generate
+        self._fingerprint = fingerprint
+        self.debounce_seconds = debounce_seconds
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._sessions: Dict[str, _Speculation] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.superseded = 0
+        self.adopted = 0
+
+    def propose(self, session_id: str, trip_request: TripRequest) -> None:
+        """Record the session's latest complete request and (re)schedule speculation if it changed"""
+        fingerprint = self._fingerprint(trip_request)
+        with self._lock:
+            self._expire_locked()
+            current = self._sessions.get(session_id)
+            if current is not None and current.fingerprint == fingerprint:
+                return
+            if current is not None:
+                self._cancel_locked(current)
+            speculation = _Speculation(fingerprint, trip_request)
+            speculation.timer = threading.Timer(self.debounce_seconds, self._start, args=(session_id, speculation))
+            speculation.timer.daemon = True
+            self._sessions[session_id] = speculation
+            speculation.timer.start()
+
+    def cancel(self, session_id: str) -> None:
+        """Drop any speculation for the session, e.g. when its inputs became incomplete"""
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+            if speculation is not None:
+                self._cancel_locked(speculation)
+
+    def is_current(self, session_id: str, trip_request: TripRequest) -> bool:
+        """Whether the session already has a speculation for exactly these inputs"""
+        fingerprint = self._fingerprint(trip_request)
+        with self._lock:
+            current = self._sessions.get(session_id)
+            return current is not None and current.fingerprint == fingerprint
+
+    def adopt(
+        self,
+        session_id: str,
+        trip_request: TripRequest,
+        timeout: float = DEFAULT_ADOPT_TIMEOUT
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the speculative result for these exact inputs, waiting for it if
+        it is already running. Returns None when there is nothing usable, and
+        the caller generates itself: a speculation that has not started yet is
+        cancelled rather than waited for behind other sessions' speculations.
+
+        A running speculation is the generation the caller would otherwise
+        start from scratch, so it is waited for as long as the caller's own
+        client is connected, up to timeout. Only one that runs past timeout is
+        given up on; it is cancelled at its next upstream call, retries
+        included, so its remaining calls are not billed alongside the caller's
+        generation. A caller whose client disconnects raises RequestCancelled
+        and leaves the speculation running for the session's next attempt.
+        """
+        fingerprint = self._fingerprint(trip_request)
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+            if speculation is None:
+                return None
+            if speculation.fingerprint != fingerprint or speculation.future is None or speculation.future.cancel():
+                self._cancel_locked(speculation)
+                return None
+            future = speculation.future
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    result = future.result(timeout=max(0.0, min(ADOPT_POLL_SECONDS, deadline - time.monotonic())))
+                    break
+                except FutureTimeoutError:
+                    if time.monotonic() >= deadline:
+                        logger.warning(f"Speculative itinerary for session {session_id} not ready in {timeout:g}s, generating directly")
+                        speculation.token.cancel("superseded by the user's own request")
+                        return None
+                    check_cancelled("gemini")
+        except RequestCancelled:
+            with self._lock:
+                self._sessions.setdefault(session_id, speculation)
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative itinerary for session {session_id} failed: {e}")
+            return None
+        self.adopted += 1
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            for speculation in self._sessions.values():
+                self._cancel_locked(speculation)
+            self._sessions.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, session_id: str, speculation: _Speculation) -> None:
+        with self._lock:
+            if self._sessions.get(session_id) is not speculation or speculation.future is not None:
+                return
+            speculation.future = self._submit(speculation)
+
+    def _submit(self, speculation: _Speculation) -> Future:
+        self.started += 1
+        logger.info(f"Starting speculative itinerary for {speculation.trip_request.destination}")
+        return self._executor.submit(self._run, speculation)
+
+    def _run(self, speculation: _Speculation) -> Dict[str, Any]:
+        reset = bind_token(speculation.token)
+        try:
+            return self._generate(speculation.trip_request)
+        finally:
+            reset_token(reset)
+
+    def _cancel_locked(self, speculation: _Speculation) -> None:
+        if speculation.timer is not None:
+            speculation.timer.cancel()
+        if speculation.future is not None:
+            # Queued work is cancelled; work already talking to Gemini stops at its next call
+            speculation.token.cancel("speculation superseded")
+            speculation.future.cancel()
+            self.superseded += 1
+
+    def _expire_locked(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        for session_id in [sid for sid, s in self._sessions.items() if s.created_at < cutoff]:
+            self._cancel_locked(self._sessions.pop(session_id))
@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """
+    Namespaced key/value store for state that must be visible to every worker.
+
+    Values are JSON-serializable objects. Entries may carry a TTL, after which
+    they are treated as missing.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def compare_and_set(self, namespace: str, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Replace the value only if it is still expected, as last read; returns whether it did"""
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; only suitable for a single worker"""
+
+    def __init__(self):
+        self._data: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[(namespace, key)]
+                return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        # Serialize on write so callers never share mutable state with the store
+        encoded = json.dumps(value, default=str)
+        with self._lock:
+            self._data[(namespace, key)] = (expires_at, encoded)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def compare_and_set(self, namespace: str, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        encoded = json.dumps(value, default=str)
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None or (entry[0] is not None and entry[0] < time.time()):
+                return False
+            if entry[1] != json.dumps(expected, default=str):
+                return False
+            self._data[(namespace, key)] = (expires_at, encoded)
+        return True
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Store backed by a local SQLite database in WAL mode.
+
+    WAL lets any number of worker processes read concurrently while one writes,
+    so workers on the same host can share state without an external service.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires_at)")
+        self.purge_expired()
+        logger.info(f"SQLite state store ready at {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(namespace, key)
+            return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, default=str), expires_at)
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._connection().execute(
+            "DELETE FROM state WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        )
+
+    def compare_and_set(self, namespace: str, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        # One conditional UPDATE, so a write from another process in between makes it match nothing
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE state SET value = ?, expires_at = ?"
+            " WHERE namespace = ? AND key = ? AND value = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (
+                json.dumps(value, default=str),
+                now + ttl_seconds if ttl_seconds else None,
+                namespace, key, json.dumps(expected, default=str), now
+            )
+        )
+        return cursor.rowcount == 1
+
+    def purge_expired(self) -> int:
+        """Remove expired rows; returns how many were deleted"""
+        cursor = self._connection().execute(
+            "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# Backends selectable through the STATE_STORE environment variable
+STATE_STORE_BACKENDS: Dict[str, Callable[[], StateStore]] = {
+    "memory": MemoryStateStore,
+    "sqlite": lambda: SQLiteStateStore(os.getenv("STATE_STORE_PATH", "tripmigo_state.db")),
+}
+
+
+def create_state_store() -> StateStore:
+    """Build the state store configured by STATE_STORE (default: memory)"""
+    backend = os.getenv("STATE_STORE", "memory").strip().lower()
+    if backend not in STATE_STORE_BACKENDS:
+        raise ValueError(f"Unknown STATE_STORE backend '{backend}', expected one of {sorted(STATE_STORE_BACKENDS)}")
+    return STATE_STORE_BACKENDS[backend]()
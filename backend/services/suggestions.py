@@ -0,0 +1,251 @@
+"""
+Destination suggestions scored against the whole catalog.
+
+Every catalog destination is turned into a feature vector once, when the
+engine is built:
+- its tags (one column per tag in the catalog);
+- its cost band, from estimated_cost.budget ("$" budget, "$$" mid-range,
+  "$$$" luxury);
+- the months in best_time_to_visit ("April to June, September to October");
+- the trip lengths its ideal_days cover, in buckets (up to 3 days, 4-6, 7-10, 11+).
+
+Each block is scaled to unit length, so a query built the same way from the
+user's interests, budget, trip length and (optionally) travel month scores a
+destination with one dot product: the weighted sum of the per-block cosine
+similarities. A rating prior breaks ties towards better rated places. Scoring
+the catalog is one matrix-vector product and an argpartition for the top k;
+only the k results are explained, with the tags, budget, season and length
+that matched.
+"""
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from models import Destination
+from services.catalog import DestinationCatalog, normalize, tokenize
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+MONTH_PATTERN = re.compile(r"\b(" + "|".join(month[:3] for month in MONTHS) + r")[a-z]*\b")
+YEAR_ROUND = ("year round", "year-round", "all year")
+COST_BANDS = ["budget", "mid-range", "luxury"]
+COST_SYMBOLS = {"$": 0, "$$": 1, "$$$": 2, "$$$$": 2}
+BUDGET_WORDS = {
+    "budget": 0, "low": 0, "cheap": 0, "economy": 0,
+    "medium": 1, "mid-range": 1, "midrange": 1, "moderate": 1, "mid": 1,
+    "luxury": 2, "high": 2, "premium": 2
+}
+# Upper bound of each trip-length bucket, in days; the last takes everything longer
+DURATION_BUCKETS = (3, 6, 10)
+DEFAULT_IDEAL_DAYS = (3, 7)
+# Interests the planning wizard offers that are not tag names themselves, and the tags they mean
+INTEREST_TAGS = {
+    "culture": ["culture", "history", "art", "museums", "architecture", "temples"],
+    "history": ["history", "museums", "architecture", "temples"],
+    "food": ["food", "wine", "markets"],
+    "nature": ["nature", "mountains", "hiking", "wildlife", "lakes", "rainforest", "tropical"],
+    "relaxation": ["wellness", "beach", "island", "sunset"],
+    "adventure": ["adventure", "hiking", "diving", "skiing", "cycling"],
+    "nightlife": ["nightlife", "entertainment", "urban", "festivals"],
+    "shopping": ["shopping", "markets", "urban"],
+    "romance": ["romance", "sunset", "wine", "island"],
+    "sightseeing": ["architecture", "museums", "photography", "history"],
+    "photography": ["photography", "sunset", "nature", "architecture"],
+    "beach": ["beach", "island", "tropical", "diving"]
+}
+SYNONYM_WEIGHT = 0.5
+# How much each part of the query counts, before the rating prior
+BLOCK_WEIGHTS = {"interests": 1.0, "budget": 0.5, "season": 0.35, "duration": 0.35}
+RATING_PRIOR = 0.2
+
+
+def parse_months(text: str) -> List[int]:
+    """Month numbers (1-12) named in text like "April to June, September to October" """
+    text = text.lower()
+    if any(phrase in text for phrase in YEAR_ROUND):
+        return list(range(1, 13))
+    months = set()
+    for part in re.split(r"[,;/&]| and ", text):
+        found = [MONTHS.index(next(month for month in MONTHS if month.startswith(name))) + 1 for name in MONTH_PATTERN.findall(part)]
+        if len(found) >= 2:
+            start, end = found[0], found[-1]
+            span = (end - start) % 12
+            months.update((start - 1 + step) % 12 + 1 for step in range(span + 1))
+        else:
+            months.update(found)
+    return sorted(months)
+
+
+def duration_bucket(days: int) -> int:
+    for bucket, limit in enumerate(DURATION_BUCKETS):
+        if days <= limit:
+            return bucket
+    return len(DURATION_BUCKETS)
+
+
+def budget_band(budget: str) -> Optional[int]:
+    """"medium", "mid-range" or "$$" -> 1; None when the budget says nothing about cost"""
+    value = budget.strip().lower()
+    if value in COST_SYMBOLS:
+        return COST_SYMBOLS[value]
+    return BUDGET_WORDS.get(value)
+
+
+def _unit_rows(block: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return np.divide(block, norms, out=np.zeros_like(block), where=norms > 0)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class Suggestion(NamedTuple):
+    destination: Destination
+    score: float
+    reasons: List[str]
+
+
+class SuggestionEngine:
+    """Top-k catalog destinations for a traveller's interests, budget, trip length and month"""
+
+    def __init__(self, catalog: DestinationCatalog):
+        self.version = catalog.version
+        self._destinations = catalog.all()
+        tags = sorted({normalize(tag) for destination in self._destinations for tag in destination.tags})
+        self._tag_columns = {tag: column for column, tag in enumerate(tags)}
+        n = len(self._destinations)
+
+        interests = np.zeros((n, len(tags)), dtype=np.float32)
+        budget = np.zeros((n, len(COST_BANDS)), dtype=np.float32)
+        season = np.zeros((n, 12), dtype=np.float32)
+        duration = np.zeros((n, len(DURATION_BUCKETS) + 1), dtype=np.float32)
+        self._months: List[Sequence[int]] = []
+        self._ideal_days: List[Tuple[int, int]] = []
+        for row, destination in enumerate(self._destinations):
+            interests[row, [self._tag_columns[normalize(tag)] for tag in destination.tags]] = 1.0
+            band = budget_band(str(destination.estimated_cost.get("budget", "")))
+            if band is not None:
+                budget[row, band] = 1.0
+            months = parse_months(destination.best_time_to_visit)
+            season[row, [month - 1 for month in months]] = 1.0
+            low, high = destination.ideal_days or DEFAULT_IDEAL_DAYS
+            duration[row, duration_bucket(low):duration_bucket(high) + 1] = 1.0
+            self._months.append(months)
+            self._ideal_days.append((low, high))
+
+        # Unit blocks side by side: a query of unit blocks scaled by their weights dots to the weighted cosines
+        self._blocks = {}
+        start = 0
+        for name, block in (("interests", interests), ("budget", budget), ("season", season), ("duration", duration)):
+            self._blocks[name] = slice(start, start + block.shape[1])
+            start += block.shape[1]
+        self._features = np.ascontiguousarray(np.hstack([
+            _unit_rows(interests), _unit_rows(budget), _unit_rows(season), _unit_rows(duration)
+        ]))
+        ratings = np.array([destination.rating for destination in self._destinations], dtype=np.float32)
+        self._prior = (1.0 - RATING_PRIOR) + RATING_PRIOR * np.clip(ratings, 0, 5) / 5
+
+    def __len__(self) -> int:
+        return len(self._destinations)
+
+    def interest_tags(self, interests: Iterable[str]) -> Dict[str, float]:
+        """Catalog tags the interests ask for, with their weights: the tag itself 1, related tags less"""
+        wanted: Dict[str, float] = {}
+        for interest in interests:
+            key = normalize(interest)
+            words = [key] if key in self._tag_columns else tokenize(interest)
+            for word in words:
+                if word in self._tag_columns:
+                    wanted[word] = 1.0
+                for tag in INTEREST_TAGS.get(word, []):
+                    if tag in self._tag_columns:
+                        wanted[tag] = max(wanted.get(tag, 0.0), SYNONYM_WEIGHT)
+        return wanted
+
+    def _query(
+        self,
+        interests: Iterable[str],
+        budget: str,
+        duration: int,
+        month: Optional[int] = None
+    ) -> Tuple[np.ndarray, Dict[str, float], Optional[int]]:
+        query = np.zeros(self._features.shape[1], dtype=np.float32)
+        blocks: Dict[str, np.ndarray] = {}
+        wanted = self.interest_tags(interests)
+        if wanted:
+            block = np.zeros(len(self._tag_columns), dtype=np.float32)
+            block[[self._tag_columns[tag] for tag in wanted]] = list(wanted.values())
+            blocks["interests"] = block
+        band = budget_band(budget)
+        if band is not None:
+            # A neighbouring band is still worth something: mid-range travellers may stretch or save
+            blocks["budget"] = np.array([1.0 if b == band else 0.3 if abs(b - band) == 1 else 0.0 for b in range(len(COST_BANDS))], dtype=np.float32)
+        if month is not None:
+            block = np.zeros(12, dtype=np.float32)
+            block[month - 1] = 1.0
+            block[month % 12] = block[(month - 2) % 12] = 0.3
+            blocks["season"] = block
+        block = np.zeros(len(DURATION_BUCKETS) + 1, dtype=np.float32)
+        bucket = duration_bucket(duration)
+        for neighbour in (bucket - 1, bucket + 1):
+            if 0 <= neighbour < len(block):
+                block[neighbour] = 0.25
+        block[bucket] = 1.0
+        blocks["duration"] = block
+
+        total = sum(BLOCK_WEIGHTS[name] for name in blocks)
+        for name, block in blocks.items():
+            query[self._blocks[name]] = _unit(block) * (BLOCK_WEIGHTS[name] / total)
+        return query, wanted, band
+
+    def suggest(
+        self,
+        interests: Iterable[str],
+        budget: str,
+        duration: int,
+        month: Optional[int] = None,
+        limit: int = 5
+    ) -> List[Suggestion]:
+        """The limit best destinations, best first, each with why it was picked"""
+        if not self._destinations:
+            return []
+        query, wanted, band = self._query(interests, budget, duration, month)
+        scores = (self._features @ query) * self._prior
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            Suggestion(self._destinations[row], round(float(scores[row]), 4), self._reasons(int(row), wanted, band, duration, month))
+            for row in top
+        ]
+
+    def _reasons(self, row: int, wanted: Dict[str, float], band: Optional[int], duration: int, month: Optional[int]) -> List[str]:
+        destination = self._destinations[row]
+        reasons = []
+        matched = sorted((tag.lower() for tag in destination.tags if normalize(tag) in wanted), key=lambda tag: -wanted[normalize(tag)])[:3]
+        if matched:
+            reasons.append("Great for " + (f"{', '.join(matched[:-1])} and {matched[-1]}" if len(matched) > 1 else matched[0]))
+        cost = self._features[row, self._blocks["budget"]]
+        if band is not None and cost[band] > 0:
+            reasons.append(f"Fits a {COST_BANDS[band]} budget")
+        if month is not None and month in self._months[row]:
+            reasons.append(f"{MONTHS[month - 1].capitalize()} is a good time to visit")
+        low, high = self._ideal_days[row]
+        if low <= duration <= high:
+            reasons.append(f"{duration} days suits a {low}-{high} day visit")
+        if destination.rating >= 4.5:
+            reasons.append(f"Rated {destination.rating:g} by travellers")
+        return reasons
+
+
+def suggestion_payload(suggestion: Suggestion) -> Dict[str, Any]:
+    destination = suggestion.destination
+    return {
+        "id": destination.id,
+        "name": destination.name,
+        "country": destination.country,
+        "thumbnail": destination.images.thumbnail,
+        "score": suggestion.score,
+        "reason": "; ".join(suggestion.reasons) or destination.description,
+        "reasons": suggestion.reasons
+    }
@@ -0,0 +1,246 @@
+"""
+Request tracing with an OpenTelemetry-compatible span model.
+
+Every request gets a root span from the tracing middleware; Gemini and Maps
+calls open child spans through start_span(). The current span lives in a
+context variable, which Starlette and the bulkheads copy into worker threads,
+so spans made on a pool thread still attach to the request that asked for them.
+
+Spans are exported as OTLP-shaped JSON (traceId, spanId, parentSpanId, times
+in unix nanoseconds, attributes, status) to the console or a JSONL file.
+Sampling is decided once per trace at the root, honouring an incoming W3C
+traceparent header; unsampled traces still get a trace id for the response
+header and logs, but record nothing.
+"""
+import contextvars
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = "INTERNAL"
+SPAN_KIND_SERVER = "SERVER"
+SPAN_KIND_CLIENT = "CLIENT"
+
+STATUS_UNSET = "UNSET"
+STATUS_OK = "OK"
+STATUS_ERROR = "ERROR"
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str] = None,
+        kind: str = SPAN_KIND_INTERNAL,
+        recording: bool = True,
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.recording = recording
+        self.attributes: Dict[str, Any] = dict(attributes or {}) if recording else {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.recording:
+            self.attributes[key] = value
+
+    def set_status(self, status: str, message: str = "") -> None:
+        self.status = status
+        self.status_message = message
+
+    def end(self) -> None:
+        self.end_time = time.time_ns()
+        if self.recording:
+            _tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "durationMs": round((self.end_time - self.start_time) / 1e6, 3) if self.end_time else None,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message}
+        }
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class ConsoleSpanExporter(SpanExporter):
+    """One JSON object per span on stderr"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            sys.stderr.write(line + "\n")
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans as JSON lines; flushed whenever a root span ends"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            if span.parent_span_id is None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_ratio: float = 1.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_ratio
+
+    def export(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning(f"Failed to export span {span.name}: {e}")
+
+    def close(self) -> None:
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+_tracer = Tracer()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def configure_tracing() -> Tracer:
+    """
+    Set up the process tracer from TRACING_EXPORTER (none, console or file),
+    TRACING_FILE and TRACING_SAMPLE_RATIO.
+    """
+    global _tracer
+    exporter_name = os.getenv("TRACING_EXPORTER", "none").strip().lower()
+    exporter: Optional[SpanExporter] = None
+    if exporter_name == "console":
+        exporter = ConsoleSpanExporter()
+    elif exporter_name == "file":
+        exporter = FileSpanExporter(os.getenv("TRACING_FILE", "traces.jsonl"))
+    elif exporter_name != "none":
+        raise ValueError(f"Unknown TRACING_EXPORTER '{exporter_name}', expected none, console or file")
+    _tracer.close()
+    _tracer = Tracer(exporter, sample_ratio=float(os.getenv("TRACING_SAMPLE_RATIO", "1.0")))
+    return _tracer
+
+
+def shutdown_tracing() -> None:
+    _tracer.close()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute on the current span, if there is one"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def start_root_span(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Span:
+    """Begin a trace for an incoming request (the caller must end it and reset the context)"""
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_span_id, sampled = parent
+        recording = sampled and _tracer.enabled
+    else:
+        trace_id, parent_span_id = secrets.token_hex(16), None
+        recording = _tracer.should_sample()
+    return Span(name, trace_id, parent_span_id, kind=SPAN_KIND_SERVER, recording=recording, attributes=attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: str = SPAN_KIND_INTERNAL, **attributes: Any):
+    """Open a child of the current span for the duration of the block"""
+    parent = _current_span.get()
+    if parent is None:
+        # Outside a request (background job, speculation): only trace if sampled here
+        span = Span(name, secrets.token_hex(16), kind=kind, recording=_tracer.should_sample(), attributes=attributes)
+    else:
+        span = Span(name, parent.trace_id, parent.span_id, kind=kind, recording=parent.recording, attributes=attributes)
+    reset = _current_span.set(span)
+    try:
+        yield span
+        if span.status == STATUS_UNSET:
+            span.set_status(STATUS_OK)
+    except BaseException as e:
+        span.set_status(STATUS_ERROR, f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(reset)
+        span.end()
+
+
+def bind_span(span: Span) -> contextvars.Token:
+    return _current_span.set(span)
+
+
+def reset_span(reset: contextvars.Token) -> None:
+    _current_span.reset(reset)
@@ -0,0 +1,24 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_environment() -> bool:
+    """Load the .env file into the process environment exactly once"""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+    return _env_loaded
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean environment variable such as WARM_UP_ON_START=false"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,105 @@
+"""
+Startup profiler for cold-start analysis.
+
+Enabled with `python main.py --profile-startup`. It records how long every
+module import takes (grouped by top-level package) and timestamps the startup
+phases up to the first moment the app is ready to serve, then prints a report.
+"""
+import builtins
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_original_import = builtins.__import__
+_enabled = False
+_started_at = time.perf_counter()
+_local = threading.local()
+_lock = threading.Lock()
+_imports: Dict[str, Tuple[float, float]] = {}  # module -> (inclusive, self) seconds
+_marks: List[Tuple[str, float]] = []
+_reported = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Relative and already-loaded imports are cheap, don't bother timing them
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with _lock:
+            _imports.setdefault(name, (elapsed, elapsed - children))
+
+
+def enable() -> None:
+    """Start timing imports; call before the application modules are imported"""
+    global _enabled, _started_at
+    if _enabled:
+        return
+    _enabled = True
+    _started_at = time.perf_counter()
+    builtins.__import__ = _timed_import
+    mark("profiler_enabled")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def mark(phase: str) -> None:
+    """Record the time at which a startup phase was reached"""
+    if not _enabled:
+        return
+    with _lock:
+        _marks.append((phase, time.perf_counter() - _started_at))
+
+
+def report(top: int = 15) -> str:
+    """Build the import-time breakdown and phase timeline as text"""
+    with _lock:
+        imports = dict(_imports)
+        marks = list(_marks)
+
+    by_package: Dict[str, float] = defaultdict(float)
+    for module, (_, self_time) in imports.items():
+        by_package[module.split(".")[0]] += self_time
+    total_import = sum(by_package.values())
+
+    lines = ["", "=== Startup profile ==="]
+    lines.append(f"Imports timed: {len(imports)} modules, {total_import * 1000:.1f} ms total")
+    lines.append("")
+    lines.append("Top packages by import time (self time, ms):")
+    for package, seconds in sorted(by_package.items(), key=lambda x: x[1], reverse=True)[:top]:
+        lines.append(f"  {package:<48} {seconds * 1000:9.1f}")
+    lines.append("")
+    lines.append("Slowest individual imports (inclusive, ms):")
+    for module, (inclusive, _) in sorted(imports.items(), key=lambda x: x[1][0], reverse=True)[:top]:
+        lines.append(f"  {module:<48} {inclusive * 1000:9.1f}")
+    lines.append("")
+    lines.append("Startup phases (ms since profiler enabled):")
+    for phase, offset in marks:
+        lines.append(f"  {phase:<48} {offset * 1000:9.1f}")
+    return "\n".join(lines)
+
+
+def report_ready() -> None:
+    """Mark the app as ready and print the report once"""
+    global _reported
+    if not _enabled or _reported:
+        return
+    _reported = True
+    mark("ready")
+    builtins.__import__ = _original_import
+    print(report(), flush=True)
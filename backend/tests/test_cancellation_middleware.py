@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+from middleware.cancellation import MAX_BUFFERED_BODY_BYTES, CancelOnDisconnectMiddleware
+from services.cancellation import RequestCancelled
+from services.metrics import CANCELLED_REQUESTS
+
+
+def run(app, chunks, headers=()):
+    scope = {"type": "http", "method": "POST", "path": "/jobs/123", "headers": list(headers)}
+    messages = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1} for index, chunk in enumerate(chunks)]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CancelOnDisconnectMiddleware(app)(scope, receive, send))
+    return scope, sent
+
+
+def body_reader(bodies):
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        bodies.append(body)
+    return app
+
+
+def test_small_and_large_bodies_reach_the_app_whole():
+    for chunks in ([b"{}"], [b"x" * MAX_BUFFERED_BODY_BYTES, b"y" * 10, b"z"]):
+        bodies = []
+        run(body_reader(bodies), chunks)
+        assert bodies == [b"".join(chunks)]
+
+
+def test_declared_large_body_is_not_buffered():
+    bodies = []
+    length = str(MAX_BUFFERED_BODY_BYTES + 1).encode()
+    run(body_reader(bodies), [b"a" * (MAX_BUFFERED_BODY_BYTES + 1)], headers=[(b"content-length", length)])
+    assert len(bodies[0]) == MAX_BUFFERED_BODY_BYTES + 1
+
+
+def test_cancellations_are_counted_by_route_template():
+    async def app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/jobs/{job_id}")
+        raise RequestCancelled("client disconnected")
+
+    before = CANCELLED_REQUESTS.value(route="/jobs/{job_id}")
+    scope, sent = run(app, [b""])
+    assert CANCELLED_REQUESTS.value(route="/jobs/{job_id}") == before + 1
+    assert sent[0]["status"] == 499
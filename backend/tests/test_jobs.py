@@ -0,0 +1,66 @@
+import threading
+import pytest
+from services.cancellation import check_cancelled
+from services.jobs import CANCELLED, RUNNING, JobQueue
+from services.state_store import MemoryStateStore, SQLiteStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryStateStore() if request.param == "memory" else SQLiteStateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def test_compare_and_set_only_replaces_what_was_read(store):
+    store.set("jobs", "a", {"status": "queued"})
+    read = store.get("jobs", "a")
+    assert store.compare_and_set("jobs", "a", read, {"status": "running"})
+    assert not store.compare_and_set("jobs", "a", read, {"status": "cancelled"})
+    assert store.get("jobs", "a") == {"status": "running"}
+    assert not store.compare_and_set("jobs", "missing", read, {"status": "running"})
+
+
+def test_a_cancel_between_reading_and_starting_wins(store):
+    jobs = JobQueue(store, workers=0)
+    calls = []
+    job = jobs.submit("test", lambda: calls.append("ran"))
+    read = store.get
+
+    def get_then_cancel(namespace, key):
+        value = read(namespace, key)
+        if value is not None and value["status"] != CANCELLED:
+            # Lands after the worker read QUEUED, before it writes RUNNING
+            store.get = read
+            jobs.cancel(key)
+        return value
+
+    store.get = get_then_cancel
+    jobs.close()
+    jobs._work()
+    assert calls == []
+    assert jobs.get(job["job_id"])["status"] == CANCELLED
+
+
+def test_cancel_stops_a_running_job_at_its_next_upstream_call(store):
+    jobs = JobQueue(store, workers=1)
+    running, cancelled, stopped = threading.Event(), threading.Event(), threading.Event()
+
+    def generate():
+        running.set()
+        cancelled.wait(2)
+        try:
+            check_cancelled("gemini")
+        except BaseException:
+            stopped.set()
+            raise
+        return {"days": []}
+
+    job = jobs.submit("test", generate)
+    assert running.wait(2)
+    assert jobs.get(job["job_id"])["status"] == RUNNING
+    assert jobs.cancel(job["job_id"])["status"] == CANCELLED
+    cancelled.set()
+    assert stopped.wait(2)
+    jobs.close()
+    assert jobs.get(job["job_id"])["status"] == CANCELLED
@@ -0,0 +1,47 @@
+import time
+from datetime import datetime
+from models import PlanningSession, PlanningStep
+from services.session_store import SQLiteSessionStore
+
+
+def session(session_id: str = "session") -> PlanningSession:
+    now = datetime.now()
+    return PlanningSession(
+        id=session_id,
+        current_step=1,
+        steps=[PlanningStep(step=1, title="Basic Details", completed=False, data=None)],
+        created_at=now,
+        updated_at=now
+    )
+
+
+def test_sqlite_reads_slide_the_ttl(tmp_path, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl_seconds=600, flush_interval=0)
+    store.create(session())
+
+    # Read every 5 minutes for an hour, far past the 10 minute TTL
+    for _ in range(12):
+        clock[0] += 300
+        assert store.get("session") is not None
+
+    # Left alone, it expires
+    clock[0] += 601
+    assert store.get("session") is None
+    store.close()
+
+
+def test_sqlite_recent_reads_do_not_rewrite(tmp_path, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl_seconds=600, flush_interval=60)
+    store.create(session())
+    store.flush()
+    clock[0] += 10
+    store.get("session")
+    assert store.flush() == 0
+    clock[0] += 120
+    store.get("session")
+    assert store.flush() == 1
+    store.close()
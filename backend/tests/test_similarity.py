@@ -0,0 +1,100 @@
+from models import TripRequest
+from services.similarity import SimilarTripIndex, adapt_itinerary, trip_profile
+
+PARIS = "catalog:paris-france"
+
+
+def trip(**fields) -> TripRequest:
+    base = {
+        "source": "New York, USA",
+        "destination": "Paris",
+        "budget": "mid-range",
+        "duration_days": 5,
+        "interests": ["food", "culture"],
+        "constraints": "No early mornings please",
+        "travel_style": "relaxed",
+        "travelers": "couple",
+        "numberOfPeople": 2
+    }
+    return TripRequest(**{**base, **fields})
+
+
+def itinerary(days: int) -> dict:
+    return {
+        "days": [
+            {"day": day, "date": f"Day {day}", "title": f"Day {day}", "items": [{"title": f"Stop {day}"}]}
+            for day in range(1, days + 1)
+        ],
+        "travel_tips": ["Book ahead"],
+        "total_estimated_cost": "$1,000-1500 for two"
+    }
+
+
+def indexed(*trips: TripRequest) -> SimilarTripIndex:
+    index = SimilarTripIndex()
+    for number, cached in enumerate(trips):
+        index.add(cached, PARIS, f"trip-{number}")
+    return index
+
+
+def test_profile_ignores_spelling_but_not_origin_or_party_size():
+    assert trip_profile(trip(budget="Mid-Range "), PARIS) == trip_profile(trip(), PARIS)
+    assert trip_profile(trip(source="Sydney, Australia"), PARIS) != trip_profile(trip(), PARIS)
+    assert trip_profile(trip(numberOfPeople=12, travelers="group"), PARIS) != trip_profile(trip(), PARIS)
+    assert trip_profile(trip(numberOfPeople=12), PARIS) != trip_profile(trip(), PARIS)
+
+
+def test_reordered_interests_and_reworded_constraints_reuse():
+    index = indexed(trip())
+    matches = index.find(trip(interests=["Culture", "food", "sightseeing"], constraints="no early mornings"), PARIS)
+    assert [match.cache_key for match in matches] == ["trip-0"]
+    assert 0.85 <= matches[0].score < 1
+
+
+def test_other_origin_party_size_or_interests_do_not_reuse():
+    index = indexed(trip())
+    assert index.find(trip(source="Sydney, Australia", numberOfPeople=12), PARIS) == []
+    assert index.find(trip(interests=["nightlife", "shopping"]), PARIS) == []
+    assert index.find(trip(constraints="No seafood"), PARIS) == []
+    assert index.find(trip(), "catalog:tokyo-japan") == []
+
+
+def test_only_longer_trips_within_the_trim_limit_are_found():
+    index = indexed(trip(duration_days=5))
+    assert index.find(trip(duration_days=4), PARIS)
+    assert index.find(trip(duration_days=3), PARIS)
+    assert index.find(trip(duration_days=2), PARIS) == []
+    assert index.find(trip(duration_days=6), PARIS) == []
+
+
+def test_the_requested_length_beats_a_trimmed_one():
+    index = indexed(trip(duration_days=5), trip(duration_days=4))
+    assert [match.cache_key for match in index.find(trip(duration_days=4), PARIS)] == ["trip-1", "trip-0"]
+
+
+def test_discard_and_threshold_above_one():
+    index = indexed(trip())
+    index.discard(trip(), PARIS, "trip-0")
+    assert index.find(trip(), PARIS) == []
+    disabled = SimilarTripIndex(threshold=1.01)
+    disabled.add(trip(), PARIS, "trip-0")
+    assert disabled.find(trip(), PARIS) == []
+
+
+def test_adapt_trims_redates_and_scales_the_total():
+    cached = itinerary(5)
+    adapted = adapt_itinerary(cached, trip(duration_days=4, start_date="2026-11-30"))
+    assert [day["day"] for day in adapted["days"]] == [1, 2, 3, 4]
+    assert [day["date"] for day in adapted["days"]] == ["2026-11-30", "2026-12-01", "2026-12-02", "2026-12-03"]
+    assert adapted["total_estimated_cost"] == "$800-1200 for two"
+    assert adapted["travel_tips"] == ["Book ahead"]
+    # The cached itinerary is shared; the copy must not write through to it
+    adapted["days"][0]["items"][0]["title"] = "Changed"
+    assert cached["days"][0]["items"][0]["title"] == "Stop 1"
+    assert len(cached["days"]) == 5
+
+
+def test_adapt_same_length_keeps_the_total_and_numbers_days_without_a_start_date():
+    adapted = adapt_itinerary(itinerary(3), trip(duration_days=3, start_date="flexible"))
+    assert [day["date"] for day in adapted["days"]] == ["Day 1", "Day 2", "Day 3"]
+    assert adapted["total_estimated_cost"] == "$1,000-1500 for two"
@@ -0,0 +1,152 @@
+import threading
+import time
+from models import TripRequest
+import pytest
+from services.cancellation import CancellationToken, RequestCancelled, bind_token, check_cancelled, reset_token
+from services.gemini_service import GeminiService
+from services.resolver import DestinationResolver
+from services.speculation import SpeculativeGenerator, trip_fingerprint
+
+
+def trip(destination: str = "Lisbon") -> TripRequest:
+    return TripRequest(
+        destination=destination,
+        budget="mid-range",
+        duration_days=3,
+        interests=["food"],
+        travel_style="relaxed",
+        travelers="couple"
+    )
+
+
+def wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_adopts_a_finished_speculation():
+    generator = SpeculativeGenerator(lambda request: {"destination": request.destination}, debounce_seconds=0)
+    generator.propose("session", trip())
+    wait_for(lambda: generator.started == 1)
+    assert generator.is_current("session", trip())
+    assert generator.adopt("session", trip(), timeout=2) == {"destination": "Lisbon"}
+    generator.close()
+
+
+def test_does_not_wait_for_a_speculation_still_debouncing():
+    generator = SpeculativeGenerator(lambda request: {}, debounce_seconds=60)
+    generator.propose("session", trip())
+    assert generator.adopt("session", trip(), timeout=2) is None
+    assert generator.started == 0
+    generator.close()
+
+
+def test_cancels_a_speculation_queued_behind_others():
+    release = threading.Event()
+    calls = []
+
+    def generate(request: TripRequest):
+        calls.append(request.destination)
+        release.wait(2)
+        return {}
+
+    generator = SpeculativeGenerator(generate, max_workers=1, debounce_seconds=0)
+    generator.propose("busy", trip("Porto"))
+    wait_for(lambda: calls == ["Porto"])
+    generator.propose("session", trip())
+    wait_for(lambda: generator.started == 2)
+    assert generator.adopt("session", trip(), timeout=2) is None
+    release.set()
+    generator.close()
+    assert calls == ["Porto"]
+
+
+def test_keeps_waiting_for_a_running_speculation():
+    calls = []
+
+    def generate(request: TripRequest):
+        calls.append(request.destination)
+        time.sleep(0.6)
+        return {"destination": request.destination}
+
+    generator = SpeculativeGenerator(generate, debounce_seconds=0)
+    generator.propose("session", trip())
+    wait_for(lambda: generator.started == 1)
+    assert generator.adopt("session", trip(), timeout=5) == {"destination": "Lisbon"}
+    assert calls == ["Lisbon"]
+    generator.close()
+
+
+def test_a_disconnected_caller_leaves_the_speculation_for_the_next_attempt():
+    release = threading.Event()
+    generator = SpeculativeGenerator(lambda request: release.wait(2) and {"destination": request.destination}, debounce_seconds=0)
+    generator.propose("session", trip())
+    wait_for(lambda: generator.started == 1)
+    token = CancellationToken()
+    token.cancel()
+    reset = bind_token(token)
+    try:
+        with pytest.raises(RequestCancelled):
+            generator.adopt("session", trip(), timeout=5)
+    finally:
+        reset_token(reset)
+    release.set()
+    assert generator.adopt("session", trip(), timeout=2) == {"destination": "Lisbon"}
+    generator.close()
+
+
+def test_cancels_a_running_speculation_after_the_timeout():
+    release = threading.Event()
+    stopped = threading.Event()
+
+    def generate(request: TripRequest):
+        release.wait(2)
+        try:
+            check_cancelled("gemini")
+        except BaseException:
+            stopped.set()
+            raise
+        return {}
+
+    generator = SpeculativeGenerator(generate, debounce_seconds=0)
+    generator.propose("session", trip())
+    wait_for(lambda: generator.started == 1)
+    assert generator.adopt("session", trip(), timeout=0.05) is None
+    release.set()
+    assert stopped.wait(2)
+    generator.close()
+
+
+class PlaceSearch:
+    """Maps as far as the resolver needs it: every search finds one place"""
+
+    def __init__(self):
+        self.searches = 0
+
+    def is_healthy(self) -> bool:
+        return True
+
+    def search_places(self, query: str) -> dict:
+        self.searches += 1
+        return {"results": [{"place_id": "hanoi-place", "address": "Hanoi, Vietnam"}]}
+
+
+def test_adopts_a_speculation_proposed_before_the_destination_was_learned():
+    maps = PlaceSearch()
+    gemini = GeminiService(resolver=DestinationResolver(maps=maps))
+
+    def generate(request: TripRequest):
+        # Generating looks the destination up, which is where it is learned
+        destination_key = gemini.resolver.lookup(request.destination).key
+        gemini.itinerary_cache.set(trip_fingerprint(request, destination_key), {"destination": request.destination})
+        return {"destination": request.destination}
+
+    generator = SpeculativeGenerator(generate, debounce_seconds=0, fingerprint=gemini.trip_key)
+    generator.propose("session", trip("Hanoi"))
+    wait_for(lambda: generator.started == 1)
+    assert generator.adopt("session", trip("hanoi "), timeout=2) == {"destination": "Hanoi"}
+    assert gemini.degraded_itinerary(trip("Hanoi")) == ({"destination": "Hanoi"}, "cache")
+    assert maps.searches == 1
+    generator.close()